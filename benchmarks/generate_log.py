@@ -0,0 +1,84 @@
+import os
+import sys
+import csv
+import random
+import argparse
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from worklogqt import CATEGORIES, LOG_HEADER, TIME_FORMAT
+
+# 其他 类别的自由文本素材，包含逗号、引号和换行，用来覆盖 CSV 转义的情况
+OTHER_SUBJECTS = ["会议室", "财务部", "仓库", "前台", "生产线", "研发楼", "食堂", "机房"]
+OTHER_ACTIONS = [
+    "打印机卡纸处理", "投影仪无信号", "网线松动重新压线", "更换键盘鼠标",
+    "协助安装插件", "排查无线网络掉线", "UPS 电池告警", "门禁卡无法识别",
+]
+OTHER_NOTES = ["", "", "", "，已恢复", "，等待备件", "，\"临时\"方案", "\n下周复查", "，联系厂商"]
+
+
+def category_weights(rng):
+    # 类别使用频率大致呈长尾分布
+    weights = [1.0 / (i + 1) for i in range(len(CATEGORIES))]
+    rng.shuffle(weights)
+    return weights
+
+
+def other_content(rng):
+    return rng.choice(OTHER_SUBJECTS) + rng.choice(OTHER_ACTIONS) + rng.choice(OTHER_NOTES)
+
+
+def generate_rows(rows, years=3, seed=0, other_ratio=0.05, end=None):
+    # 按时间顺序生成记录：只在工作日 8:00-18:00 之间，每天条数随机波动
+    rng = random.Random(seed)
+    end = end or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=int(365 * years))
+    days = [start + timedelta(days=i) for i in range((end - start).days) if (start + timedelta(days=i)).weekday() < 5]
+    weights = category_weights(rng)
+    others = [c for c in CATEGORIES if c != "其他"]
+    other_weights = [w for c, w in zip(CATEGORIES, weights) if c != "其他"]
+
+    per_day = rows / len(days)
+    produced = 0
+    for index, day in enumerate(days):
+        remaining_days = len(days) - index
+        if remaining_days == 1:
+            count = rows - produced
+        else:
+            count = max(0, min(rows - produced, int(rng.gauss(per_day, per_day * 0.3) + 0.5)))
+        seconds = sorted(rng.randrange(8 * 3600, 18 * 3600) for _ in range(count))
+        categories = rng.choices(others, other_weights, k=count)
+        for second, category in zip(seconds, categories):
+            time = (day + timedelta(seconds=second)).strftime(TIME_FORMAT)
+            if rng.random() < other_ratio:
+                yield [time, "其他", other_content(rng)]
+            else:
+                yield [time, category, ""]
+        produced += count
+        if produced >= rows:
+            break
+
+
+def generate_log(path, rows, years=3, seed=0, other_ratio=0.05):
+    with open(path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(LOG_HEADER)
+        writer.writerows(generate_rows(rows, years, seed, other_ratio))
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成模拟的 worklog.csv")
+    parser.add_argument("output", help="输出文件路径")
+    parser.add_argument("--rows", type=int, default=100000, help="记录条数 (默认 100000)")
+    parser.add_argument("--years", type=float, default=3, help="覆盖的年数 (默认 3)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--other-ratio", type=float, default=0.05, help="其他 类别自由文本的比例")
+    args = parser.parse_args()
+    generate_log(args.output, args.rows, args.years, args.seed, args.other_ratio)
+    print(f"已生成 {args.rows} 条记录: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
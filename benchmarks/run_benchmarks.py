@@ -0,0 +1,214 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime
+
+# 无界面运行：必须在导入 PySide6 之前设置，并把 HOME 指向临时目录，
+# 这样 ~/Documents/WorkLog 不会碰到真实数据（QSettings 在下面单独处理）
+BENCH_HOME = tempfile.mkdtemp(prefix="worklog-bench-")
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ["HOME"] = BENCH_HOME
+os.environ["XDG_CONFIG_HOME"] = os.path.join(BENCH_HOME, ".config")
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from PySide6.QtWidgets import QApplication, QFileDialog
+from PySide6.QtCore import QDate, QSettings
+
+import worklogqt
+from worklogqt import WorkLogRecorder, MobileServerThread, ExportWorker, TIME_FORMAT
+from generate_log import generate_log
+
+# macOS 的原生设置（plist）和 Windows 注册表不看 HOME：改成 INI 格式并放到临时目录
+QSettings.setDefaultFormat(QSettings.IniFormat)
+QSettings.setPath(QSettings.IniFormat, QSettings.UserScope, BENCH_HOME)
+
+
+def summarize(name, samples, **extra):
+    samples = sorted(samples)
+    n = len(samples)
+    result = {
+        "op": name,
+        "n": n,
+        "mean_ms": round(sum(samples) / n * 1000, 3),
+        "p50_ms": round(samples[n // 2] * 1000, 3),
+        "p95_ms": round(samples[min(n - 1, int(n * 0.95))] * 1000, 3),
+        "max_ms": round(samples[-1] * 1000, 3),
+    }
+    result.update(extra)
+    return result
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def wait_for_stats(app, window, timeout=600):
+    deadline = time.monotonic() + timeout
+    while window.stats_task is not None and time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.001)
+
+
+def bench_size(app, rows, backend, repeat, log_dir):
+    results = []
+    extra = {"rows": rows, "backend": backend}
+
+    shutil.rmtree(log_dir, ignore_errors=True)
+    os.makedirs(log_dir)
+    start = time.perf_counter()
+    generate_log(os.path.join(log_dir, "worklog.csv"), rows)
+    results.append(summarize("generate_log", [time.perf_counter() - start], **extra))
+
+    worklogqt.app_settings().setValue("storage_backend", backend)
+    start = time.perf_counter()
+    window = WorkLogRecorder()
+    results.append(summarize("startup", [time.perf_counter() - start], **extra))
+    results.append({"op": "log_size", "bytes": sum(os.path.getsize(os.path.join(log_dir, name))
+                                                   for name in os.listdir(log_dir)), **extra})
+
+    # 手机端写入和撤销
+    server = MobileServerThread(window.writer, window.categories, "bench")
+    results.append(summarize("mobile_save_log", timed(lambda: server.save_log("打印机维护", ""), repeat), **extra))
+
+    client = server.app.test_client()
+    client.post("/login", data={"name": "bench", "password": "bench"})
+
+    def mobile_undo():
+        window.writer.append(datetime.now().strftime(TIME_FORMAT), "打印机维护", "")
+        start = time.perf_counter()
+        client.post("/undo", headers={"Accept": "application/json"})
+        return time.perf_counter() - start
+    results.append(summarize("mobile_undo", [mobile_undo() for _ in range(repeat)], **extra))
+
+    # 桌面端写入和撤销
+    results.append(summarize("desktop_save_log_entry", timed(
+        lambda: window.save_log_entry(datetime.now().strftime(TIME_FORMAT), "网络设备维护", ""), repeat), **extra))
+
+    def desktop_undo():
+        window.writer.append(datetime.now().strftime(TIME_FORMAT), "网络设备维护", "")
+        start = time.perf_counter()
+        window.undo_last_log()
+        return time.perf_counter() - start
+    results.append(summarize("desktop_undo_last_log", [desktop_undo() for _ in range(repeat)], **extra))
+
+    # 统计：最近一年和全部历史
+    for label, days in (("generate_stats_1y", 365), ("generate_stats_all", 365 * 20)):
+        window.stats_start_date.setDate(QDate.currentDate().addDays(-days))
+        window.stats_end_date.setDate(QDate.currentDate())
+
+        def run_stats():
+            # 清空统计缓存，测的是计算本身；命中缓存的情况在下面单独测
+            window.writer.stats.entries.clear()
+            window.generate_stats()
+            wait_for_stats(app, window)
+        results.append(summarize(label, timed(run_stats, max(1, repeat // 10)), **extra))
+
+    def run_cached_stats():
+        window.generate_stats()
+        wait_for_stats(app, window)
+    results.append(summarize("generate_stats_cached", timed(run_cached_stats, max(1, repeat // 10)), **extra))
+
+    stats_client = server.app.test_client()
+    stats_client.post("/login", data={"name": "bench", "password": "bench"})
+    stats_client.get("/api/stats?start=2000-01-01")
+    results.append(summarize("mobile_api_stats_cached", timed(
+        lambda: stats_client.get("/api/stats?start=2000-01-01"), repeat), **extra))
+
+    excel_path = os.path.join(BENCH_HOME, "stats.xlsx")
+    QFileDialog.getSaveFileName = staticmethod(lambda *args, **kwargs: (excel_path, ""))
+    results.append(summarize("export_stats_excel", timed(window.export_stats_excel, max(1, repeat // 10)), **extra))
+
+    for ext in ("csv", "xlsx"):
+        worker = ExportWorker(window.storage, os.path.join(BENCH_HOME, f"raw.{ext}"), None, None)
+        results.append(summarize(f"export_raw_{ext}", timed(worker.run, 1), **extra))
+
+    window.close()
+    window.deleteLater()
+    app.processEvents()
+    return results
+
+
+def git_version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    old = {(r["op"], r["rows"], r["backend"]): r for r in baseline["results"] if "mean_ms" in r}
+    print(f"\n对比 {baseline_path} ({baseline.get('version')})")
+    for r in results:
+        key = (r["op"], r["rows"], r["backend"])
+        if "mean_ms" in r and key in old and old[key]["mean_ms"] > 0:
+            ratio = r["mean_ms"] / old[key]["mean_ms"]
+            flag = "  <-- 变慢" if ratio > 1.2 else ""
+            print(f"{r['op']:<26}{r['rows']:>10} {r['backend']:<12}"
+                  f"{old[key]['mean_ms']:>10.2f} -> {r['mean_ms']:>10.2f} ms  x{ratio:.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="工作日志性能基准测试 (无界面)")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000],
+                        help="模拟日志的记录条数，可以给多个 (默认 10000 100000)")
+    parser.add_argument("--backend", nargs="+", default=["csv"], choices=sorted(worklogqt.STORAGE_BACKENDS))
+    parser.add_argument("--repeat", type=int, default=50, help="写入/撤销的重复次数")
+    parser.add_argument("--output", help="结果 JSON 文件 (默认 benchmarks/results/<时间>.json)")
+    parser.add_argument("--compare", help="与之前的结果 JSON 对比")
+    args = parser.parse_args()
+
+    # 基准测试不需要弹窗确认
+    worklogqt.CustomMessageBox.exec = lambda self: 0
+
+    app = QApplication(sys.argv)
+    log_dir = os.path.join(BENCH_HOME, "Documents", "WorkLog")
+    results = []
+    try:
+        for rows in args.rows:
+            for backend in args.backend:
+                print(f"运行: {rows} 条, {backend}")
+                results.extend(bench_size(app, rows, backend, args.repeat, log_dir))
+    finally:
+        shutil.rmtree(BENCH_HOME, ignore_errors=True)
+
+    report = {
+        "version": git_version(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    output = args.output or os.path.join(ROOT, "benchmarks", "results",
+                                         datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for r in results:
+        if "mean_ms" in r:
+            print(f"{r['op']:<26}{r['rows']:>10} {r['backend']:<12}"
+                  f"mean {r['mean_ms']:>10.2f} ms  p95 {r['p95_ms']:>10.2f} ms")
+    print(f"结果已保存: {output}")
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
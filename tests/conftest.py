@@ -0,0 +1,42 @@
+import os
+import sys
+import csv
+import io
+
+# 测试不需要显示界面，也不能碰到真实的 ~/Documents/WorkLog
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from worklogqt import LOG_HEADER
+
+# 随机内容里特意混入逗号、引号、换行和中文，覆盖 CSV 转义的各种情况
+PIECES = ["", "a", "打印机", ",", '"', '""', "\n", "\r\n", " ", "卡纸,", '"临时"', "x\ny", "，"]
+
+
+def random_field(rng, max_pieces=4):
+    return "".join(rng.choice(PIECES) for _ in range(rng.randrange(max_pieces + 1)))
+
+
+def random_rows(rng, count):
+    rows = []
+    for _ in range(count):
+        day = f"20{rng.randrange(10, 30)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}"
+        time = f"{day} {rng.randrange(24):02d}:{rng.randrange(60):02d}:{rng.randrange(60):02d}"
+        rows.append([time, random_field(rng) or "其他", random_field(rng)])
+    return rows
+
+
+def encode_log(rows):
+    # 与程序写入的格式相同：带 BOM 的表头，csv 默认的 \r\n 行尾。返回 (文件内容, 表头长度, 各记录起点)
+    def line(row):
+        buf = io.StringIO()
+        csv.writer(buf).writerow(row)
+        return buf.getvalue().encode('utf-8')
+
+    data = b'\xef\xbb\xbf' + line(LOG_HEADER)
+    begin = len(data)
+    offsets = []
+    for row in rows:
+        offsets.append(len(data))
+        data += line(row)
+    return data, begin, offsets
@@ -0,0 +1,73 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from worklogqt import CsvLogStorage, LogChangedError, TIME_FORMAT
+
+
+def fill(storage, count):
+    # 最后几条是刚才的时间，可以撤销
+    now = datetime.now()
+    rows = [[(now - timedelta(seconds=count - i)).strftime(TIME_FORMAT), "打印机维护", f"记录{i}，\"引号\""]
+            for i in range(count)]
+    storage.append_many(rows)
+    return rows
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = CsvLogStorage(str(tmp_path / "worklog.csv"))
+    storage.ensure_created()
+    yield storage
+    storage.close()
+
+
+def test_iter_rows_ignores_appends(storage):
+    rows = fill(storage, 3000)
+    reader = storage.iter_rows()
+    first = [next(reader) for _ in range(10)]
+    storage.append(datetime.now().strftime(TIME_FORMAT), "网络设备维护", "")
+    assert first + list(reader) == rows
+
+
+def test_iter_rows_detects_undo_then_append(storage):
+    # 导出进行中撤销最后一条又追加一条更长的：快照末尾被改写，应当报错而不是解码失败或输出半条记录
+    fill(storage, 3000)
+    reader = storage.iter_rows()
+    next(reader)
+    storage.undo_last()
+    storage.append(datetime.now().strftime(TIME_FORMAT), "其他", "多字节内容" * 40)
+    with pytest.raises(LogChangedError):
+        list(reader)
+
+
+def test_iter_rows_detects_undo(storage):
+    fill(storage, 3000)
+    reader = storage.iter_rows()
+    next(reader)
+    storage.undo_last()
+    with pytest.raises(LogChangedError):
+        list(reader)
+
+
+def test_undo_with_corrupt_tail(storage):
+    # 最后一条记录里有损坏的字节：撤销照常截掉这条记录，不抛出 UnicodeDecodeError
+    rows = fill(storage, 3)
+    now = datetime.now().strftime(TIME_FORMAT)
+    storage.append(now, "其他", "内容损坏")
+    with open(storage.path, 'r+b') as f:
+        f.seek(-4, 2)
+        f.write(b'\xff')
+    assert storage.undo_last() == [now, "其他", "内容损\ufffd\ufffd\ufffd"]
+    assert list(storage.iter_rows()) == rows
+
+
+def test_iter_rows_detects_removed_file(storage):
+    # 导出期间分区被压缩归档、原文件删除：报告日志有变化，而不是 FileNotFoundError
+    fill(storage, 3000)
+    reader = storage.iter_rows()
+    next(reader)
+    os.remove(storage.path)
+    with pytest.raises(LogChangedError):
+        list(reader)
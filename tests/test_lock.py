@@ -0,0 +1,84 @@
+import threading
+import time
+
+import pytest
+
+from worklogqt import LogLock, fcntl
+
+
+@pytest.fixture
+def lock(tmp_path):
+    lock = LogLock(str(tmp_path / "worklog.lock"))
+    yield lock
+    lock.close()
+
+
+def hold(mode, entered, release):
+    # 在另一个线程里拿锁，拿到后置位 entered，等 release 再放开
+    def run():
+        with mode():
+            entered.set()
+            release.wait(10)
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_readers_share_the_lock(lock):
+    release = threading.Event()
+    entered = [threading.Event() for _ in range(3)]
+    threads = [hold(lock.read, event, release) for event in entered]
+    assert all(event.wait(5) for event in entered)
+    owners, waiting = lock.owners()
+    assert sorted(mode for mode, _ in owners) == ["read"] * 3 and waiting == 0
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert lock.owners() == ([], 0)
+
+
+def test_writer_waits_for_readers_and_blocks_new_readers(lock):
+    release_reader, release_writer = threading.Event(), threading.Event()
+    reader_in, writer_in, late_reader_in = threading.Event(), threading.Event(), threading.Event()
+    reader = hold(lock.read, reader_in, release_reader)
+    assert reader_in.wait(5)
+    writer = hold(lock.write, writer_in, release_writer)
+    while lock.owners()[1] == 0:
+        time.sleep(0.01)
+    # 写者优先：有写者在等时，新来的读者也要排队，写者不会被源源不断的读者饿死
+    late_reader = hold(lock.read, late_reader_in, release_writer)
+    assert not writer_in.wait(0.2) and not late_reader_in.is_set()
+    release_reader.set()
+    assert writer_in.wait(5)
+    assert not late_reader_in.wait(0.2)
+    assert [mode for mode, _ in lock.owners()[0]] == ["write"]
+    release_writer.set()
+    assert late_reader_in.wait(5)
+    for thread in (reader, writer, late_reader):
+        thread.join(5)
+
+
+@pytest.mark.skipif(fcntl is None, reason="没有 fcntl 的平台不加进程间锁")
+def test_other_process_is_excluded(lock):
+    # 另一个 LogLock 用自己的文件句柄加 flock，相当于另一个程序副本
+    other = LogLock(lock.path)
+    release = threading.Event()
+    entered = threading.Event()
+    try:
+        with lock.write():
+            thread = hold(other.read, entered, release)
+            assert not entered.wait(0.3)
+        assert entered.wait(5)
+        # 对方持有共享锁时，本进程的读者可以进来，写者要等
+        with lock.read():
+            pass
+        writer_in = threading.Event()
+        writer = hold(lock.write, writer_in, release)
+        assert not writer_in.wait(0.3)
+        release.set()
+        assert writer_in.wait(5)
+        thread.join(5)
+        writer.join(5)
+    finally:
+        release.set()
+        other.close()
@@ -0,0 +1,67 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+from PySide6.QtCore import Qt
+
+from conftest import random_rows
+from worklogqt import TIME_FORMAT, LogTableModel, RowIndex, build_view, open_storage
+
+
+@pytest.fixture(params=["csv", "partitioned", "sqlite"])
+def storage(request, tmp_path):
+    storage = open_storage(str(tmp_path), request.param)
+    storage.ensure_created()
+    yield storage
+    storage.close()
+
+
+def model_rows(model):
+    # 原样读出模型里的每一行（提示文字不替换换行）
+    return [[model.data(model.index(r, c), Qt.ItemDataRole.ToolTipRole) for c in range(model.columnCount())]
+            for r in range(model.rowCount())]
+
+
+def test_view_filters_and_sorts(storage):
+    rng = random.Random(11)
+    rows = random_rows(rng, 1000)
+    storage.append_many(rows)
+    index = RowIndex()
+    assert storage.update_index(index)
+    model = LogTableModel(storage)
+    model.PAGE_SIZE, model.MAX_PAGES = 64, 3
+
+    model.set_rows(index, build_view(index))
+    shown = model_rows(model)
+    assert sorted(shown) == sorted(rows)
+    assert [row[0] for row in shown] == sorted((row[0] for row in rows), reverse=True)
+    assert len(model.pages) == 3
+
+    category = rows[0][1]
+    model.set_rows(index, build_view(index, category, column=1, descending=False))
+    shown = model_rows(model)
+    assert sorted(shown) == sorted(row for row in rows if row[1] == category)
+    assert [row[0] for row in shown] == sorted(row[0] for row in shown)
+    assert build_view(index, "没有这个类别") == range(0)
+
+    model.set_rows(index, build_view(index, column=1))
+    keys = [(row[1], row[0]) for row in model_rows(model)]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_index_follows_appends_and_undo(storage):
+    rows = random_rows(random.Random(12), 300)
+    storage.append_many(rows)
+    index = RowIndex()
+    storage.update_index(index)
+    assert not storage.update_index(index)
+    recent = [(datetime.now() - timedelta(seconds=5)).strftime(TIME_FORMAT), "其他", "刚记的"]
+    storage.append(*recent)
+    assert storage.update_index(index)
+    assert len(index) == 301
+    storage.undo_last()
+    assert storage.update_index(index)
+    view = build_view(index)
+    refs = [index.refs[i] for i in view]
+    records = storage.read_indexed(index, refs)
+    assert sorted(records[ref] for ref in refs) == sorted(rows)
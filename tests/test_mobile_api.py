@@ -0,0 +1,146 @@
+import base64
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from worklogqt import CATEGORIES, TIME_FORMAT, CsvLogStorage, LogShard, LogShards, LogWriter, MobileServerThread
+
+
+@pytest.fixture
+def server(tmp_path):
+    storage = CsvLogStorage(str(tmp_path / "worklog.csv"))
+    storage.ensure_created()
+    writer = LogWriter(storage)
+    server = MobileServerThread(writer, CATEGORIES, "pw")
+    yield server
+    writer.close()
+    storage.close()
+
+
+def login(server, name="张三"):
+    client = server.app.test_client()
+    client.post("/login", data={"name": name, "password": "pw"})
+    return client
+
+
+def test_phone_clock_skew_is_corrected(server):
+    # 手机时钟快了一小时：按发送时刻的时钟差把毫秒时间戳拉回来；旧页面的本地时间字符串不知道时区，原样保存
+    client = login(server)
+    skew = 3600
+    response = client.post("/api/logs", json={
+        "sent": (time.time() + skew) * 1000,
+        "entries": [{"id": "a", "time": (time.time() + skew) * 1000, "category": "打印机维护"},
+                    {"id": "b", "time": "2024-05-01 09:00:00", "category": "其他"}]})
+    assert response.get_json()["accepted"] == 2
+    stored = {row[1]: row[0] for row in server.storage.tail()}
+    assert abs((datetime.strptime(stored["打印机维护"], TIME_FORMAT) - datetime.now()).total_seconds()) < 5
+    assert stored["其他"] == "2024-05-01 09:00:00"
+
+
+def test_latency_is_not_skew(server):
+    # 网络慢、排队久导致 sent 比服务器时间早几十秒：离线记录的时间不能被挪动
+    client = login(server)
+    offline = datetime.now().replace(microsecond=0) - timedelta(hours=1)
+    client.post("/api/logs", json={"sent": time.time() * 1000 - 40000,
+                                   "entries": [{"id": "a", "time": offline.timestamp() * 1000, "category": "其他"}]})
+    assert server.storage.tail()[0][0] == offline.strftime(TIME_FORMAT)
+
+
+def test_ingest_lock_not_held_while_appending(server, monkeypatch):
+    # 一台手机的写入卡住时，另一台手机的提交照常完成；同一批记录的重试得到 409，失败后可以重新提交
+    append_many = server.writer.append_many
+    started, release = threading.Event(), threading.Event()
+
+    def slow_append(rows):
+        if rows[0][2] == "慢":
+            started.set()
+            release.wait(10)
+            raise OSError("磁盘已满")
+        return append_many(rows)
+
+    monkeypatch.setattr(server.writer, "append_many", slow_append)
+    slow_batch = {"entries": [{"id": "slow", "category": "其他", "content": "慢"}]}
+    results = {}
+    thread = threading.Thread(target=lambda: results.update(
+        slow=login(server).post("/api/logs", json=slow_batch).status_code))
+    thread.start()
+    assert started.wait(10)
+
+    fast = login(server, "李四").post("/api/logs", json={"entries": [{"id": "fast", "category": "其他", "content": "快"}]})
+    assert fast.get_json()["accepted"] == 1
+    assert login(server).post("/api/logs", json=slow_batch).status_code == 409
+
+    release.set()
+    thread.join(10)
+    assert results["slow"] == 500
+    monkeypatch.setattr(server.writer, "append_many", append_many)
+    retry = login(server).post("/api/logs", json=slow_batch).get_json()
+    assert retry["accepted"] == 1 and retry["duplicates"] == 0
+    assert login(server).post("/api/logs", json=slow_batch).get_json()["duplicates"] == 1
+
+
+def test_reads_do_not_create_shards(tmp_path):
+    # 只读的请求不能给随便一个名字建分片；登录和写入才会建
+    storage = CsvLogStorage(str(tmp_path / "worklog.csv"))
+    storage.ensure_created()
+    writer = LogWriter(storage)
+    shards = LogShards(str(tmp_path), "csv", LogShard("", storage, writer))
+    server = MobileServerThread(writer, CATEGORIES, "pw", shards=shards)
+    try:
+        client = server.app.test_client()
+        auth = {"Authorization": "Basic " + base64.b64encode(b"scraper:pw").decode()}
+        assert client.get("/api/stats?user=不存在", headers=auth).status_code == 404
+        assert client.get("/api/stats", headers=auth).get_json()["total"] == 0
+        assert shards.users() == [""]
+        assert not os.path.exists(tmp_path / "users" / "不存在")
+
+        client = login(server, "王五")
+        assert client.get("/recent", headers={"Accept": "application/json"}).get_json()["rows"] == []
+        assert shards.users() == ["", "王五"]
+        client.post("/api/logs", json={"entries": [{"id": "a", "category": "其他"}]})
+        assert client.get("/api/stats?user=me").get_json()["total"] == 1
+        assert client.get("/api/stats?user=王五", headers=auth).get_json()["total"] == 1
+    finally:
+        shards.close()
+        writer.close()
+        storage.close()
+
+
+@pytest.mark.parametrize("accept, expected", [
+    ("gzip, deflate", "gzip"), ("*", "gzip"), ("gzip;q=0", None), ("identity", None), ("br, *;q=0", None)])
+def test_index_gzip_negotiation(server, accept, expected):
+    response = login(server).get("/", headers={"Accept-Encoding": accept})
+    assert response.status_code == 200
+    assert response.headers.get("Content-Encoding") == expected
+
+
+def scrape(client, password="pw"):
+    auth = {"Authorization": "Basic " + base64.b64encode(f"scraper:{password}".encode()).decode()}
+    response = client.get("/metrics", headers=auth)
+    if response.status_code != 200:
+        return response.status_code
+    samples = {}
+    for line in response.get_data(as_text=True).splitlines():
+        if not line.startswith("#"):
+            name, value = line.rsplit(" ", 1)
+            samples[name] = float(value)
+    return samples
+
+
+def test_metrics_endpoint(server):
+    client = server.app.test_client()
+    assert client.get("/metrics").status_code == 401
+    assert scrape(client, "wrong") == 401
+    before = scrape(client).get("worklog_appended_rows_total", 0)
+    login(server).post("/api/logs", json={"entries": [{"id": "a", "category": "其他"},
+                                                      {"id": "b", "category": "其他"}]})
+    samples = scrape(client)
+    assert samples["worklog_appended_rows_total"] == before + 2
+    assert samples['worklog_http_requests_total{route="/api/logs",method="POST",status="200"}'] >= 1
+    # 直方图的桶是累计的，+Inf 桶等于总次数
+    route = '{route="/api/logs"}'
+    assert (samples['worklog_http_request_duration_seconds_bucket{route="/api/logs",le="+Inf"}']
+            == samples["worklog_http_request_duration_seconds_count" + route] >= 1)
@@ -0,0 +1,83 @@
+import http.client
+import socket
+import threading
+import time
+from urllib.parse import urlencode
+
+import pytest
+
+import worklogqt
+from worklogqt import CATEGORIES, CsvLogStorage, LogEventBus, LogWriter, MobileServerThread, concurrent_server_class
+
+
+@pytest.fixture
+def start_server(tmp_path):
+    storage = CsvLogStorage(str(tmp_path / "worklog.csv"))
+    storage.ensure_created()
+    writer = LogWriter(storage, events=LogEventBus())
+    started = []
+
+    def start(workers, backlog):
+        mobile = MobileServerThread(writer, CATEGORIES, "pw", mode="pool", workers=workers, backlog=backlog)
+        mobile.server = concurrent_server_class()('127.0.0.1', 0, mobile.app, mode="pool",
+                                                  workers=workers, backlog=backlog)
+        thread = threading.Thread(target=mobile.server.serve_forever, daemon=True)
+        thread.start()
+        started.append((mobile, thread))
+        return mobile.server.server_port
+
+    yield start
+    for mobile, thread in started:
+        mobile.stop()
+        thread.join(10)
+        mobile.server.server_close()
+    writer.close()
+    storage.close()
+
+
+def get(port, path, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request("GET", path, headers=headers or {})
+    response = conn.getresponse()
+    response.read()
+    conn.close()
+    return response.status
+
+
+def test_idle_connections_release_workers(start_server, monkeypatch):
+    # 连上却不发请求的连接（浏览器预连接、空闲长连接）很快被断开，不会一直占着工作线程
+    monkeypatch.setattr(worklogqt, "KEEPALIVE_IDLE", 0.3)
+    port = start_server(workers=2, backlog=4)
+    idle = [socket.create_connection(('127.0.0.1', port)) for _ in range(2)]
+    began = time.monotonic()
+    assert get(port, "/login") == 200
+    assert time.monotonic() - began < 5
+    for sock in idle:
+        sock.settimeout(5)
+        assert sock.recv(1) == b""
+        sock.close()
+
+
+def test_event_streams_do_not_use_workers(start_server):
+    # 只有一个工作线程：推送连接打开后，普通请求照样能处理
+    port = start_server(workers=1, backlog=1)
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    conn.request("POST", "/login", urlencode({"name": "张三", "password": "pw"}),
+                 {"Content-Type": "application/x-www-form-urlencoded"})
+    response = conn.getresponse()
+    response.read()
+    cookie = response.getheader("Set-Cookie").split(";")[0]
+    conn.close()
+
+    streams = []
+    for _ in range(2):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        conn.request("GET", "/events", headers={"Cookie": cookie})
+        response = conn.getresponse()
+        assert response.status == 200
+        assert response.fp.readline()
+        streams.append(conn)
+    assert get(port, "/login") == 200
+    assert get(port, "/api/stats", {"Cookie": cookie}) == 200
+    for conn in streams:
+        conn.close()
@@ -0,0 +1,66 @@
+import csv
+import io
+import random
+
+import worklogqt
+from conftest import random_rows, encode_log
+from worklogqt import (split_records, scan_range_counts, scan_range_rows, parallel_daily_counts, parallel_rows,
+                       daily_counts, filter_rows, shutdown_scan_pool)
+
+
+def read_all(data):
+    reader = csv.reader(io.StringIO(data.decode('utf-8-sig'), newline=''))
+    next(reader)
+    return list(reader)
+
+
+def test_split_records():
+    # 切分点都落在记录起点上，严格递增并覆盖整个区间
+    rng = random.Random(1)
+    for _ in range(300):
+        rows = random_rows(rng, rng.randrange(12))
+        data, begin, offsets = encode_log(rows)
+        starts = set(offsets) | {begin, len(data)}
+        for parts in (1, 2, 3, 5, 8):
+            bounds = split_records(io.BytesIO(data), begin, len(data), parts)
+            assert bounds[0] == begin and bounds[-1] == len(data)
+            assert all(a < b for a, b in zip(bounds, bounds[1:])) or len(data) == begin
+            assert set(bounds) <= starts
+
+
+def test_range_scans_match_serial(tmp_path):
+    rng = random.Random(2)
+    path = str(tmp_path / "worklog.csv")
+    for _ in range(100):
+        rows = random_rows(rng, rng.randrange(1, 30))
+        data, begin, _ = encode_log(rows)
+        with open(path, 'wb') as f:
+            f.write(data)
+        with open(path, 'rb') as f:
+            bounds = split_records(f, begin, len(data), rng.randrange(1, 6))
+        ranges = list(zip(bounds, bounds[1:]))
+        counts = {}
+        for a, b in ranges:
+            for key, n in scan_range_counts(path, a, b).items():
+                counts[key] = counts.get(key, 0) + n
+        assert counts == daily_counts(read_all(data))
+        lo, hi = sorted(row[0][:10] for row in rng.sample(rows, 2)) if len(rows) > 1 else (None, None)
+        scanned = [row for a, b in ranges for row in scan_range_rows(path, a, b, lo, hi)]
+        assert scanned == list(filter_rows(read_all(data), lo, hi))
+
+
+def test_parallel_scan_uses_process_pool(tmp_path, monkeypatch):
+    # 把阈值调低，让小文件也走子进程扫描
+    monkeypatch.setattr(worklogqt, "SCAN_WORKERS", 2)
+    monkeypatch.setattr(worklogqt, "PARALLEL_SCAN_MIN_BYTES", 0)
+    monkeypatch.setattr(worklogqt, "PARALLEL_SCAN_CHUNK", 256)
+    rows = random_rows(random.Random(3), 200)
+    data, _, _ = encode_log(rows)
+    path = str(tmp_path / "worklog.csv")
+    with open(path, 'wb') as f:
+        f.write(data)
+    try:
+        assert parallel_daily_counts(path, len(data)) == daily_counts(read_all(data))
+        assert list(parallel_rows(path, len(data))) == read_all(data)
+    finally:
+        shutdown_scan_pool()
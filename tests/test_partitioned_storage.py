@@ -0,0 +1,144 @@
+import os
+import random
+from datetime import datetime
+
+import pytest
+
+from conftest import random_rows, encode_log
+from worklogqt import ARCHIVE_CODECS, TIME_FORMAT, PartitionedCsvStorage, backend_switch_error
+
+LEGACY_ROWS = [
+    ["2020-01-05 09:00:00", "打印机维护", ""],
+    ["2020-02-10 10:00:00", "其他", "会议室,\"临时\"\n投影仪"],
+    ["2021-03-01 11:00:00", "网络设备维护", ""],
+]
+NEW_ROWS = [[f"2024-05-0{i} 09:00:00", "系统重装", f"第{i}条"] for i in range(1, 6)]
+
+
+def open_partitioned(log_dir):
+    storage = PartitionedCsvStorage(str(log_dir), split_from=str(log_dir / "worklog.csv"))
+    storage.ensure_created()
+    return storage
+
+
+def all_rows(storage):
+    return sorted(storage.iter_rows())
+
+
+@pytest.fixture
+def log_dir(tmp_path):
+    with open(tmp_path / "worklog.csv", 'wb') as f:
+        f.write(encode_log(LEGACY_ROWS)[0])
+    return tmp_path
+
+
+def test_split_legacy(log_dir):
+    storage = open_partitioned(log_dir)
+    assert all_rows(storage) == sorted(LEGACY_ROWS)
+    assert not os.path.exists(storage.split_marker)
+    storage.close()
+
+
+def test_split_legacy_in_batches(log_dir, monkeypatch):
+    monkeypatch.setattr(PartitionedCsvStorage, "SPLIT_BATCH", 7)
+    rows = random_rows(random.Random(0), 200)
+    with open(log_dir / "worklog.csv", 'wb') as f:
+        f.write(encode_log(rows)[0])
+    storage = open_partitioned(log_dir)
+    assert all_rows(storage) == sorted(rows)
+    storage.close()
+
+
+@pytest.mark.parametrize("damage", ["truncate", "delete", "garbage", "no_split_from"])
+def test_lost_manifest_keeps_partitions(log_dir, damage):
+    # manifest 丢失或损坏后重新打开，迁移之后追加的记录和归档都不能丢
+    storage = open_partitioned(log_dir)
+    storage.append_many(NEW_ROWS)
+    assert storage.compact(keep_months=1) > 0
+    storage.close()
+
+    manifest = log_dir / "worklog-manifest.json"
+    if damage == "truncate":
+        manifest.write_bytes(b"")
+    elif damage == "delete":
+        manifest.unlink()
+    elif damage == "garbage":
+        manifest.write_bytes(b'{"partitions": {"2024-0')
+    else:
+        text = manifest.read_text(encoding='utf-8').replace('"split_from"', '"split_from_old"')
+        manifest.write_text(text, encoding='utf-8')
+
+    storage = open_partitioned(log_dir)
+    assert all_rows(storage) == sorted(LEGACY_ROWS + NEW_ROWS)
+    assert sum(storage.category_counts("2000-01-01", "2099-12-31").values()) == len(LEGACY_ROWS + NEW_ROWS)
+    storage.close()
+
+
+def test_interrupted_split_is_redone(log_dir):
+    # 标记还在：上次拆分中途退出，只留下部分分区，重新打开时清掉重拆，不会重复
+    storage = open_partitioned(log_dir)
+    storage.close()
+    os.remove(log_dir / "worklog-manifest.json")
+    os.remove(log_dir / "worklog-2021-03.csv")
+    with open(log_dir / "worklog-partitions.splitting", 'w', encoding='utf-8') as f:
+        f.write(str(log_dir / "worklog.csv"))
+
+    storage = open_partitioned(log_dir)
+    assert all_rows(storage) == sorted(LEGACY_ROWS)
+    assert not os.path.exists(storage.split_marker)
+    storage.close()
+
+
+def test_backend_switch_error(log_dir):
+    # 迁移只做一次：切回 CSV、或切到已经导入过的引擎，都会有记录看不到
+    assert backend_switch_error(str(log_dir), "csv", "partitioned") is None
+    assert backend_switch_error(str(log_dir), "partitioned", "csv")
+    assert backend_switch_error(str(log_dir), "sqlite", "partitioned")
+    open_partitioned(log_dir).close()
+    assert backend_switch_error(str(log_dir), "csv", "partitioned")
+    assert backend_switch_error(str(log_dir), "csv", "sqlite") is None
+    (log_dir / "users" / "张三").mkdir(parents=True)
+    (log_dir / "users" / "张三" / "worklog.db").write_bytes(b"")
+    assert backend_switch_error(str(log_dir), "csv", "sqlite")
+
+
+def test_undo_without_recent_skips_unknown(log_dir):
+    # manifest 里没有最近追加的记录时按月份找最新分区，不能找到时间无法解析的 unknown 分区
+    storage = open_partitioned(log_dir)
+    now = datetime.now().strftime(TIME_FORMAT)
+    storage.append_many([[now, "打印机维护", ""], ["时间损坏", "其他", ""]])
+    storage.manifest['recent'] = []
+    assert storage.undo_last() == [now, "打印机维护", ""]
+    assert ["时间损坏", "其他", ""] in all_rows(storage)
+    storage.close()
+
+
+@pytest.mark.parametrize("codec", ["xz", "gz"])
+def test_compact_round_trip(log_dir, codec):
+    # 压缩前后、重新打开后读到的记录完全相同；压缩后补传到归档月份的记录下次合并进同一个归档
+    rng = random.Random(21)
+    rows = random_rows(rng, 1500)
+    storage = open_partitioned(log_dir)
+    storage.append_many(rows)
+    before = storage.category_counts(None, None)
+    assert storage.compact(keep_months=1, codec=codec) > 0
+    archives = [name for name in os.listdir(log_dir) if name.endswith(f".csv.{codec}")]
+    assert archives and not os.path.exists(log_dir / "worklog-2015-06.csv")
+    with ARCHIVE_CODECS[codec](log_dir / archives[0], 'rb') as f:
+        assert f.read().startswith(encode_log([])[0])
+    assert all_rows(storage) == sorted(LEGACY_ROWS + rows)
+    assert sorted(storage.iter_rows("2015-01-01", "2016-12-31")) == sorted(
+        row for row in LEGACY_ROWS + rows if "2015-01-01" <= row[0][:10] <= "2016-12-31")
+    assert storage.category_counts(None, None) == before
+
+    late = [["2015-06-15 12:00:00", "其他", "补传"]]
+    storage.append_many(late)
+    assert os.path.exists(log_dir / "worklog-2015-06.csv")
+    assert storage.compact(keep_months=1, codec=codec) == 1
+    assert not os.path.exists(log_dir / "worklog-2015-06.csv")
+    storage.close()
+
+    storage = open_partitioned(log_dir)
+    assert all_rows(storage) == sorted(LEGACY_ROWS + rows + late)
+    assert [row[2] for row in storage.search("补传")] == ["补传"]
+    storage.close()
@@ -0,0 +1,71 @@
+import random
+from collections import Counter
+from datetime import datetime
+
+import pytest
+
+from conftest import random_rows
+from worklogqt import TIME_FORMAT, RowIndex, pivot_counts, stats_delta
+
+
+def group_key(dimension, moment):
+    if dimension == "hour":
+        return moment.hour
+    if dimension == "weekday":
+        return moment.weekday()
+    if dimension == "heatmap":
+        return moment.weekday() * 24 + moment.hour
+    if dimension == "week":
+        year, week, _ = moment.isocalendar()
+        return f"{year:04d}-W{week:02d}"
+    return f"{moment.year:04d}-{moment.month:02d}"
+
+
+def expected(rows, dimension, start, end):
+    counts = Counter()
+    for row in rows:
+        try:
+            moment = datetime.strptime(row[0], TIME_FORMAT)
+        except ValueError:
+            continue
+        if (start is None or row[0][:10] >= start) and (end is None or row[0][:10] <= end):
+            counts[group_key(dimension, moment), row[1]] += 1
+    return dict(counts)
+
+
+def make_index(rows):
+    index = RowIndex()
+    for i, row in enumerate(rows):
+        index.add(i, row)
+    return index
+
+
+@pytest.mark.parametrize("ordered", [True, False])
+@pytest.mark.parametrize("dimension", ["hour", "weekday", "heatmap", "week", "month"])
+def test_pivot_matches_datetime(dimension, ordered):
+    rng = random.Random(17)
+    rows = random_rows(rng, 3000) + [["不是时间", "其他", ""], ["2024-02-30 09:00:00", "其他", ""]]
+    if ordered:
+        rows.sort()
+    index = make_index(rows)
+    ranges = [(None, None), ("2015-01-01", "2015-12-31"), ("2020-02-29", "2020-03-01")]
+    for _ in range(10):
+        ranges.append(tuple(sorted(f"20{rng.randrange(10, 30)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}"
+                                   for _ in range(2))))
+    for start, end in ranges:
+        assert pivot_counts(index, dimension, start, end) == expected(rows, dimension, start, end)
+
+
+@pytest.mark.parametrize("dimension", ["category", "hour", "week"])
+def test_delta_adds_up(dimension):
+    # 已有结果加上新记录的增量，等于对全部记录重新统计
+    rng = random.Random(18)
+    rows, new = random_rows(rng, 500), random_rows(rng, 20)
+    if dimension == "category":
+        before = Counter(row[1] for row in rows if "2015-01-01" <= row[0][:10] <= "2024-12-31")
+        after = Counter(row[1] for row in rows + new if "2015-01-01" <= row[0][:10] <= "2024-12-31")
+    else:
+        before = Counter(pivot_counts(make_index(rows), dimension, "2015-01-01", "2024-12-31"))
+        after = Counter(pivot_counts(make_index(rows + new), dimension, "2015-01-01", "2024-12-31"))
+    before.update(stats_delta(new, dimension, "2015-01-01", "2024-12-31"))
+    assert before == after
@@ -0,0 +1,88 @@
+import io
+import random
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from conftest import random_rows, encode_log
+from worklogqt import (find_last_record, iter_records_reverse, scan_records, read_header, parse_record,
+                       parse_day, civil_from_days, days_from_civil, parse_timestamp, TIME_FORMAT)
+
+# 每个性质测试生成的随机日志数
+ROUNDS = 300
+
+
+def random_logs(seed, max_rows):
+    rng = random.Random(seed)
+    for _ in range(ROUNDS):
+        rows = random_rows(rng, rng.randrange(max_rows + 1))
+        yield rng, rows, encode_log(rows)
+
+
+def test_find_last_record():
+    for rng, rows, (data, begin, offsets) in random_logs(1, 3):
+        expected = offsets[-1] if offsets else None
+        for block_size in (1, 2, 3, 7, 64, 4096):
+            assert find_last_record(io.BytesIO(data), len(data), block_size) == expected
+
+
+def test_find_last_record_repeated_undo():
+    # 连续撤销：每次截到上一条记录的起点，最后只剩表头
+    for rng, rows, (data, begin, offsets) in random_logs(2, 5):
+        size = len(data)
+        for offset in reversed(offsets):
+            size = find_last_record(io.BytesIO(data), size, rng.choice((1, 5, 4096)))
+            assert size == offset
+        assert find_last_record(io.BytesIO(data), size) is None
+
+
+def test_iter_records_reverse():
+    for rng, rows, (data, begin, offsets) in random_logs(3, 6):
+        records = list(iter_records_reverse(data, begin, len(data)))
+        assert [offset for offset, _ in records] == offsets[::-1]
+        assert [parse_record(record) for _, record in records] == rows[::-1]
+
+
+def test_scan_records():
+    for rng, rows, (data, begin, offsets) in random_logs(4, 6):
+        f = io.BytesIO(data)
+        assert len(read_header(f)) == begin
+        records = list(scan_records(f, begin, len(data)))
+        assert [offset for offset, _ in records] == offsets
+        assert [parse_record(record) for _, record in records] == rows
+        if offsets:
+            # 末尾不完整的记录不产出
+            cut = rng.randrange(offsets[-1], len(data))
+            assert [offset for offset, _ in scan_records(f, begin, cut)] == offsets[:-1]
+
+
+def test_parse_day_round_trip():
+    rng = random.Random(5)
+    for _ in range(20000):
+        z = rng.randrange(-800000, 3000000)
+        y, m, d = civil_from_days(z)
+        assert days_from_civil(y, m, d) == z
+        if 1 <= y <= 9999:
+            assert parse_day(f"{y:04d}-{m:02d}-{d:02d}") == z == (date(y, m, d) - date(1970, 1, 1)).days
+
+
+def test_parse_day_every_day():
+    day = date(1999, 1, 1)
+    while day < date(2101, 1, 1):
+        assert civil_from_days(parse_day(day.isoformat())) == (day.year, day.month, day.day)
+        day += timedelta(days=1)
+
+
+@pytest.mark.parametrize("text", ["2023-02-29", "2100-02-29", "2024-13-01", "2024-00-10", "2024-04-31",
+                                  "2024/01/01", "2024-1-01", "24-01-01", "", "abcd-ef-gh"])
+def test_parse_day_invalid(text):
+    with pytest.raises(ValueError):
+        parse_day(text)
+
+
+def test_parse_timestamp():
+    rng = random.Random(6)
+    for _ in range(2000):
+        seconds = rng.randrange(0, 4102444800)
+        moment = datetime(1970, 1, 1) + timedelta(seconds=seconds)
+        assert parse_timestamp(moment.strftime(TIME_FORMAT)) == seconds
@@ -0,0 +1,46 @@
+import random
+from collections import Counter
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import random_rows
+from worklogqt import TIME_FORMAT, open_storage
+
+
+@pytest.fixture(params=["csv", "partitioned", "sqlite"])
+def storage(request, tmp_path):
+    storage = open_storage(str(tmp_path), request.param)
+    storage.ensure_created()
+    yield storage
+    storage.close()
+
+
+def scan_counts(rows, start, end):
+    return dict(Counter(row[1] for row in rows if start <= row[0][:10] <= end))
+
+
+def test_rollups_follow_appends_and_undo(storage):
+    rng = random.Random(3)
+    rows = random_rows(rng, 2000)
+    storage.append_many(rows[:1000])
+    storage.append_many(rows[1000:])
+    now = datetime.now()
+    recent = [(now - timedelta(seconds=5)).strftime(TIME_FORMAT), "打印机维护", "刚记的"]
+    storage.append(*recent)
+    today = recent[0][:10]
+    assert storage.category_counts(today, today) == scan_counts(rows + [recent], today, today)
+    assert storage.undo_last() == recent
+    for _ in range(20):
+        start, end = sorted(f"20{rng.randrange(10, 30)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}"
+                            for _ in range(2))
+        assert storage.category_counts(start, end) == scan_counts(rows, start, end)
+    assert storage.category_counts(None, None) == scan_counts(rows, "", "9")
+
+
+def test_rebuild_matches_maintained_counts(storage):
+    rows = random_rows(random.Random(4), 500)
+    storage.append_many(rows)
+    before = storage.category_counts(None, None)
+    storage.rebuild_rollups()
+    assert storage.category_counts(None, None) == before == scan_counts(rows, "", "9")
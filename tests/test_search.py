@@ -0,0 +1,71 @@
+import random
+import re
+import unicodedata
+from datetime import datetime, timedelta
+
+import pytest
+
+from worklogqt import TIME_FORMAT, open_storage
+
+WORDS = ["打印机", "卡纸", "硒鼓", "更换", "网络", "交换机", "机房", "HP", "LaserJet", "ｐｒｉｎｔｅｒ", "P1108", "vpn",
+         "2楼", "，", " ", "更换硒鼓"]
+
+
+def random_content(rng):
+    return "".join(rng.choice(WORDS) for _ in range(rng.randrange(5)))
+
+
+def normalize(text):
+    return unicodedata.normalize('NFKC', text).lower()
+
+
+def expected(rows, query):
+    # 按定义逐条核对：每个词都是原文的子串，字母数字的部分还要是某个整词的前缀
+    terms = [normalize(term) for term in query.split()]
+    words = [run for term in terms for run in re.findall("[0-9a-z]+", term)]
+    if not any(re.search("[0-9a-z]|[\u4e00-\u9fff]", term) for term in terms):
+        # 没有可以检索的字或词（只有空格、标点）时不返回结果
+        return []
+    found = []
+    for row in rows:
+        text = normalize(row[1] + " " + row[2])
+        tokens = re.findall("[0-9a-z]+", text)
+        if (row[2] and all(term in text for term in terms)
+                and all(any(token.startswith(word) for token in tokens) for word in words)):
+            found.append(row)
+    return found
+
+
+@pytest.fixture(params=["csv", "partitioned", "sqlite"])
+def storage(request, tmp_path):
+    storage = open_storage(str(tmp_path), request.param)
+    storage.ensure_created()
+    yield storage
+    storage.close()
+
+
+def test_search_matches_definition(storage):
+    rng = random.Random(13)
+    start = datetime(2024, 1, 1)
+    rows = [[(start + timedelta(minutes=rng.randrange(200000))).strftime(TIME_FORMAT),
+             rng.choice(["打印机维护", "网络设备维护", "其他"]), random_content(rng)] for _ in range(800)]
+    storage.append_many(rows)
+    queries = ["打印", "印", "卡纸 更换", "机房", "hp", "LASER", "ｈｐ", "p11", "aserjet", "2楼", "vpn 网络", "打 鼓",
+               "硒鼓更换", "维护"]
+    queries += [normalize(rng.choice(rows)[2])[:rng.randrange(1, 4)] for _ in range(30)]
+    for query in queries:
+        results = storage.search(query, limit=10000)
+        assert sorted(results) == sorted(expected(rows, query)), query
+        assert [row[0] for row in results] == sorted((row[0] for row in results), reverse=True)
+    assert len(storage.search("打印", limit=5)) == min(5, len(expected(rows, "打印")))
+
+
+def test_search_follows_undo(storage):
+    now = datetime.now()
+    storage.append((now - timedelta(minutes=1)).strftime(TIME_FORMAT), "其他", "更换硒鼓")
+    storage.append((now - timedelta(seconds=5)).strftime(TIME_FORMAT), "其他", "更换硒鼓")
+    assert len(storage.search("硒鼓")) == 2
+    storage.undo_last()
+    assert len(storage.search("硒鼓")) == 1
+    storage.rebuild_rollups()
+    assert len(storage.search("硒鼓")) == 1
@@ -0,0 +1,100 @@
+import os
+import random
+
+import pytest
+from PySide6.QtCore import QSettings
+
+import worklogqt
+from worklogqt import LogShard, LogShards, LogWriter, MergedLogView, RowIndex, build_view, open_storage, sort_window
+
+MAIN_ROWS = [["2024-05-01 09:00:00", "打印机维护", ""], ["2024-05-03 09:00:00", "其他", "本机更换硒鼓"]]
+PHONE_ROWS = [["2024-05-02 10:00:00", "其他", "张三处理打印机卡纸"], ["2024-05-04 10:00:00", "网络设备维护", ""]]
+
+
+@pytest.fixture(params=["csv", "partitioned", "sqlite"])
+def shards(request, tmp_path):
+    storage = open_storage(str(tmp_path), request.param)
+    storage.ensure_created()
+    writer = LogWriter(storage)
+    shards = LogShards(str(tmp_path), request.param, LogShard("", storage, writer))
+    writer.append_many(MAIN_ROWS)
+    shards.get("张三").writer.append_many(PHONE_ROWS)
+    yield shards
+    shards.close()
+    writer.close()
+    storage.close()
+
+
+def test_merged_reads_include_every_shard(shards):
+    view = MergedLogView(shards)
+    assert list(view.iter_rows()) == sorted(MAIN_ROWS + PHONE_ROWS)
+    assert view.category_counts("2024-05-01", "2024-05-31")["其他"] == 2
+    assert [row[2] for row in view.search("卡纸")] == ["张三处理打印机卡纸"]
+    assert view.tail(limit=3) == sorted(MAIN_ROWS + PHONE_ROWS, reverse=True)[:3]
+
+
+def test_merged_index(shards):
+    view = MergedLogView(shards)
+    index = RowIndex()
+    assert view.update_index(index)
+    rows = view.read_indexed(index, [index.refs[i] for i in build_view(index)])
+    assert [rows[index.refs[i]] for i in build_view(index)] == sorted(MAIN_ROWS + PHONE_ROWS, reverse=True)
+
+    # 没有变化时不重建；另一个人追加后增量更新，旧索引不受影响
+    old = index.copy()
+    assert not view.update_index(index)
+    shards.get("李四").writer.append_many([["2024-05-05 08:00:00", "系统重装", ""]])
+    assert view.update_index(index)
+    assert len(index) == 5 and len(old) == 4
+    newest = index.refs[build_view(index)[0]]
+    assert view.read_indexed(index, [newest])[newest] == ["2024-05-05 08:00:00", "系统重装", ""]
+
+
+def test_read_only_views_do_not_start_writers(shards):
+    # 新的分片表：界面线程的视图只看已经打开的分片；后台打开的分片在写入前不启动写线程
+    reopened = LogShards(shards.log_dir, shards.backend, shards.main)
+    opened_view = MergedLogView(reopened, open_all=False)
+    assert opened_view.tail() == sorted(MAIN_ROWS, reverse=True)
+    assert reopened.find("不存在") is None
+    assert [shard.user for shard in reopened.all()] == ["", "张三"]
+    assert reopened.find("张三").writer.thread is None
+    assert opened_view.tail() == sorted(MAIN_ROWS + PHONE_ROWS, reverse=True)
+    reopened.close()
+
+
+def test_merged_rows_sorted_despite_late_uploads(shards):
+    # 手机补传的旧记录追加在后面：合并导出仍按时间排序
+    late = [["2024-04-30 08:00:00", "其他", "补传"], ["2024-05-01 08:30:00", "系统重装", "补传"]]
+    shards.get("张三").writer.append_many(late)
+    shards.main.writer.append_many([["2024-05-02 09:30:00", "其他", "补传"]])
+    expected = sorted(MAIN_ROWS + PHONE_ROWS + late + [["2024-05-02 09:30:00", "其他", "补传"]])
+    assert list(MergedLogView(shards).iter_rows()) == expected
+
+
+def test_sort_window():
+    rng = random.Random(4)
+    for _ in range(200):
+        rows = [[f"2024-05-{rng.randrange(1, 29):02d} 09:00:00", str(i)] for i in range(rng.randrange(40))]
+        assert list(sort_window(rows, len(rows) + 1)) == sorted(rows, key=lambda row: row[0])
+        # 窗口比乱序距离小时仍输出所有记录
+        assert sorted(sort_window(rows, 3)) == sorted(rows)
+
+
+def test_compact_command_covers_every_shard(tmp_path, monkeypatch):
+    # 命令行压缩与界面一样处理 users/ 下每个人的分片
+    log_dir = tmp_path / "Documents" / "WorkLog"
+    log_dir.mkdir(parents=True)
+    old = [["2020-01-05 09:00:00", "打印机维护", ""]]
+    for path in (log_dir, log_dir / "users" / "张三"):
+        path.mkdir(parents=True, exist_ok=True)
+        storage = open_storage(str(path), "partitioned")
+        storage.ensure_created()
+        storage.append_many(old)
+        storage.close()
+    monkeypatch.setenv("HOME", str(tmp_path))
+    settings = QSettings(str(tmp_path / "settings.ini"), QSettings.IniFormat)
+    settings.setValue("storage_backend", "partitioned")
+    monkeypatch.setattr(worklogqt, "app_settings", lambda: settings)
+    assert worklogqt.compact_command() == 0
+    assert os.path.exists(log_dir / "worklog-2020-01.csv.xz")
+    assert os.path.exists(log_dir / "users" / "张三" / "worklog-2020-01.csv.xz")
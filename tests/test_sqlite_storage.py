@@ -0,0 +1,43 @@
+import random
+
+from conftest import random_rows, encode_log
+from worklogqt import LogWriter, SqliteLogStorage
+
+ROW = ["2024-05-01 09:00:00", "打印机维护", ""]
+
+
+def writer_synchronous(storage):
+    # 写线程的连接（建表的连接之后那个）：PRAGMA synchronous 1 是 NORMAL，2 是 FULL
+    return storage._connections[-1].execute("PRAGMA synchronous").fetchone()[0]
+
+
+def test_always_durability_uses_full_synchronous(tmp_path):
+    storage = SqliteLogStorage(str(tmp_path / "worklog.db"))
+    storage.ensure_created()
+    writer = LogWriter(storage, "always")
+    try:
+        writer.append_many([ROW])
+        assert writer_synchronous(storage) == 2
+        writer.set_durability("interval")
+        writer.append_many([ROW])
+        assert writer_synchronous(storage) == 1
+        writer.set_durability("always")
+        writer.append_many([ROW])
+        assert writer_synchronous(storage) == 2
+        assert len(list(storage.iter_rows())) == 3
+    finally:
+        writer.close()
+        storage.close()
+
+
+def test_migrate_csv_keeps_multiline_content(tmp_path):
+    rows = random_rows(random.Random(5), 300)
+    csv_path = tmp_path / "worklog.csv"
+    csv_path.write_bytes(encode_log(rows)[0])
+    storage = SqliteLogStorage(str(tmp_path / "worklog.db"), migrate_from=str(csv_path))
+    try:
+        storage.ensure_created()
+        assert list(storage.iter_rows()) == [(row + [""])[:3] for row in rows]
+        assert storage.migrate_csv(str(csv_path)) == 0
+    finally:
+        storage.close()
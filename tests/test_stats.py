@@ -0,0 +1,175 @@
+import random
+import threading
+import time
+from collections import Counter
+
+import pytest
+
+import worklogqt
+from conftest import random_rows
+from worklogqt import CsvLogStorage, LogShard, LogShards, LogWriter, RowIndex, StatsSignals, StatsTask
+
+ROW = ("2024-05-01 09:00:00", "打印机维护", "")
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = CsvLogStorage(str(tmp_path / "worklog.csv"))
+    storage.ensure_created()
+    yield storage
+    storage.close()
+
+
+def test_snapshot_generation_matches_rows(storage, monkeypatch):
+    # 写线程已经写入记录、代数还没加一时读取：返回的代数必须包含这条记录，界面才会跳过随后到达的事件
+    writer = LogWriter(storage)
+    append_many = storage.append_many
+    written, release = threading.Event(), threading.Event()
+
+    def slow_append(rows):
+        append_many(rows)
+        written.set()
+        release.wait(10)
+
+    monkeypatch.setattr(storage, "append_many", slow_append)
+    try:
+        future = writer.submit([ROW])
+        assert written.wait(10)
+        results = []
+        reader = threading.Thread(target=lambda: results.append(
+            writer.snapshot(lambda: len(list(storage.iter_rows())))))
+        reader.start()
+        release.set()
+        reader.join(10)
+        future.result(10)
+        assert results == [(1, 1)]
+    finally:
+        writer.close()
+
+
+@pytest.fixture
+def shards(tmp_path, storage):
+    writer = LogWriter(storage)
+    shards = LogShards(str(tmp_path), "csv", LogShard("", storage, writer))
+    yield shards
+    shards.close()
+    writer.close()
+
+
+def run_task(shards, user, dimension, start, end, cancel_after=None):
+    signals = StatsSignals()
+    results, progress, failed = [], [], []
+    signals.result.connect(lambda request_id, counts, generations: results.append((request_id, counts, generations)))
+    signals.failed.connect(lambda request_id, message: failed.append(message))
+    task = StatsTask(shards, user, dimension, start, end, 7, signals)
+
+    def on_progress(request_id, done, total):
+        progress.append((done, total))
+        if cancel_after is not None and len(progress) >= cancel_after:
+            task.cancel()
+
+    signals.progress.connect(on_progress)
+    task.run()
+    assert failed == []
+    return results, progress
+
+
+def test_stats_task_merges_shards(shards):
+    rng = random.Random(5)
+    main_rows, phone_rows = random_rows(rng, 300), random_rows(rng, 300)
+    shards.main.writer.append_many(main_rows)
+    shards.get("张三").writer.append_many(phone_rows)
+    results, progress = run_task(shards, None, "category", "2010-01-01", "2029-12-31")
+    assert results == [(7, dict(Counter(row[1] for row in main_rows + phone_rows)), {"": 1, "张三": 1})]
+    assert progress[-1][0] == progress[-1][1]
+
+    results, _ = run_task(shards, None, "user", "2010-01-01", "2029-12-31")
+    expected = Counter(("本机", row[1]) for row in main_rows)
+    expected.update(("张三", row[1]) for row in phone_rows)
+    assert results[0][1] == dict(expected)
+    results, _ = run_task(shards, "李四", "category", "2010-01-01", "2029-12-31")
+    assert results == [(7, {}, {})]
+
+
+def test_cancelled_stats_task_emits_no_result(shards):
+    shards.main.writer.append_many(random_rows(random.Random(6), 100))
+    results, progress = run_task(shards, None, "category", "2010-01-01", "2029-12-31", cancel_after=2)
+    assert results == []
+    assert len(progress) == 2
+
+
+@pytest.fixture
+def counted(storage, monkeypatch):
+    # 记下真正读取存储的次数，命中缓存时不读
+    writer = LogWriter(storage)
+    reads = []
+    iter_category_counts = storage.iter_category_counts
+
+    def counting(start, end):
+        reads.append((start, end))
+        return iter_category_counts(start, end)
+
+    monkeypatch.setattr(storage, "iter_category_counts", counting)
+    yield writer, reads
+    writer.close()
+
+
+def test_stats_cache_follows_generation(counted):
+    writer, reads = counted
+    writer.append_many([ROW])
+    counts, etag = writer.stats.category_counts("2024-05-01", "2024-05-31")
+    assert counts == {"打印机维护": 1} and len(reads) == 1
+    counts["打印机维护"] = 99
+    assert writer.stats.category_counts("2024-05-01", "2024-05-31") == ({"打印机维护": 1}, etag)
+    assert len(reads) == 1
+    writer.stats.category_counts("2024-06-01", "2024-06-30")
+    assert len(reads) == 2
+
+    # 新增和撤销都让代数加一，缓存作废；内容相同时 etag 不变
+    writer.append_many([ROW])
+    counts, new_etag = writer.stats.category_counts("2024-05-01", "2024-05-31")
+    assert counts == {"打印机维护": 2} and new_etag != etag and len(reads) == 3
+    writer.append_many([("2024-07-01 09:00:00", "其他", "")])
+    assert writer.stats.category_counts("2024-05-01", "2024-05-31")[1] == new_etag
+    assert len(reads) == 4
+
+
+def test_result_computed_during_append_is_not_cached(counted):
+    writer, reads = counted
+    key = ("category", None, None)
+    writer.stats.store(key, writer.generation - 1, {"其他": 1})
+    assert writer.stats.cached(key) is None
+
+
+def test_stats_cache_expires(counted, monkeypatch):
+    # 其他程序副本写入的记录不改变本进程的代数，只能靠过期
+    writer, reads = counted
+    monkeypatch.setattr(worklogqt, "STATS_CACHE_TTL", 0.1)
+    writer.stats.category_counts(None, None)
+    writer.stats.category_counts(None, None)
+    assert len(reads) == 1
+    time.sleep(0.2)
+    writer.stats.category_counts(None, None)
+    assert len(reads) == 2
+
+
+def test_stats_cache_is_bounded(counted):
+    writer, reads = counted
+    writer.stats.size = 3
+    for day in range(1, 5):
+        writer.stats.category_counts(f"2024-05-0{day}", f"2024-05-0{day}")
+    writer.stats.category_counts("2024-05-04", "2024-05-04")
+    assert len(reads) == 4
+    writer.stats.category_counts("2024-05-01", "2024-05-01")
+    assert len(reads) == 5
+
+
+def test_pivot_cache_keeps_index(counted):
+    writer, _ = counted
+    writer.append_many([ROW])
+    index, counts = writer.stats.pivot_counts(RowIndex(), "hour", None, None)
+    assert len(index) == 1 and counts == {(9, "打印机维护"): 1}
+    assert writer.stats.pivot_counts(index, "hour", None, None) == (index, counts)
+    writer.append_many([("2024-05-01 10:00:00", "其他", "")])
+    index, counts = writer.stats.pivot_counts(index, "hour", None, None)
+    assert len(index) == 2 and counts[10, "其他"] == 1
@@ -0,0 +1,48 @@
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+from conftest import random_rows
+from worklogqt import TIME_FORMAT, open_storage
+
+
+@pytest.fixture(params=["csv", "partitioned", "sqlite"])
+def storage(request, tmp_path):
+    storage = open_storage(str(tmp_path), request.param)
+    storage.ensure_created()
+    yield storage
+    storage.close()
+
+
+def test_tail_is_newest_appended_first(storage):
+    # 手机补传让追加顺序和时间顺序不一致：tail 按追加顺序倒着返回
+    rng = random.Random(23)
+    rows = []
+    for _ in range(5):
+        batch = random_rows(rng, rng.randrange(1, 80))
+        storage.append_many(batch)
+        rows += batch
+    newest = rows[::-1]
+    # 分区存储只对最近 RECENT_LIMIT 条记得追加顺序
+    for limit in (1, 7, 100):
+        assert storage.tail(limit) == newest[:limit]
+    if storage.name != "partitioned":
+        assert storage.tail(len(rows) + 10) == newest
+    since = sorted(row[0][:10] for row in rows)[len(rows) // 2]
+    assert storage.tail(50, since) == [row for row in newest[:50] if row[0][:10] >= since]
+
+
+def test_tail_after_undo(storage):
+    now = datetime.now()
+    storage.append_many(random_rows(random.Random(24), 30))
+    rows = [[(now - timedelta(seconds=10 - i)).strftime(TIME_FORMAT), "其他", f"第{i}条"] for i in range(3)]
+    storage.append_many(rows)
+    storage.undo_last()
+    assert storage.tail(2) == rows[1::-1]
+    storage.append(*rows[2])
+    assert storage.tail(3) == rows[::-1]
+
+
+def test_empty_tail(storage):
+    assert storage.tail() == []
@@ -0,0 +1,62 @@
+import random
+from datetime import datetime
+
+from worklogqt import TIME_FORMAT, parse_clock, parse_day, parse_timestamp, scan_chunk
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def random_digits(rng, width, first="0123456789"):
+    return rng.choice(first) + "".join(rng.choice("0123456789") for _ in range(width - 1))
+
+
+def random_timestamp(rng):
+    # 固定宽度、每一位随机：既有合法时间，也有 13 月、2 月 30 日、25 点、60 秒之类的非法值
+    if rng.random() < 0.5:
+        return (EPOCH.replace(year=rng.randrange(1000, 3000)) + (datetime(2001, 1, 1) - EPOCH) * rng.random()
+                ).strftime(TIME_FORMAT)
+    return (f"{random_digits(rng, 4, '123456789')}-{random_digits(rng, 2, '01')}-{random_digits(rng, 2, '0123')} "
+            f"{random_digits(rng, 2, '012')}:{random_digits(rng, 2, '0123456')}:{random_digits(rng, 2, '0123456')}")
+
+
+def strptime_seconds(text):
+    try:
+        moment = datetime.strptime(text, TIME_FORMAT)
+    except ValueError:
+        return None
+    return int((moment - EPOCH).total_seconds())
+
+
+def fast_seconds(text):
+    try:
+        return parse_timestamp(text)
+    except ValueError:
+        return None
+
+
+def test_matches_strptime():
+    rng = random.Random(7)
+    for _ in range(20000):
+        text = random_timestamp(rng)
+        assert fast_seconds(text) == strptime_seconds(text), text
+
+
+def test_day_and_clock_match_strptime():
+    rng = random.Random(8)
+    for _ in range(5000):
+        text = random_timestamp(rng)
+        expected = strptime_seconds(text)
+        if expected is not None:
+            assert parse_day(text[:10]) == expected // 86400
+            assert parse_clock(text[11:]) == expected % 86400
+
+
+def test_scan_chunk_skips_bad_rows():
+    rng = random.Random(9)
+    rows = [[random_timestamp(rng), rng.choice("ABC")] for _ in range(3000)]
+    rows += [["2024-05-01 09:00"], [], ["2024-05-01T09:00:00", "A"], ["2024-05-01 09:00:00"]]
+    epochs, days, categories = scan_chunk(rows)
+    valid = [(strptime_seconds(row[0]), row[1]) for row in rows[:3000] if strptime_seconds(row[0]) is not None]
+    assert list(epochs) == [seconds for seconds, _ in valid]
+    assert list(days) == [seconds // 86400 for seconds, _ in valid]
+    assert categories == [category for _, category in valid]
@@ -0,0 +1,113 @@
+import logging
+import threading
+import time
+
+import pytest
+from PySide6.QtCore import Qt
+from PySide6.QtWidgets import QApplication
+
+import worklogqt
+from worklogqt import LogLock, OperationProfiler, StallWatchdog
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger("worklog.test-stalls")
+    handler = ListHandler()
+    logger.addHandler(handler)
+    logger.propagate = False
+    yield logger, handler.messages
+    logger.removeHandler(handler)
+
+
+@pytest.fixture
+def app(monkeypatch):
+    app = QApplication.instance() or QApplication([])
+    # offscreen 平台下程序从不处于前台，这里当作前台，否则卡顿不会报告
+    monkeypatch.setattr(QApplication, "applicationState", lambda: Qt.ApplicationState.ApplicationActive)
+    return app
+
+
+def run_events(app, seconds):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        app.processEvents()
+        time.sleep(0.01)
+
+
+def block_main_thread(seconds):
+    time.sleep(seconds)
+
+
+def test_stall_report_names_lock_holder(app, logger, tmp_path):
+    logger, messages = logger
+    lock = LogLock(str(tmp_path / "worklog.lock"))
+    watchdog = StallWatchdog(logger, lock, threshold_ms=200)
+    held, release = threading.Event(), threading.Event()
+
+    def hold_lock():
+        with lock.write():
+            held.set()
+            release.wait(10)
+
+    holder = threading.Thread(target=hold_lock, name="export-worker")
+    holder.start()
+    watchdog.start()
+    try:
+        assert held.wait(5)
+        run_events(app, 0.3)
+        assert messages == []
+        block_main_thread(0.8)
+        run_events(app, 0.5)
+    finally:
+        watchdog.stop()
+        release.set()
+        holder.join(5)
+        lock.close()
+    # 一次卡顿只报告一次，恢复后补记时长
+    assert len(messages) == 2
+    report, finished = messages
+    assert report.startswith("界面已卡顿")
+    assert "block_main_thread" in report
+    assert "export-worker 持有写锁" in report and "hold_lock" in report
+    assert finished.startswith("界面卡顿结束")
+
+
+def test_inactive_app_is_not_a_stall(app, logger, monkeypatch):
+    logger, messages = logger
+    monkeypatch.setattr(QApplication, "applicationState", lambda: Qt.ApplicationState.ApplicationInactive)
+    watchdog = StallWatchdog(logger, threshold_ms=200)
+    watchdog.start()
+    try:
+        run_events(app, 0.3)
+        block_main_thread(0.6)
+        run_events(app, 0.3)
+    finally:
+        watchdog.stop()
+    assert messages == []
+
+
+def test_slow_operation_is_profiled(logger, tmp_path, monkeypatch):
+    logger, messages = logger
+    monkeypatch.setattr(worklogqt, "PROFILE_KEEP", 2)
+    profiler = OperationProfiler(logger, str(tmp_path / "profiles"), threshold_ms=50)
+    with profiler.profile("fast"):
+        pass
+    profiler.enabled = True
+    with profiler.profile("fast"):
+        pass
+    assert messages == []
+    for _ in range(3):
+        with profiler.profile("export"):
+            block_main_thread(0.06)
+    assert len(messages) == 3 and "慢操作 export" in messages[0] and "block_main_thread" in messages[0]
+    assert len(list((tmp_path / "profiles").glob("export-*.prof"))) == 2
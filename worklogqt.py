@@ -1,26 +1,334 @@
+import time
+# --startup-profile 的计时起点，放在所有导入之前
+STARTUP_BEGIN = time.perf_counter()
 import sys
 import os
 import csv
 import threading
 import socket
 import io
-from datetime import datetime
+import mmap
+import re
+import json
+import queue
+import gzip
+import lzma
+import shutil
+import hashlib
+import heapq
+import logging
+import traceback
+import sqlite3
+import unicodedata
+from bisect import bisect_left
+from contextlib import closing, contextmanager
+from logging.handlers import RotatingFileHandler
+from concurrent.futures import Future, ThreadPoolExecutor
+import operator
+from array import array
+from collections import Counter, OrderedDict, deque
+from functools import lru_cache
+from itertools import compress, islice, repeat
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
 from PySide6.QtWidgets import (QApplication, QMainWindow, QTabWidget, QWidget,
                              QPushButton, QGridLayout, QVBoxLayout, QHBoxLayout,
                              QLabel, QTableWidget, QTableWidgetItem,
                              QDialog, QTextEdit, QGroupBox,
                              QFileDialog, QDateEdit,
-                             QInputDialog, QLineEdit, QMessageBox, QCheckBox)
-from PySide6.QtCore import Qt, QDate, QThread, Signal, Slot, QSettings, QTimer
-from PySide6.QtGui import QIcon, QPixmap, QImage
+                             QInputDialog, QLineEdit, QMessageBox, QCheckBox,
+                             QComboBox, QSpinBox, QProgressDialog, QProgressBar, QTableView)
+from PySide6.QtCore import (Qt, QDate, QThread, Signal, Slot, QSettings, QTimer,
+                            QObject, QThreadPool, QAbstractTableModel, QModelIndex)
+from PySide6.QtGui import QIcon, QPixmap, QImage, QColor
 
-from flask import Flask, request, render_template_string, redirect, url_for, session
-from werkzeug.serving import make_server
-import qrcode
-from PIL import Image
 
-# 全局锁，用于文件写入安全
-file_lock = threading.Lock()
+try:
+    import fcntl
+except ImportError:
+    # Windows 没有 fcntl，只在进程内加锁
+    fcntl = None
+
+# 延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRIC_HELP = {
+    "worklog_http_requests_total": "手机端请求次数",
+    "worklog_http_request_duration_seconds": "手机端请求耗时",
+    "worklog_lock_wait_seconds": "等待日志锁的时间",
+    "worklog_lock_hold_seconds": "持有日志锁的时间",
+    "worklog_lock_contended_total": "日志锁发生争用的次数",
+    "worklog_append_duration_seconds": "写入一批记录的耗时",
+    "worklog_appended_rows_total": "写入的记录条数",
+    "worklog_undo_duration_seconds": "撤销的耗时",
+    "worklog_sync_duration_seconds": "落盘的耗时",
+    "worklog_stats_duration_seconds": "生成统计的耗时",
+    "worklog_search_duration_seconds": "全文搜索的耗时",
+    "worklog_stats_cache_total": "统计查询命中/未命中缓存的次数",
+    "worklog_log_size_bytes": "日志文件大小",
+    "worklog_log_rows": "日志记录条数",
+    "worklog_ui_stalls_total": "界面卡顿次数",
+    "worklog_ui_stall_seconds": "界面卡顿的时长",
+    "worklog_operation_duration_seconds": "开启耗时分析时各操作的耗时",
+}
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        # 按桶上界估算分位数，落在最后一个桶时用最大值
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+class Metrics:
+    # 进程内指标。热路径上只做一次无竞争加锁和几次加法；
+    # 日志大小、记录数这类需要读磁盘的值注册成回调，只在 /metrics 或诊断面板读取时计算
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.gauges = {}
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, labels=()):
+        key = (name, labels)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, labels=()):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, labels)
+
+    def set_gauge(self, name, func):
+        with self.lock:
+            self.gauges[name] = func
+
+    def remove_gauge(self, name):
+        with self.lock:
+            self.gauges.pop(name, None)
+
+    def snapshot(self):
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = []
+            for key, h in sorted(self.histograms.items()):
+                copy = Histogram(h.buckets)
+                copy.counts, copy.sum, copy.count, copy.max = list(h.counts), h.sum, h.count, h.max
+                histograms.append((key, copy))
+            gauges = sorted(self.gauges.items())
+        values = []
+        for name, func in gauges:
+            try:
+                values.append((name, func()))
+            except Exception:
+                pass
+        return counters, histograms, values
+
+    def render(self):
+        # Prometheus 文本格式
+        counters, histograms, gauges = self.snapshot()
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            declare(name, "counter")
+            lines.append(f"{name}{format_labels(labels)} {value}")
+        for (name, labels), h in histograms:
+            declare(name, "histogram")
+            cumulative = 0
+            for bound, n in zip(h.buckets + (float('inf'),), h.counts):
+                cumulative += n
+                le = "+Inf" if bound == float('inf') else repr(bound)
+                lines.append(f"{name}_bucket{format_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{format_labels(labels)} {h.sum!r}")
+            lines.append(f"{name}_count{format_labels(labels)} {h.count}")
+        for name, value in gauges:
+            declare(name, "gauge")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+metrics = Metrics()
+
+class LogLock:
+    # 日志读写锁。进程内多读单写、写者优先，统计和导出读取快照时追加照常进行；
+    # 进程间在锁文件上用 fcntl.flock 加建议锁（第一个读者加共享锁、最后一个读者释放，写者加排他锁），
+    # 同时运行的另一个程序副本也遵守同一把锁
+    def __init__(self, path):
+        self.path = path
+        self.cond = threading.Condition(threading.Lock())
+        self.readers = 0
+        self.writing = False
+        self.waiting_writers = 0
+        # 持有锁的线程，卡顿报告里用来找出是谁占着锁
+        self.writer_thread = None
+        self.reader_threads = Counter()
+        # 保护锁文件句柄和进程内持有共享锁的读者数
+        self.os_lock = threading.Lock()
+        self.os_readers = 0
+        self.fd = None
+
+    def _flock(self, exclusive, mode):
+        if fcntl is None:
+            return
+        if self.fd is None:
+            self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        operation = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        try:
+            fcntl.flock(self.fd, operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            metrics.inc("worklog_lock_contended_total", (('mode', mode), ('scope', 'process')))
+            fcntl.flock(self.fd, operation)
+
+    def _funlock(self):
+        if self.fd is not None:
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+
+    def _acquire_read(self):
+        with self.cond:
+            if self.writing or self.waiting_writers:
+                metrics.inc("worklog_lock_contended_total", (('mode', 'read'), ('scope', 'thread')))
+                while self.writing or self.waiting_writers:
+                    self.cond.wait()
+            self.readers += 1
+            self.reader_threads[threading.get_ident()] += 1
+        try:
+            with self.os_lock:
+                if self.os_readers == 0:
+                    self._flock(False, 'read')
+                self.os_readers += 1
+        except BaseException:
+            self._release_read(False)
+            raise
+
+    def _release_read(self, os_locked=True):
+        if os_locked:
+            with self.os_lock:
+                self.os_readers -= 1
+                if self.os_readers == 0:
+                    self._funlock()
+        with self.cond:
+            self.readers -= 1
+            ident = threading.get_ident()
+            self.reader_threads[ident] -= 1
+            if self.reader_threads[ident] <= 0:
+                del self.reader_threads[ident]
+            if self.readers == 0:
+                self.cond.notify_all()
+
+    def _acquire_write(self):
+        with self.cond:
+            if self.writing or self.readers:
+                metrics.inc("worklog_lock_contended_total", (('mode', 'write'), ('scope', 'thread')))
+            self.waiting_writers += 1
+            try:
+                while self.writing or self.readers:
+                    self.cond.wait()
+            finally:
+                self.waiting_writers -= 1
+            self.writing = True
+            self.writer_thread = threading.get_ident()
+        try:
+            self._flock(True, 'write')
+        except BaseException:
+            self._release_write(False)
+            raise
+
+    def _release_write(self, os_locked=True):
+        if os_locked:
+            self._funlock()
+        with self.cond:
+            self.writing = False
+            self.writer_thread = None
+            self.cond.notify_all()
+
+    def owners(self):
+        # 本进程内持有锁的线程 [(模式, 线程 id)] 和等待中的写者数；其他进程持有的文件锁看不到
+        with self.cond:
+            owners = [('write', self.writer_thread)] if self.writing else []
+            owners += [('read', ident) for ident in self.reader_threads]
+            return owners, self.waiting_writers
+
+    @contextmanager
+    def read(self):
+        yield from self._hold('read', self._acquire_read, self._release_read)
+
+    @contextmanager
+    def write(self):
+        yield from self._hold('write', self._acquire_write, self._release_write)
+
+    def _hold(self, mode, acquire, release):
+        labels = (('mode', mode),)
+        start = time.perf_counter()
+        acquire()
+        acquired = time.perf_counter()
+        metrics.observe("worklog_lock_wait_seconds", acquired - start, labels)
+        try:
+            yield
+        finally:
+            release()
+            metrics.observe("worklog_lock_hold_seconds", time.perf_counter() - acquired, labels)
+
+    def close(self):
+        with self.os_lock:
+            if self.fd is not None and self.os_readers == 0:
+                os.close(self.fd)
+                self.fd = None
+
+LOG_HEADER = ['时间', '工作类别', '工作内容']
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+# 只允许撤销该秒数内的记录
+UNDO_WINDOW = 60
+
+CATEGORIES = [
+    "电脑硬件维修", "电脑软件维修类", "打印机维护", "网络设备维护",
+    "安防设备维护", "服务器维护", "硬件测试", "软件测试",
+    "OA后台业务维护", "ERP维护", "PLM维护", "CRM维护", "加密系统维护",
+    "SMB维护", "云平台业务维护", "电话系统维护", "投影仪维修调试",
+    "音响维修调试", "电路维修调试", "咨询服务", "系统重装", "食堂打卡机", "立库维护", "其他"
+]
 
 # HTML 模板
 LOGIN_TEMPLATE = """
@@ -45,6 +353,7 @@ LOGIN_TEMPLATE = """
         <div class="error">{{ error }}</div>
         {% endif %}
         <form method="post">
+            <input type="text" name="name" placeholder="姓名" value="{{ name }}" maxlength="32" required>
             <input type="password" name="password" placeholder="密码" required>
             <button type="submit">登录</button>
         </form>
@@ -76,16 +385,263 @@ HTML_TEMPLATE = """
         .modal-content { background-color: white; margin: 20% auto; padding: 20px; width: 80%; max-width: 400px; border-radius: 8px; }
         textarea { width: 100%; height: 100px; margin: 10px 0; padding: 8px; box-sizing: border-box; border: 1px solid #ddd; border-radius: 4px; }
         .modal-btns { display: flex; justify-content: flex-end; gap: 10px; }
+        .live { list-style: none; padding: 0; margin: 0; }
+        .live li { background-color: white; border-radius: 6px; padding: 8px 10px; margin-bottom: 6px; font-size: 13px; color: #333; }
+        .live .time { color: #888; margin-right: 6px; }
     </style>
     <script>
-        function closeSuccessModal() {
-            document.getElementById('successModal').style.display = 'none';
+        // 页面本身是预渲染的静态内容，记录/撤销结果通过浮层显示，不再整页重新渲染
+        function showResult(ok, text) {
+            var icon = document.getElementById('resultIcon');
+            icon.textContent = ok ? '✓' : '✗';
+            icon.style.color = ok ? '#28a745' : '#dc3545';
+            document.getElementById('resultText').textContent = text;
+            document.getElementById('resultModal').style.display = 'flex';
+        }
+
+        function closeResultModal() {
+            document.getElementById('resultModal').style.display = 'none';
+        }
+
+        function submitForm(event, form) {
+            event.preventDefault();
+            fetch(form.action, {
+                method: 'POST',
+                body: new FormData(form),
+                headers: {'Accept': 'application/json'},
+                credentials: 'same-origin'
+            }).then(function (response) {
+                if (response.status === 401) {
+                    location.href = '/login';
+                    return null;
+                }
+                return response.json();
+            }).then(function (data) {
+                if (data) {
+                    closeOtherDialog();
+                    form.reset();
+                    showResult(data.ok, data.message);
+                }
+            }).catch(function () {
+                form.submit();
+            });
+            return false;
+        }
+
+        // 离线队列：记录先存入 localStorage，再按批提交到 /api/logs，断网时保留在手机上，联网后自动补传
+        var QUEUE_KEY = 'worklog-queue';
+        var BATCH_SIZE = 200;
+        var inFlight = {};
+        var flushing = false;
+
+        function loadQueue() {
+            try {
+                return JSON.parse(localStorage.getItem(QUEUE_KEY)) || [];
+            } catch (e) {
+                return [];
+            }
+        }
+
+        function saveQueue(queue) {
+            localStorage.setItem(QUEUE_KEY, JSON.stringify(queue));
+            var pending = document.getElementById('pending');
+            pending.textContent = queue.length ? queue.length + ' 条记录待同步' : '';
+        }
+
+        function queueEntry(event, form) {
+            event.preventDefault();
+            var data = new FormData(form);
+            var queue = loadQueue();
+            queue.push({
+                id: Date.now().toString(36) + Math.random().toString(36).slice(2),
+                // 毫秒时间戳与时区无关，服务器换算成电脑的本地时间
+                time: Date.now(),
+                category: data.get('category'),
+                content: data.get('content') || ''
+            });
+            saveQueue(queue);
+            closeOtherDialog();
+            form.reset();
+            flushQueue(true);
+            return false;
+        }
+
+        function flushQueue(report) {
+            var queue = loadQueue();
+            if (flushing) {
+                if (report) {
+                    showResult(true, '已保存，等待同步');
+                }
+                return;
+            }
+            if (queue.length === 0) {
+                return;
+            }
+            flushing = true;
+            var batch = queue.slice(0, BATCH_SIZE);
+            batch.forEach(function (entry) { inFlight[entry.id] = true; });
+            fetch('/api/logs', {
+                method: 'POST',
+                // sent 是手机即将发送时的时钟，服务器据此校正手机时钟的偏差
+                body: JSON.stringify({entries: batch, sent: Date.now()}),
+                headers: {'Content-Type': 'application/json', 'Accept': 'application/json'},
+                credentials: 'same-origin'
+            }).then(function (response) {
+                if (response.status === 401) {
+                    location.href = '/login';
+                }
+                if (!response.ok) {
+                    throw new Error(response.status);
+                }
+                return response.json();
+            }).then(function (data) {
+                saveQueue(loadQueue().filter(function (entry) { return !inFlight[entry.id]; }));
+                inFlight = {};
+                flushing = false;
+                if (report) {
+                    if (data.rejected && data.rejected.length) {
+                        showResult(false, '有 ' + data.rejected.length + ' 条记录格式错误，已丢弃');
+                    } else {
+                        showResult(true, '记录成功！');
+                    }
+                }
+                if (loadQueue().length) {
+                    flushQueue(false);
+                }
+            }).catch(function () {
+                inFlight = {};
+                flushing = false;
+                if (report) {
+                    showResult(true, '网络不可用，已暂存在手机上 (' + loadQueue().length + ' 条待同步)');
+                }
+            });
+        }
+
+        function undoLast(event, form) {
+            // 还没同步的记录直接从手机队列里撤销
+            var queue = loadQueue();
+            if (queue.length && !inFlight[queue[queue.length - 1].id]) {
+                event.preventDefault();
+                queue.pop();
+                saveQueue(queue);
+                showResult(true, '撤销成功！');
+                return false;
+            }
+            // 最后一条还在提交中时，服务器上的最后一条是再之前的记录，不能让服务器撤销
+            if (flushing) {
+                event.preventDefault();
+                showResult(false, '上一条记录正在同步，请稍后再撤销');
+                return false;
+            }
+            return submitForm(event, form);
+        }
+
+        // 实时推送：所有设备和电脑上的新记录都显示在 最新记录 里，撤销的记录随之移除
+        var LIVE_LIMIT = 10;
+
+        function liveItem(row) {
+            var li = document.createElement('li');
+            li.dataset.key = row[0] + '|' + row[1] + '|' + (row[2] || '');
+            var time = document.createElement('span');
+            time.className = 'time';
+            time.textContent = row[0].slice(11);
+            li.appendChild(time);
+            li.appendChild(document.createTextNode((row[3] ? row[3] + ' · ' : '') + row[1] + (row[2] ? '：' + row[2] : '')));
+            return li;
         }
 
-        function closeUndoSuccessModal() {
-            document.getElementById('undoSuccessModal').style.display = 'none';
+        function loadRecent() {
+            // 先用 /recent 填上今天已有的记录，再开始接收实时推送
+            if (!window.fetch) {
+                listenEvents();
+                return;
+            }
+            fetch('/recent', {
+                headers: {'Accept': 'application/json'},
+                credentials: 'same-origin'
+            }).then(function (response) {
+                return response.ok ? response.json() : null;
+            }).then(function (data) {
+                if (data && data.rows.length) {
+                    var list = document.getElementById('live');
+                    data.rows.slice(0, LIVE_LIMIT).forEach(function (row) {
+                        list.appendChild(liveItem(row));
+                    });
+                    document.getElementById('liveBox').style.display = 'block';
+                }
+            }).catch(function () {}).then(listenEvents);
         }
 
+        function listenEvents() {
+            if (!window.EventSource) {
+                return;
+            }
+            var list = document.getElementById('live');
+            var source = new EventSource('/events');
+            source.addEventListener('append', function (event) {
+                JSON.parse(event.data).forEach(function (row) {
+                    list.insertBefore(liveItem(row), list.firstChild);
+                });
+                while (list.children.length > LIVE_LIMIT) {
+                    list.removeChild(list.lastChild);
+                }
+                document.getElementById('liveBox').style.display = 'block';
+            });
+            source.addEventListener('undo', function (event) {
+                JSON.parse(event.data).forEach(function (row) {
+                    var key = row[0] + '|' + row[1] + '|' + (row[2] || '');
+                    for (var i = 0; i < list.children.length; i++) {
+                        if (list.children[i].dataset.key === key) {
+                            list.removeChild(list.children[i]);
+                            break;
+                        }
+                    }
+                });
+            });
+        }
+
+        function toggleStats() {
+            // 浏览器按 ETag 重新验证，统计没有变化时服务器只回 304
+            var box = document.getElementById('statsBox');
+            if (box.style.display === 'block') {
+                box.style.display = 'none';
+                return;
+            }
+            fetch('/api/stats', {
+                headers: {'Accept': 'application/json'},
+                credentials: 'same-origin'
+            }).then(function (response) {
+                if (response.status === 401) {
+                    location.href = '/login';
+                    return null;
+                }
+                return response.json();
+            }).then(function (data) {
+                if (!data) {
+                    return;
+                }
+                if (!data.ok) {
+                    showResult(false, data.message);
+                    return;
+                }
+                var list = document.getElementById('stats');
+                list.innerHTML = '';
+                document.getElementById('statsTitle').textContent =
+                    data.start + ' 至 ' + data.end + '，共 ' + data.total + ' 条';
+                data.counts.forEach(function (item) {
+                    var li = document.createElement('li');
+                    li.textContent = item.category + '：' + item.count;
+                    list.appendChild(li);
+                });
+                box.style.display = 'block';
+            }).catch(function () {
+                showResult(false, '网络不可用，无法读取统计');
+            });
+        }
+
+        window.addEventListener('online', function () { flushQueue(false); });
+        setInterval(function () { flushQueue(false); }, 30000);
+
         function openOtherDialog() {
             document.getElementById('otherModal').style.display = 'block';
         }
@@ -93,39 +649,41 @@ HTML_TEMPLATE = """
         function closeOtherDialog() {
             document.getElementById('otherModal').style.display = 'none';
         }
+
+        window.addEventListener('load', function () {
+            // 不支持 fetch 时表单直接提交，服务器重定向回 /#saved 等锚点
+            var hash = decodeURIComponent(location.hash.slice(1));
+            if (hash === 'saved') {
+                showResult(true, '记录成功！');
+            } else if (hash === 'undone') {
+                showResult(true, '撤销成功！');
+            } else if (hash.indexOf('error=') === 0) {
+                showResult(false, hash.slice(6));
+            }
+            if (hash) {
+                history.replaceState(null, '', location.pathname);
+            }
+            saveQueue(loadQueue());
+            flushQueue(false);
+            loadRecent();
+        });
     </script>
 </head>
 <body>
     <div class="container">
         <h2>点击记录工作</h2>
-        
-        {% if success %}
-        <div id="successModal" class="success-modal" style="display: flex;">
-            <div class="success-content">
-                <div class="success-icon">✓</div>
-                <h3>记录成功！</h3>
-                <button class="success-btn" onclick="closeSuccessModal()">确定</button>
-            </div>
-        </div>
-        {% endif %}
 
-        {% if undo_success %}
-        <div id="undoSuccessModal" class="success-modal" style="display: flex;">
+        <div id="resultModal" class="success-modal">
             <div class="success-content">
-                <div class="success-icon">✓</div>
-                <h3>撤销成功！</h3>
-                <button class="success-btn" onclick="closeUndoSuccessModal()">确定</button>
+                <div id="resultIcon" class="success-icon">✓</div>
+                <h3 id="resultText">记录成功！</h3>
+                <button class="success-btn" onclick="closeResultModal()">确定</button>
             </div>
         </div>
-        {% endif %}
-
-        {% if undo_error %}
-        <div class="error" style="text-align: center; margin-bottom: 20px; color: red;">{{ undo_error }}</div>
-        {% endif %}
         
         <div class="grid">
             {% for category in categories %}
-            <form method="post" action="/" style="display: contents;">
+            <form method="post" action="/" style="display: contents;" onsubmit="return queueEntry(event, this)">
                 <input type="hidden" name="category" value="{{ category }}">
                 {% if category == '其他' %}
                 <div class="btn btn-other" onclick="openOtherDialog()">{{ category }}</div>
@@ -135,18 +693,36 @@ HTML_TEMPLATE = """
             </form>
             {% endfor %}
         </div>
+
+        <div id="pending" style="text-align: center; color: #fd7e14; margin-top: 10px;"></div>
         
         <div style="margin-top: 20px;">
-            <form method="post" action="/undo">
+            <form method="post" action="/undo" onsubmit="return undoLast(event, this)">
                  <button type="submit" class="btn" style="width: 100%; background-color: #dc3545; color: white; font-weight: bold;">撤销上一条 (1分钟内)</button>
             </form>
         </div>
+
+        <div id="liveBox" style="display: none; margin-top: 20px;">
+            <h3 style="color: #333; font-size: 15px;">最新记录</h3>
+            <ul id="live" class="live"></ul>
+        </div>
+
+        <div style="text-align: center; margin-top: 15px;">
+            <a href="/recent" style="color: #007bff; text-decoration: none;">查看今天的全部记录</a>
+            <span style="color: #ccc; margin: 0 8px;">|</span>
+            <a href="#" onclick="toggleStats(); return false;" style="color: #007bff; text-decoration: none;">本月统计</a>
+        </div>
+
+        <div id="statsBox" style="display: none; margin-top: 15px;">
+            <h3 id="statsTitle" style="color: #333; font-size: 15px;"></h3>
+            <ul id="stats" class="live"></ul>
+        </div>
     </div>
 
     <div id="otherModal" class="modal">
         <div class="modal-content">
             <h3>输入工作内容</h3>
-            <form method="post" action="/">
+            <form method="post" action="/" onsubmit="return queueEntry(event, this)">
                 <input type="hidden" name="category" value="其他">
                 <textarea name="content" placeholder="请输入具体工作内容..." required></textarea>
                 <div class="modal-btns">
@@ -160,102 +736,2971 @@ HTML_TEMPLATE = """
 </html>
 """
 
+RECENT_TEMPLATE = """
+<!DOCTYPE html>
+<html>
+<head>
+    <meta name="viewport" content="width=device-width, initial-scale=1">
+    <title>工作日志 - 今天的记录</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 0; padding: 20px; background-color: #f0f2f5; }
+        .container { max-width: 600px; margin: 0 auto; }
+        h2 { text-align: center; color: #333; }
+        .back { display: block; text-align: center; color: #007bff; margin-bottom: 15px; text-decoration: none; }
+        .error { color: red; text-align: center; margin-bottom: 10px; }
+        .empty { text-align: center; color: #888; }
+        .live { list-style: none; padding: 0; margin: 0; }
+        .live li { background-color: white; border-radius: 6px; padding: 8px 10px; margin-bottom: 6px; font-size: 13px; color: #333; white-space: pre-wrap; }
+        .live .time { color: #888; margin-right: 6px; }
+    </style>
+</head>
+<body>
+    <div class="container">
+        <h2>{{ user }} 今天的记录 ({{ rows|length }} 条)</h2>
+        <a class="back" href="/">返回记录</a>
+        <a class="back" href="/logout">切换用户</a>
+        {% if error %}
+        <div class="error">{{ error }}</div>
+        {% elif not rows %}
+        <div class="empty">今天还没有记录</div>
+        {% endif %}
+        <ul class="live">
+            {% for row in rows %}
+            <li><span class="time">{{ row[0][11:] }}</span>{{ row[1] }}{% if row[2] %}：{{ row[2] }}{% endif %}</li>
+            {% endfor %}
+        </ul>
+        {% if rows|length >= limit %}
+        <div class="empty">只显示最近的 {{ limit }} 条</div>
+        {% endif %}
+    </div>
+</body>
+</html>
+"""
+
+class UndoError(Exception):
+    pass
+
+class LogChangedError(Exception):
+    pass
+
+def find_last_record(f, size, block_size=4096):
+    # 从文件末尾向前查找最后一条记录的起始偏移，只读取最后一条记录所在的字节。
+    # 引号外的换行才是记录分隔符：某个换行之后到文件末尾的引号数为偶数时，它就在引号外。
+    # 返回 None 表示文件中只有表头
+    read_size = block_size
+    while True:
+        start = max(0, size - read_size)
+        f.seek(start)
+        tail = f.read(size - start).rstrip(b'\r\n')
+        quotes = 0
+        pos = len(tail)
+        while True:
+            nl = tail.rfind(b'\n', 0, pos)
+            if nl < 0:
+                break
+            quotes += tail.count(b'"', nl + 1, pos)
+            if quotes % 2 == 0:
+                return start + nl + 1
+            pos = nl
+        if start == 0:
+            return None
+        read_size *= 2
+
+def iter_records_reverse(buf, begin, end):
+    # 从 end 往前逐条产出 (偏移, 记录字节)，begin 是第一条记录的起点（表头之后）。
+    # buf 通常是 mmap，rfind 从末尾往回找，只会访问最后几条记录所在的页；判断分隔符的方法同 find_last_record
+    while end > begin:
+        pos = end
+        while pos > begin and buf[pos - 1] in b'\r\n':
+            pos -= 1
+        last = pos
+        quotes = 0
+        while True:
+            nl = buf.rfind(b'\n', begin, pos)
+            if nl < 0:
+                start = begin
+                break
+            quotes += buf[nl + 1:pos].count(b'"')
+            if quotes % 2 == 0:
+                start = nl + 1
+                break
+            pos = nl
+        if last > start:
+            yield start, buf[start:end]
+        end = start
+
+# 最近记录最多往回读取的条数
+TAIL_LIMIT = 200
+
+def take_recent(rows, limit, since=None):
+    # rows 从新到旧，最多看 limit 条；since 为 'YYYY-MM-DD' 时只保留这一天及之后的记录。
+    # 手机离线补传的旧记录可能排在今天的记录之后，所以遇到更早的记录不提前结束
+    recent = []
+    for row in islice(rows, limit):
+        if len(row) >= 2 and (since is None or row[0][:10] >= since):
+            recent.append((row + [''])[:3])
+    return recent
+
+class BoundedReader(io.RawIOBase):
+    # 只读到文件的前 limit 个字节，用于在不持有锁的情况下读取某一时刻的快照
+    def __init__(self, f, limit):
+        self.f = f
+        self.remaining = limit
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = min(len(buffer), self.remaining)
+        if n <= 0:
+            return 0
+        data = self.f.read(n)
+        buffer[:len(data)] = data
+        self.remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self.f.close()
+        super().close()
+
+def next_day(day):
+    return (datetime.strptime(day, '%Y-%m-%d') + timedelta(days=1)).strftime('%Y-%m-%d')
+
+# 固定格式 "%Y-%m-%d %H:%M:%S" 的快速解析，按字符串切片取整数，不经过 strptime。
+# 天数从 1970-01-01 起算，epoch 秒按本地时间直接换算，不涉及时区
+_DAYS_IN_MONTH = (0, 31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+
+def days_from_civil(y, m, d):
+    y -= m <= 2
+    era = y // 400
+    yoe = y - era * 400
+    doy = (153 * (m + (-3 if m > 2 else 9)) + 2) // 5 + d - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+def civil_from_days(z):
+    z += 719468
+    era = z // 146097
+    doe = z - era * 146097
+    yoe = (doe - doe // 1460 + doe // 36524 - doe // 146096) // 365
+    doy = doe - (365 * yoe + yoe // 4 - yoe // 100)
+    mp = (5 * doy + 2) // 153
+    d = doy - (153 * mp + 2) // 5 + 1
+    m = mp + 3 if mp < 10 else mp - 9
+    return yoe + era * 400 + (m <= 2), m, d
+
+@lru_cache(maxsize=8192)
+def parse_day(s):
+    # 'YYYY-MM-DD' -> 天数；同一天的记录很多，结果缓存后每行只剩一次字典查找
+    if len(s) != 10 or s[4] != '-' or s[7] != '-' or not (s[0:4] + s[5:7] + s[8:10]).isdigit():
+        raise ValueError(f"无效日期: {s}")
+    y, m, d = int(s[0:4]), int(s[5:7]), int(s[8:10])
+    leap = m == 2 and y % 4 == 0 and (y % 100 != 0 or y % 400 == 0)
+    if not 1 <= m <= 12 or not 1 <= d <= _DAYS_IN_MONTH[m] + leap:
+        raise ValueError(f"无效日期: {s}")
+    return days_from_civil(y, m, d)
+
+def parse_seconds(s):
+    # 'YYYY-MM-DD HH:MM:SS' 的时间部分 -> 当天秒数
+    if len(s) != 19 or s[10] != ' ':
+        raise ValueError(f"无效时间: {s}")
+    return parse_clock(s[11:])
+
+@lru_cache(maxsize=1 << 17)
+def parse_clock(s):
+    # 'HH:MM:SS' -> 秒数；一天只有 86400 个取值，全部缓存
+    if s[2] != ':' or s[5] != ':' or not (s[0:2] + s[3:5] + s[6:8]).isdigit():
+        raise ValueError(f"无效时间: {s}")
+    hh, mm, ss = int(s[0:2]), int(s[3:5]), int(s[6:8])
+    if not (hh < 24 and mm < 60 and ss < 60):
+        raise ValueError(f"无效时间: {s}")
+    return hh * 3600 + mm * 60 + ss
+
+def parse_timestamp(s):
+    return parse_day(s[:10]) * 86400 + parse_seconds(s)
+
+def day_string(day):
+    y, m, d = civil_from_days(day)
+    return f"{y:04d}-{m:02d}-{d:02d}"
+
+def scan_chunk(rows):
+    # 一次遍历把一批记录转换成紧凑数组：epoch 秒、天数、类别，时间无法解析的行跳过
+    epochs = array('q')
+    days = array('l')
+    categories = []
+    for row in rows:
+        try:
+            s = row[0]
+            day = parse_day(s[:10])
+            epoch = day * 86400 + parse_seconds(s)
+            category = row[1]
+        except (ValueError, IndexError):
+            continue
+        epochs.append(epoch)
+        days.append(day)
+        categories.append(category)
+    return epochs, days, categories
+
+def iter_chunks(rows, size=65536):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+ROLLUP_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS rollup (
+        day TEXT NOT NULL,
+        category TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (day, category)
+    ) WITHOUT ROWID;
+    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+ROLLUP_COUNTS_SQL = "SELECT category, SUM(count) FROM rollup WHERE day BETWEEN ? AND ? GROUP BY category"
+
+ROLLUP_INCREMENT_SQL = """
+    INSERT INTO rollup (day, category, count) VALUES (?, ?, ?)
+    ON CONFLICT(day, category) DO UPDATE SET count = count + excluded.count
+"""
+
+def iter_rollup_counts(db_path, start, end, step=31):
+    # 在同一个读事务里按段查询汇总表：整个过程看到同一个快照，段与段之间可以汇报进度或取消。
+    # 读连接独立于写连接，WAL 模式下读者从不阻塞写者
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        conn.execute("BEGIN")
+        if not start or not end:
+            # 未指定的边界取汇总表中最早/最晚的日期
+            first, last = conn.execute("SELECT MIN(day), MAX(day) FROM rollup WHERE day GLOB '[0-9]*'").fetchone()
+            if first is None:
+                return
+            start, end = start or first, end or last
+        lo, hi = parse_day(start), parse_day(end)
+        day = lo
+        while day <= hi:
+            chunk_end = min(day + step - 1, hi)
+            counts = dict(conn.execute(ROLLUP_COUNTS_SQL, (day_string(day), day_string(chunk_end))).fetchall())
+            yield chunk_end - lo + 1, hi - lo + 1, counts
+            day = chunk_end + 1
+    finally:
+        conn.close()
+
+def merge_counts(chunks):
+    total = Counter()
+    for _, _, counts in chunks:
+        total.update(counts)
+    return dict(total)
+
+class SidecarStore:
+    # CSV 后端旁边的 sqlite 文件，保存由日志推导出来的数据。
+    # source 记录对应的日志文件大小和修改时间，不一致说明日志被外部修改过，需要重建
+    SCHEMA = ""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.conn:
+            self.conn.executescript(self.SCHEMA)
+
+    def source(self):
+        with self.lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+        return row[0] if row else None
+
+    def _set_source(self, source):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('source', ?)", (source,))
+
+    def set_source(self, source):
+        # 日志文件换了存放形式但内容不变（例如压缩归档）时只更新 source
+        with self.lock, self.conn:
+            self._set_source(source)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class RollupStore(SidecarStore):
+    # 按 日期×类别 汇总的次数表，CSV 后端用它代替每次全量扫描
+    SCHEMA = ROLLUP_SCHEMA
+
+    def add(self, counts, source, sign=1):
+        # counts: {(day, category): n}
+        with self.lock, self.conn:
+            self.conn.executemany(ROLLUP_INCREMENT_SQL,
+                                  [(day, category, sign * n) for (day, category), n in counts.items()])
+            self.conn.execute("DELETE FROM rollup WHERE count <= 0")
+            self._set_source(source)
+
+    def rebuild(self, counts, source):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM rollup")
+            self.conn.executemany("INSERT INTO rollup (day, category, count) VALUES (?, ?, ?)",
+                                  [(day, category, n) for (day, category), n in counts.items()])
+            self._set_source(source)
+
+    def iter_category_counts(self, start, end):
+        return iter_rollup_counts(self.path, start, end)
+
+# 全文搜索：中文按单字和相邻两字切分，字母数字按整词，全角转半角、不区分大小写。
+# 只索引有工作内容的记录，类别名称一起索引，查询 "打印机 卡纸" 要求每个词都出现
+_CJK = "\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff"
+_SEARCH_TOKEN_RE = re.compile(f"[{_CJK}]+|[0-9a-z]+")
+_CJK_RE = re.compile(f"[{_CJK}]")
+
+SEARCH_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS search_postings (
+        token TEXT NOT NULL,
+        doc INTEGER NOT NULL,
+        PRIMARY KEY (token, doc)
+    ) WITHOUT ROWID;
+"""
+
+SEARCH_DOCS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS search_docs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        time TEXT NOT NULL,
+        category TEXT NOT NULL,
+        content TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+def search_text(text):
+    return unicodedata.normalize('NFKC', text).lower()
+
+def search_tokens(text):
+    tokens = set()
+    for run in _SEARCH_TOKEN_RE.findall(search_text(text)):
+        if _CJK_RE.match(run):
+            tokens.update(run)
+            tokens.update(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            tokens.add(run)
+    return tokens
+
+def row_tokens(row):
+    return search_tokens(row[1] + " " + row[2]) if len(row) > 2 and row[2] else set()
+
+def add_search_postings(conn, docs):
+    # docs: [(文档 id, 记录)]
+    conn.executemany("INSERT OR IGNORE INTO search_postings (token, doc) VALUES (?, ?)",
+                     [(token, doc) for doc, row in docs for token in row_tokens(row)])
+
+def remove_search_postings(conn, doc, row):
+    conn.executemany("DELETE FROM search_postings WHERE token = ? AND doc = ?",
+                     [(token, doc) for token in row_tokens(row)])
+
+def search_rows(conn, table, query, limit):
+    # 倒排表求交集得到候选，再按原文逐词核对（两字切分可能把不相邻的字也匹配上），最新的记录在前
+    terms = [search_text(term) for term in query.split()]
+    clauses, params = [], []
+    for term in terms:
+        for run in _SEARCH_TOKEN_RE.findall(term):
+            if not _CJK_RE.match(run):
+                # 字母数字按前缀匹配
+                clauses.append("SELECT doc FROM search_postings WHERE token >= ? AND token < ?")
+                params += [run, run + "\uffff"]
+            elif len(run) == 1:
+                clauses.append("SELECT doc FROM search_postings WHERE token = ?")
+                params.append(run)
+            else:
+                for i in range(len(run) - 1):
+                    clauses.append("SELECT doc FROM search_postings WHERE token = ?")
+                    params.append(run[i:i + 2])
+    if not clauses:
+        return []
+    results = []
+    for row in conn.execute(f"SELECT time, category, content FROM {table} WHERE id IN "
+                            f"({' INTERSECT '.join(clauses)}) ORDER BY time DESC, id DESC", params):
+        text = search_text(row[1] + " " + row[2])
+        if all(term in text for term in terms):
+            results.append(list(row))
+            if len(results) >= limit:
+                break
+    return results
+
+SEARCH_LIMIT = 500
+
+class SearchStore(SidecarStore):
+    # CSV 后端的全文索引，追加和撤销时与汇总表一起增量更新
+    SCHEMA = SEARCH_SCHEMA + SEARCH_DOCS_SCHEMA
+
+    def _insert(self, rows):
+        docs = []
+        for row in rows:
+            if len(row) > 2 and row[2]:
+                cursor = self.conn.execute("INSERT INTO search_docs (time, category, content) VALUES (?, ?, ?)",
+                                           tuple(row[:3]))
+                docs.append((cursor.lastrowid, row))
+        add_search_postings(self.conn, docs)
+
+    def add(self, rows, source, sign=1):
+        with self.lock, self.conn:
+            if sign > 0:
+                self._insert(rows)
+            else:
+                # 撤销：删除内容相同的最新一条
+                for row in rows:
+                    if len(row) > 2 and row[2]:
+                        found = self.conn.execute(
+                            "SELECT MAX(id) FROM search_docs WHERE time = ? AND category = ? AND content = ?",
+                            tuple(row[:3])).fetchone()
+                        if found[0] is not None:
+                            self.conn.execute("DELETE FROM search_docs WHERE id = ?", (found[0],))
+                            remove_search_postings(self.conn, found[0], row)
+            self._set_source(source)
+
+    def rebuild(self, rows, source):
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM search_docs")
+            self.conn.execute("DELETE FROM search_postings")
+            for chunk in iter_chunks(rows):
+                self._insert(chunk)
+            self._set_source(source)
+
+    def search(self, query, limit):
+        # 独立的读连接，不阻塞写入
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            return search_rows(conn, "search_docs", query, limit)
+        finally:
+            conn.close()
+
+def daily_counts(rows):
+    # 返回 {(日期, 类别): 次数}，按整数天分组，最后才把出现过的天转换回字符串
+    counts = Counter()
+    for chunk in iter_chunks(rows):
+        _, days, categories = scan_chunk(chunk)
+        counts.update(zip(days, categories))
+    return {(day_string(day), category): n for (day, category), n in counts.items()}
+
+def scan_records(f, start, end):
+    # 逐条产出 [start, end) 内的 (偏移, 记录字节)，start 必须是记录的起点。
+    # 与 find_last_record 相同，引号外的换行才是记录分隔符；末尾不完整的记录不产出
+    f.seek(start)
+    offset = pos = start
+    parts = []
+    quotes = 0
+    while pos < end:
+        line = f.readline(end - pos)
+        if not line:
+            break
+        pos += len(line)
+        parts.append(line)
+        quotes += line.count(b'"')
+        if quotes % 2 == 0 and line.endswith(b'\n'):
+            record = b''.join(parts) if len(parts) > 1 else line
+            yield offset, record
+            offset += len(record)
+            parts = []
+            quotes = 0
+
+def read_header(f):
+    # 读取二进制文件开头的表头行（含 BOM）
+    header = f.readline()
+    while header and header.count(b'"') % 2:
+        header += f.readline()
+    return header
+
+def parse_record(data):
+    # 不含引号的记录直接按逗号切分，其余交给 csv 模块
+    text = data.decode('utf-8', 'replace')
+    if '"' not in text:
+        return text.rstrip('\r\n').split(',')
+    return next(csv.reader(io.StringIO(text, newline='')), [])
+
+class RowIndex:
+    # 日志浏览用的行索引：每行只保存记录位置、epoch 秒和类别编码，单元格内容按需从存储读取。
+    # 位置对 CSV 是字节偏移（分区存储在高位放分区号），对 SQLite 是 rowid
+    PART_SHIFT = 40
+
+    def __init__(self):
+        self.refs = array('q')
+        self.times = array('q')
+        self.codes = array('I')
+        self.categories = []
+        self.category_codes = {}
+        # 各文件的增量扫描状态和分区号对应的分区，由存储后端维护
+        self.files = {}
+        self.parts = []
+
+    def __len__(self):
+        return len(self.refs)
+
+    def copy(self):
+        other = RowIndex()
+        other.refs = array('q', self.refs)
+        other.times = array('q', self.times)
+        other.codes = array('I', self.codes)
+        other.categories = list(self.categories)
+        other.category_codes = dict(self.category_codes)
+        other.files = {key: dict(state) for key, state in self.files.items()}
+        other.parts = list(self.parts)
+        return other
+
+    def add(self, ref, row):
+        try:
+            s = row[0]
+            t = parse_day(s[:10]) * 86400 + parse_seconds(s)
+        except (ValueError, IndexError, TypeError):
+            # 时间无法解析的记录排在最早
+            t = 0
+        category = row[1] if len(row) > 1 else ''
+        code = self.category_codes.get(category)
+        if code is None:
+            code = self.category_codes[category] = len(self.categories)
+            self.categories.append(category)
+        self.refs.append(ref)
+        self.times.append(t)
+        self.codes.append(code)
+
+    def remove_refs(self, lo, hi):
+        # 删除位置在 [lo, hi) 内的行，lo 和 hi 属于同一个文件。
+        # 同一文件的行在索引里按位置递增，从末尾向前遇到该文件更早的行就可以停止
+        part = lo >> self.PART_SHIFT
+        positions = []
+        for i in range(len(self.refs) - 1, -1, -1):
+            ref = self.refs[i]
+            if lo <= ref < hi:
+                positions.append(i)
+            elif ref < lo and ref >> self.PART_SHIFT == part:
+                break
+        if not positions:
+            return False
+        if positions[-1] == len(self.refs) - len(positions):
+            # 常见情况：被删的行正好是索引末尾
+            keep = positions[-1]
+            del self.refs[keep:], self.times[keep:], self.codes[keep:]
+        else:
+            drop = set(positions)
+            keep = [i for i in range(len(self.refs)) if i not in drop]
+            self.refs = array('q', map(self.refs.__getitem__, keep))
+            self.times = array('q', map(self.times.__getitem__, keep))
+            self.codes = array('I', map(self.codes.__getitem__, keep))
+        return True
+
+    def remove_parts(self, parts):
+        # 一次遍历删除若干个分区的全部行
+        shift = self.PART_SHIFT
+        mask = array('b', [ref >> shift not in parts for ref in self.refs])
+        if all(mask):
+            return False
+        self.refs = array('q', compress(self.refs, mask))
+        self.times = array('q', compress(self.times, mask))
+        self.codes = array('I', compress(self.codes, mask))
+        return True
+
+def build_view(index, category=None, column=0, descending=True):
+    # 按类别筛选、按时间或类别排序后的行号序列。
+    # 未筛选且时间本来就有序时直接返回 range，不额外占用内存
+    if category is not None:
+        code = index.category_codes.get(category)
+        if code is None:
+            return range(0)
+        rows = array('l', compress(range(len(index)), map(code.__eq__, index.codes)))
+    else:
+        rows = range(len(index))
+
+    times = index.times
+    if column == 1:
+        categories, codes = index.categories, index.codes
+        rows = array('l', sorted(rows, key=lambda i: (categories[codes[i]], times[i])))
+    else:
+        keys = times if isinstance(rows, range) else array('q', map(times.__getitem__, rows))
+        if not all(map(operator.le, keys, islice(keys, 1, None))):
+            rows = array('l', sorted(rows, key=times.__getitem__))
+    return rows[::-1] if descending else rows
+
+# 多维统计：直接在 RowIndex 的 epoch 秒数组和类别编码数组上分组计数。
+# 分组键用 map + operator 在数组上整体计算，Counter 计数也在 C 里完成，逐行不经过 Python 代码
+GROUP_DIMENSIONS = {
+    "category": "工作类别",
+    "user": "人员",
+    "hour": "小时",
+    "weekday": "星期",
+    "week": "ISO周",
+    "month": "月份",
+    "heatmap": "热力图 (星期×小时)",
+}
+
+WEEKDAY_NAMES = ["周一", "周二", "周三", "周四", "周五", "周六", "周日"]
+
+@lru_cache(maxsize=8192)
+def month_label(day):
+    y, m, _ = civil_from_days(day)
+    return f"{y:04d}-{m:02d}"
+
+@lru_cache(maxsize=8192)
+def iso_week_label(day):
+    # ISO 周属于其周四所在的年份；1970-01-01 是周四
+    thursday = day - (day + 3) % 7 + 3
+    year = civil_from_days(thursday)[0]
+    return f"{year:04d}-W{(thursday - days_from_civil(year, 1, 1)) // 7 + 1:02d}"
+
+def index_columns(index, start=None, end=None):
+    # [start, end] 日期范围内的 (epoch 秒, 类别编码) 两列；时间有序时二分定位，否则逐个比较。
+    # 时间无法解析的记录在索引里是 0，不参与统计
+    lo = parse_day(start) * 86400 if start else 1
+    hi = (parse_day(end) + 1) * 86400 if end else 1 << 62
+    times, codes = index.times, index.codes
+    if all(map(operator.le, times, islice(times, 1, None))):
+        i, j = bisect_left(times, lo), bisect_left(times, hi)
+        return times[i:j], codes[i:j]
+    mask = array('b', map(operator.and_, map(lo.__le__, times), map(hi.__gt__, times)))
+    return array('q', compress(times, mask)), array('I', compress(codes, mask))
+
+def pivot_counts(index, dimension, start=None, end=None):
+    # 返回 {(分组键, 类别): 次数}。小时/星期/热力图的键是整数，周和月先按天计数再归并；
+    # 按类别的统计走汇总表，不经过这里
+    times, codes = index_columns(index, start, end)
+    if dimension == "hour":
+        keys = map(operator.floordiv, map(operator.mod, times, repeat(86400)), repeat(3600))
+    elif dimension == "weekday":
+        keys = map(operator.mod, map(operator.add, map(operator.floordiv, times, repeat(86400)), repeat(3)), repeat(7))
+    elif dimension == "heatmap":
+        # 自 epoch 起的小时数 h：星期×24 + 小时 = (h + 72) % 168
+        keys = map(operator.mod, map(operator.add, map(operator.floordiv, times, repeat(3600)), repeat(72)),
+                   repeat(168))
+    else:
+        keys = map(operator.floordiv, times, repeat(86400))
+    counts = Counter(zip(keys, codes))
+    categories = index.categories
+    if dimension in ("hour", "weekday", "heatmap"):
+        return {(key, categories[code]): n for (key, code), n in counts.items()}
+    label = iso_week_label if dimension == "week" else month_label
+    result = Counter()
+    for (day, code), n in counts.items():
+        result[label(day), categories[code]] += n
+    return dict(result)
+
+def stats_delta(rows, dimension, start=None, end=None):
+    # 新增或撤销的几条记录对统计结果的影响，键与按类别统计或 pivot_counts 的结果相同；
+    # 事件里的记录第 4 列是记录人（本机为空）
+    if dimension == "user":
+        delta = Counter()
+        for row in rows:
+            for category, n in stats_delta([row], "category", start, end).items():
+                delta[user_label(row[3] if len(row) > 3 else ""), category] += n
+        return dict(delta)
+    index = RowIndex()
+    for i, row in enumerate(rows):
+        index.add(i, row)
+    if dimension != "category":
+        return pivot_counts(index, dimension, start, end)
+    _, codes = index_columns(index, start, end)
+    return dict(Counter(index.categories[code] for code in codes))
+
+class LogStorage:
+    # 存储后端基类，Qt窗口和Flask路由都通过它读写日志
+    name = ""
+
+    def __init__(self, path):
+        self.path = path
+        # 同一目录下的所有后端共用一个锁文件
+        self.lock = LogLock(os.path.join(os.path.dirname(path), "worklog.lock"))
+
+    def ensure_created(self):
+        pass
+
+    def append(self, time, category, content):
+        self.append_many([(time, category, content)])
+
+    def append_many(self, rows):
+        raise NotImplementedError
+
+    def undo_last(self, max_age=UNDO_WINDOW):
+        raise NotImplementedError
+
+    def category_counts(self, start, end):
+        return merge_counts(self.iter_category_counts(start, end))
+
+    def iter_category_counts(self, start, end):
+        # 逐段产出 (已完成天数, 总天数, {类别: 次数})
+        raise NotImplementedError
+
+    def rebuild_rollups(self):
+        # 重建统计汇总和搜索索引
+        raise NotImplementedError
+
+    def compact(self):
+        # 把旧数据压缩归档，返回压缩的分区数；只有按月分区存储支持
+        return 0
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        # 全文搜索工作内容，返回最新的 limit 条 [时间, 类别, 内容]
+        raise NotImplementedError
+
+    def tail(self, limit=TAIL_LIMIT, since=None):
+        # 按追加顺序从新到旧返回最后 limit 条记录 [时间, 类别, 内容]，只读取日志末尾
+        raise NotImplementedError
+
+    def iter_rows(self, start=None, end=None):
+        raise NotImplementedError
+
+    def update_index(self, index):
+        # 把新增的记录补进 RowIndex，撤销掉的记录从中删除，返回索引是否有变化
+        raise NotImplementedError
+
+    def read_indexed(self, index, refs):
+        # 按 RowIndex 中的位置读取记录，返回 {位置: 记录}
+        raise NotImplementedError
+
+    def sync(self):
+        # 把已写入的记录刷到磁盘
+        pass
+
+    def set_durability(self, durability):
+        # 写线程的落盘策略（DURABILITY_MODES 的键）变化时调用
+        pass
+
+    def disk_usage(self):
+        # 日志数据占用的字节数，不含统计汇总
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def row_count(self):
+        return sum(self.category_counts(None, None).values())
+
+    def close(self):
+        pass
+
+    @staticmethod
+    def check_undoable(row, max_age):
+        if not row:
+            raise UndoError("记录格式错误")
+        try:
+            log_time = datetime.strptime(row[0], TIME_FORMAT)
+        except ValueError:
+            raise UndoError("无法解析记录时间")
+        if (datetime.now() - log_time).total_seconds() > max_age:
+            raise UndoError("只能撤销1分钟内的记录")
+
+def filter_rows(rows, start=None, end=None):
+    lo = parse_day(start) if start else None
+    hi = parse_day(end) if end else None
+    for row in rows:
+        if len(row) < 2:
+            continue
+        if lo is not None or hi is not None:
+            try:
+                day = parse_day(row[0][:10])
+            except ValueError:
+                continue
+            if (lo is not None and day < lo) or (hi is not None and day > hi):
+                continue
+        yield row
+
+# 并行扫描：大于 PARALLEL_SCAN_MIN_BYTES 的 CSV 按记录边界切成若干段，在子进程里解析，
+# 汇总结果在主进程合并。子进程用 spawn 启动，避免 fork 带着 Qt 的线程
+PARALLEL_SCAN_MIN_BYTES = 16 << 20
+PARALLEL_SCAN_CHUNK = 4 << 20
+SCAN_WORKERS = min(os.cpu_count() or 1, 8)
+
+_scan_pool = None
+_scan_pool_lock = threading.Lock()
+# 子进程无法启动（例如打包环境有问题）后不再尝试，之后都在本进程里顺序扫描
+_scan_pool_disabled = False
+
+def scan_pool():
+    global _scan_pool
+    with _scan_pool_lock:
+        if _scan_pool is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            _scan_pool = ProcessPoolExecutor(max_workers=SCAN_WORKERS,
+                                             mp_context=multiprocessing.get_context("spawn"))
+        return _scan_pool
+
+def shutdown_scan_pool():
+    global _scan_pool
+    with _scan_pool_lock:
+        if _scan_pool is not None:
+            _scan_pool.shutdown(wait=False, cancel_futures=True)
+            _scan_pool = None
+
+def disable_scan_pool(error):
+    global _scan_pool_disabled
+    print(f"Parallel scan unavailable, scanning in-process: {error}")
+    _scan_pool_disabled = True
+    shutdown_scan_pool()
+
+def scan_results(func, jobs, prefetch):
+    # 按提交顺序产出 func(*job) 的结果，最多同时提交 prefetch 个；
+    # 进程池坏掉时剩下的段直接在本进程里计算，结果不受影响
+    from concurrent.futures import BrokenExecutor
+    jobs = iter(jobs)
+    pending = deque()
+    try:
+        pool = scan_pool()
+        for job in islice(jobs, prefetch):
+            pending.append((pool.submit(func, *job), job))
+        while pending:
+            future, job = pending.popleft()
+            try:
+                result = future.result()
+            except BrokenExecutor as e:
+                disable_scan_pool(e)
+                for _, job in [(future, job)] + list(pending):
+                    yield func(*job)
+                pending.clear()
+                for job in jobs:
+                    yield func(*job)
+                return
+            for job in islice(jobs, 1):
+                pending.append((pool.submit(func, *job), job))
+            yield result
+    finally:
+        for future, _ in pending:
+            future.cancel()
+
+def split_records(f, begin, end, parts):
+    # 把 [begin, end) 切成大致相等的若干段，每段都从记录起点开始。begin 必须是记录起点（表头之后）。
+    # 引号内的换行不是记录分隔符：数出切分点之前的引号个数，为奇数说明切分点落在引号内，继续往后找
+    bounds = [begin]
+    step = (end - begin) // parts
+    f.seek(begin)
+    pos, quotes = begin, 0
+    for k in range(1, parts):
+        target = begin + k * step
+        while pos < target:
+            block = f.read(min(1 << 20, target - pos))
+            if not block:
+                break
+            quotes += block.count(b'"')
+            pos += len(block)
+        while pos < end:
+            line = f.readline(end - pos)
+            if not line:
+                break
+            pos += len(line)
+            quotes += line.count(b'"')
+            if quotes % 2 == 0 and line.endswith(b'\n'):
+                break
+        if bounds[-1] < pos < end:
+            bounds.append(pos)
+    bounds.append(end)
+    return bounds
+
+def _range_reader(path, start, end):
+    # 段的边界都在换行之后，可以单独解码；BOM 只会出现在表头里
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    return csv.reader(io.StringIO(data.decode('utf-8', 'replace'), newline=''))
+
+def scan_range_counts(path, start, end):
+    # 子进程：一段记录的 {(日期, 类别): 次数}
+    return daily_counts(_range_reader(path, start, end))
+
+def scan_range_rows(path, start, end, lo, hi):
+    # 子进程：一段记录中日期在 [lo, hi] 内的行
+    return list(filter_rows(_range_reader(path, start, end), lo, hi))
+
+def parallel_ranges(path, size, chunk):
+    # 表头之后的记录切成的段；文件不够大或只有一个核时返回 None，由调用方顺序扫描
+    if SCAN_WORKERS < 2 or size < PARALLEL_SCAN_MIN_BYTES or _scan_pool_disabled:
+        return None
+    with open(path, 'rb') as f:
+        begin = len(read_header(f))
+        bounds = split_records(f, begin, size, max(SCAN_WORKERS, (size - begin) // chunk))
+    return list(zip(bounds, bounds[1:]))
+
+def parallel_daily_counts(path, size):
+    ranges = parallel_ranges(path, size, size // (SCAN_WORKERS * 2) + 1)
+    if ranges is None:
+        return None
+    counts = Counter()
+    for partial in scan_results(scan_range_counts, [(path, a, b) for a, b in ranges], len(ranges)):
+        counts.update(partial)
+    return dict(counts)
+
+def parallel_rows(path, size, start=None, end=None):
+    # 按文件顺序产出各段的行；最多预取 SCAN_WORKERS + 1 段，消费慢时不会把整个文件读进内存
+    ranges = parallel_ranges(path, size, PARALLEL_SCAN_CHUNK)
+    if ranges is None:
+        return None
+    jobs = [(path, a, b, start, end) for a, b in ranges]
+    return (row for rows in scan_results(scan_range_rows, jobs, SCAN_WORKERS + 1) for row in rows)
+
+class CsvLogFile:
+    # 单个 CSV 日志文件的读写操作，调用方负责持有写锁（快照读取除外）
+    def __init__(self, path, lock):
+        self.path = path
+        self.lock = lock
+        self._append_file = None
+        self._append_writer = None
+
+    def create_if_missing(self):
+        if not os.path.exists(self.path):
+            with open(self.path, 'w', newline='', encoding='utf-8-sig') as f:
+                csv.writer(f).writerow(LOG_HEADER)
+
+    def source(self):
+        st = os.stat(self.path)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    def _appender(self):
+        # 追加句柄长期保持打开；文件被外部删除后重新创建
+        if self._append_file is None or not os.path.exists(self.path):
+            self.close()
+            self.create_if_missing()
+            self._append_file = open(self.path, 'a', newline='', encoding='utf-8-sig')
+            self._append_writer = csv.writer(self._append_file)
+        return self._append_writer
+
+    def append_rows(self, rows):
+        self._appender().writerows(rows)
+        self._append_file.flush()
+
+    def sync(self):
+        if self._append_file is not None:
+            os.fsync(self._append_file.fileno())
+
+    def pop_last(self, max_age):
+        # 只读取并截掉最后一条记录，耗时与日志大小无关。
+        # 截断是一次原子的元数据操作，之前的内容从不重写，进程被杀也不会留下写了一半的文件
+        if not os.path.exists(self.path):
+            raise UndoError("日志文件不存在")
+
+        with open(self.path, 'r+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            offset = find_last_record(f, size)
+            if offset is None:
+                raise UndoError("没有可撤销的记录")
+
+            f.seek(offset)
+            # 与其他从末尾读取的地方一样容忍损坏的字节，不让撤销因为解码失败而报错
+            text = f.read(size - offset).decode('utf-8', 'replace')
+            last_row = next(csv.reader(io.StringIO(text, newline='')), [])
+            LogStorage.check_undoable(last_row, max_age)
+
+            f.truncate(offset)
+            f.flush()
+            os.fsync(f.fileno())
+        return last_row
+
+    def iter_rows(self, start=None, end=None):
+        # 在读锁内记下当前文件大小和最后一条记录，之后无锁读取到该位置为止。追加不影响快照；
+        # 撤销会截掉快照末尾，之后再追加还会改写这些字节，读到的可能是半条记录或半个字符。
+        # 所以解码不会因此出错，读完后再核对快照是否完整读到、最后一条记录是否还在原处
+        f, size, tail = self._open_snapshot()
+        rows = parallel_rows(self.path, size, start, end)
+        if rows is not None:
+            f.close()
+            try:
+                yield from rows
+            except FileNotFoundError:
+                # 子进程按路径重新打开文件，分区在导出期间被压缩归档时找不到
+                raise LogChangedError("读取期间日志文件被移走，请重新操作")
+            self._check_snapshot(tail)
+            return
+        bounded = BoundedReader(f, size)
+        with io.TextIOWrapper(io.BufferedReader(bounded), encoding='utf-8-sig', errors='replace',
+                              newline='') as text:
+            reader = csv.reader(text)
+            next(reader, None)
+            yield from filter_rows(reader, start, end)
+            if bounded.remaining > 0:
+                raise LogChangedError("读取期间日志被撤销，请重新操作")
+        self._check_snapshot(tail)
+
+    def _open_snapshot(self):
+        # 同 _open_at_size，另外返回最后一条记录的 (偏移, 字节)，只有表头时为 None
+        with self.lock.read():
+            if self._append_file is not None:
+                self._append_file.flush()
+            f = open(self.path, 'rb')
+            size = os.fstat(f.fileno()).st_size
+            offset = find_last_record(f, size)
+            tail = None
+            if offset is not None:
+                f.seek(offset)
+                tail = (offset, f.read(size - offset))
+            f.seek(0)
+            return f, size, tail
+
+    def _check_snapshot(self, tail):
+        if tail is None:
+            return
+        offset, record = tail
+        with self.lock.read():
+            try:
+                with open(self.path, 'rb') as f:
+                    f.seek(offset)
+                    changed = f.read(len(record)) != record
+            except OSError:
+                # 后台压缩把这个月的分区归档后删掉了
+                raise LogChangedError("读取期间日志文件被移走，请重新操作")
+            if changed:
+                raise LogChangedError("读取期间日志被撤销并改写，请重新操作")
+
+    def scan_daily_counts(self):
+        counts = parallel_daily_counts(self.path, os.path.getsize(self.path))
+        return counts if counts is not None else daily_counts(self.scan_rows())
+
+    def scan_rows(self):
+        # 调用方已持有写锁时直接读取整个文件
+        rows = parallel_rows(self.path, os.path.getsize(self.path))
+        if rows is not None:
+            yield from rows
+            return
+        with open(self.path, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            yield from reader
+
+    def iter_reverse(self):
+        # 调用方持有读锁；映射整个文件后从末尾往前逐条产出，耗时只与读取的条数有关
+        if self._append_file is not None:
+            self._append_file.flush()
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            begin = len(read_header(f))
+            size = os.fstat(f.fileno()).st_size
+            if size <= begin:
+                return
+            with mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ) as mm:
+                for _, record in iter_records_reverse(mm, begin, size):
+                    yield parse_record(record)
+
+    def _open_at_size(self):
+        with self.lock.read():
+            if self._append_file is not None:
+                self._append_file.flush()
+            f = open(self.path, 'rb')
+            return f, os.fstat(f.fileno()).st_size
+
+    def update_index(self, index, key, part=0):
+        # 增量扫描：state 记下已索引到的字节数和最后一条记录。
+        # 最后一条记录对不上（例如被其他程序改写）时重新扫描整个文件
+        if not os.path.exists(self.path):
+            return False
+        base = part << RowIndex.PART_SHIFT
+        end = base + (1 << RowIndex.PART_SHIFT)
+        state = index.files.get(key)
+        changed = False
+        f, size = self._open_at_size()
+        with f:
+            if state is not None and size < state['size']:
+                # 文件变短说明发生了撤销，之后可能又有追加：从现在的最后一条记录起重新扫描
+                tail = find_last_record(f, size)
+                if tail is None:
+                    changed = index.remove_refs(base, end)
+                    state = None
+                else:
+                    changed = index.remove_refs(base + tail, end)
+                    state = {'size': tail, 'tail': tail, 'tail_bytes': b''}
+            elif state is not None:
+                f.seek(state['tail'])
+                if f.read(len(state['tail_bytes'])) != state['tail_bytes']:
+                    changed = index.remove_refs(base, end)
+                    state = None
+            if state is None:
+                f.seek(0)
+                header = read_header(f)
+                state = {'size': len(header), 'tail': 0, 'tail_bytes': header}
+            last = None
+            for last in scan_records(f, state['size'], size):
+                index.add(base + last[0], parse_record(last[1]))
+            if last is not None:
+                offset, record = last
+                state = {'size': offset + len(record), 'tail': offset, 'tail_bytes': record}
+                changed = True
+        index.files[key] = state
+        return changed
+
+    def read_records(self, offsets):
+        # 按偏移读取若干条记录，先排序让读取尽量顺序进行
+        records = {}
+        f, size = self._open_at_size()
+        with f:
+            for offset in sorted(offsets):
+                if offset >= size:
+                    continue
+                f.seek(offset)
+                data = f.readline()
+                while data.count(b'"') % 2 and f.tell() < size:
+                    data += f.readline()
+                records[offset] = parse_record(data)
+        return records
+
+    def close(self):
+        if self._append_file is not None:
+            self._append_file.close()
+            self._append_file = None
+            self._append_writer = None
+
+# 压缩归档：按月分区的旧月份整体压缩成 worklog-YYYY-MM.csv.xz（或 .gz），内容仍是带表头的 CSV
+ARCHIVE_CODECS = {"xz": lzma.open, "gz": gzip.open}
+# 最近几个月（含当月）保持为普通 CSV，更早的月份才压缩
+ARCHIVE_KEEP_MONTHS = 3
+
+class ArchiveLogFile:
+    # 压缩归档的分区，只读，按流解压读取；行索引里的位置是解压后的字节偏移。
+    # 归档写好后不再修改，晚到的记录先写进同月份的普通 CSV，下次压缩时合并
+    def __init__(self, path, lock):
+        self.path = path
+        self.lock = lock
+        self.opener = ARCHIVE_CODECS[path.rsplit('.', 1)[1]]
+
+    def source(self):
+        st = os.stat(self.path)
+        return f"{st.st_size}:{st.st_mtime_ns}"
+
+    def open_binary(self):
+        return self.opener(self.path, 'rb')
+
+    def _open_text(self):
+        return io.TextIOWrapper(self.open_binary(), encoding='utf-8-sig', newline='')
+
+    def iter_rows(self, start=None, end=None):
+        with self._open_text() as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            yield from filter_rows(reader, start, end)
+
+    def scan_rows(self):
+        with self._open_text() as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            yield from reader
+
+    def scan_daily_counts(self):
+        return daily_counts(self.scan_rows())
+
+    def iter_reverse(self):
+        # 压缩流不能倒着读，只能整体解压；归档都是旧月份，只有最近几个月记录不够时才会读到
+        yield from reversed(list(self.scan_rows()))
+
+    def update_index(self, index, key, part=0):
+        # 只在归档第一次出现或被合并替换后调用，整体重新扫描
+        base = part << RowIndex.PART_SHIFT
+        if key in index.files:
+            index.remove_parts({part})
+        with self.open_binary() as f:
+            header = read_header(f)
+            for offset, record in scan_records(f, len(header), 1 << RowIndex.PART_SHIFT):
+                index.add(base + offset, parse_record(record))
+        index.files[key] = {}
+        return True
+
+    def read_records(self, offsets):
+        # 偏移排好序后只向前跳转，一次读取最多解压整个归档一遍
+        records = {}
+        with self.open_binary() as f:
+            for offset in sorted(offsets):
+                f.seek(offset)
+                data = f.readline()
+                while data.count(b'"') % 2:
+                    more = f.readline()
+                    if not more:
+                        break
+                    data += more
+                if data:
+                    records[offset] = parse_record(data)
+        return records
+
+    def pop_last(self, max_age):
+        raise UndoError("没有可撤销的记录")
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+class CsvLogStorage(LogStorage):
+    name = "csv"
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.rollup = None
+        self.search_index = None
+        self.file = CsvLogFile(path, self.lock)
+
+    def ensure_created(self):
+        with self.lock.write():
+            self.file.create_if_missing()
+            if self.rollup is None:
+                self.rollup = RollupStore(os.path.splitext(self.path)[0] + "-rollup.db")
+                self.search_index = SearchStore(os.path.splitext(self.path)[0] + "-search.db")
+            if self.rollup.source() != self.file.source():
+                self._rebuild_rollups()
+            if self.search_index.source() != self.file.source():
+                self._rebuild_search()
+
+    def append_many(self, rows):
+        with self.lock.write():
+            self.file.append_rows(rows)
+            source = self.file.source()
+            self.rollup.add(daily_counts(rows), source)
+            self.search_index.add(rows, source)
+
+    def sync(self):
+        with self.lock.write():
+            self.file.sync()
+
+    def undo_last(self, max_age=UNDO_WINDOW):
+        with self.lock.write():
+            last_row = self.file.pop_last(max_age)
+            source = self.file.source()
+            self.rollup.add(daily_counts([last_row]), source, sign=-1)
+            self.search_index.add([last_row], source, sign=-1)
+            return last_row
+
+    def iter_rows(self, start=None, end=None):
+        return self.file.iter_rows(start, end)
+
+    def scan_daily_counts(self):
+        return self.file.scan_daily_counts()
+
+    def update_index(self, index):
+        return self.file.update_index(index, self.path)
+
+    def read_indexed(self, index, refs):
+        return self.file.read_records(refs)
+
+    def _rebuild_rollups(self):
+        self.rollup.rebuild(self.scan_daily_counts(), self.file.source())
+
+    def _rebuild_search(self):
+        self.search_index.rebuild(self.file.scan_rows(), self.file.source())
+
+    def rebuild_rollups(self):
+        with self.lock.write():
+            self._rebuild_rollups()
+            self._rebuild_search()
+
+    def iter_category_counts(self, start, end):
+        return self.rollup.iter_category_counts(start, end)
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        return self.search_index.search(query, limit)
+
+    def tail(self, limit=TAIL_LIMIT, since=None):
+        with self.lock.read(), closing(self.file.iter_reverse()) as rows:
+            return take_recent(rows, limit, since)
+
+    def close(self):
+        with self.lock.write():
+            self.file.close()
+        self.lock.close()
+        if self.rollup is not None:
+            self.rollup.close()
+            self.search_index.close()
+            self.rollup = None
+            self.search_index = None
+
+def partition_key(time_str):
+    # 记录所属的月份分区 'YYYY-MM'，时间无法解析的记录放入 unknown 分区
+    try:
+        parse_day(time_str[:10])
+        return time_str[:7]
+    except (ValueError, TypeError):
+        return "unknown"
+
+class PartitionedCsvStorage(LogStorage):
+    # 按月分区的 CSV：worklog-YYYY-MM.csv。manifest 记录每个分区的最早/最晚时间、行数和文件状态，
+    # 区间查询只打开时间范围有交集的分区，追加和撤销只改动对应的分区
+    name = "partitioned"
+
+    # manifest 中保留最近追加记录所在分区的数量，撤销时据此找到最后一条记录
+    RECENT_LIMIT = 100
+    # 拆分旧日志时每攒够这么多行就写出一次
+    SPLIT_BATCH = 50000
+
+    def __init__(self, log_dir, split_from=None):
+        super().__init__(os.path.join(log_dir, "worklog-manifest.json"))
+        self.log_dir = log_dir
+        self.split_from = split_from
+        # 拆分进行中的标记：写第一个分区之前创建，manifest 落盘之后删除
+        self.split_marker = os.path.join(log_dir, "worklog-partitions.splitting")
+        self.files = {}
+        self.manifest = {'partitions': {}, 'recent': []}
+        self.manifest_stat = None
+        self.rollup = None
+        self.search_index = None
+
+    def partition_path(self, key):
+        # 归档分区的 key 带压缩格式后缀，例如 '2023-05.xz'
+        month, _, codec = key.partition('.')
+        if codec:
+            return os.path.join(self.log_dir, f"worklog-{month}.csv.{codec}")
+        return os.path.join(self.log_dir, f"worklog-{key}.csv")
+
+    def _file(self, key):
+        if key not in self.files:
+            if '.' in key:
+                self.files[key] = ArchiveLogFile(self.partition_path(key), self.lock)
+            else:
+                self.files[key] = CsvLogFile(self.partition_path(key), self.lock)
+        return self.files[key]
+
+    def _manifest_stat(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_size, st.st_mtime_ns, st.st_ino)
+        except OSError:
+            return None
+
+    def _load_manifest(self):
+        self.manifest_stat = self._manifest_stat()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if isinstance(manifest.get('partitions'), dict):
+                manifest.setdefault('recent', [])
+                self.manifest = manifest
+        except (OSError, ValueError):
+            pass
+
+    def _refresh_manifest(self):
+        # 另一个进程写入后 manifest 会被替换，持锁时发现变化就重新加载
+        if self._manifest_stat() != self.manifest_stat:
+            self._load_manifest()
+
+    def _save_manifest(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f, ensure_ascii=False, indent=1)
+            # 先落盘再替换，断电后看到的要么是旧 manifest 要么是完整的新 manifest
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.manifest_stat = self._manifest_stat()
+
+    def _discover_partitions(self):
+        keys = set()
+        for name in os.listdir(self.log_dir):
+            match = re.fullmatch(r"worklog-(\d{4}-\d{2}|unknown)\.csv(?:\.(xz|gz))?", name)
+            if match:
+                keys.add(match.group(1) + (f".{match.group(2)}" if match.group(2) else ""))
+        return keys
+
+    def _scan_partition(self, key):
+        # 重新统计分区的时间范围和行数
+        info = {'min': None, 'max': None, 'rows': 0}
+        for row in self._file(key).scan_rows():
+            if len(row) < 2:
+                continue
+            info['rows'] += 1
+            if not key.startswith("unknown"):
+                if info['min'] is None or row[0] < info['min']:
+                    info['min'] = row[0]
+                if info['max'] is None or row[0] > info['max']:
+                    info['max'] = row[0]
+        if '.' in key:
+            info['codec'] = key.partition('.')[2]
+        info['source'] = self._file(key).source()
+        self.manifest['partitions'][key] = info
+
+    def _split_legacy(self):
+        # 首次启动时把原来的单文件日志按月拆分，原文件保持不变。
+        # 边读边写，每攒够 SPLIT_BATCH 行按分区写出一次，内存占用与日志大小无关
+        with open(self.split_marker, 'w', encoding='utf-8') as f:
+            f.write(self.split_from)
+            f.flush()
+            os.fsync(f.fileno())
+        written = set()
+        groups = {}
+        pending = 0
+        with open(self.split_from, 'r', encoding='utf-8-sig', newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            for row in reader:
+                if len(row) < 2:
+                    continue
+                groups.setdefault(partition_key(row[0]), []).append((row + [''])[:3])
+                pending += 1
+                if pending >= self.SPLIT_BATCH:
+                    for key, rows in groups.items():
+                        self._file(key).append_rows(rows)
+                    written.update(groups)
+                    groups = {}
+                    pending = 0
+        for key, rows in groups.items():
+            self._file(key).append_rows(rows)
+        written.update(groups)
+        for key in written:
+            self._file(key).sync()
+
+    def _update_partition(self, key, rows, sign=1):
+        info = self.manifest['partitions'].setdefault(key, {'min': None, 'max': None, 'rows': 0})
+        info['rows'] += sign * len(rows)
+        if sign > 0 and key != "unknown":
+            # 撤销时不收缩范围：范围只作为裁剪依据，偏大不影响正确性
+            times = [row[0] for row in rows]
+            info['min'] = min([info['min']] + times) if info['min'] else min(times)
+            info['max'] = max([info['max']] + times) if info['max'] else max(times)
+        info['source'] = self._file(key).source()
+
+    def _source(self):
+        partitions = self.manifest['partitions']
+        return hashlib.sha1(json.dumps(sorted((key, info['source']) for key, info in partitions.items()))
+                            .encode('utf-8')).hexdigest()
+
+    def ensure_created(self):
+        with self.lock.write():
+            self._load_manifest()
+            on_disk = self._discover_partitions()
+            if self.split_from and os.path.exists(self.split_from):
+                interrupted = os.path.exists(self.split_marker)
+                if interrupted:
+                    # 标记还在说明上次拆分被中断，拆分期间不会有追加，已有的分区文件都来自那次拆分
+                    for key in on_disk:
+                        handle = self.files.pop(key, None)
+                        if handle is not None:
+                            handle.close()
+                        os.remove(self.partition_path(key))
+                    self.manifest = {'partitions': {}, 'recent': []}
+                if interrupted or (not on_disk and not self.manifest.get('split_from')):
+                    self._split_legacy()
+                    self.manifest['split_from'] = self.split_from
+                    on_disk = self._discover_partitions()
+
+            # manifest 丢失或损坏时按磁盘上的分区文件重建，分区文件从不因 manifest 缺项而删除
+            partitions = self.manifest['partitions']
+            for key in list(partitions):
+                if key not in on_disk:
+                    del partitions[key]
+            for key in on_disk:
+                if key not in partitions or partitions[key].get('source') != self._file(key).source():
+                    self._scan_partition(key)
+            self._save_manifest()
+            if os.path.exists(self.split_marker):
+                os.remove(self.split_marker)
+
+            if self.rollup is None:
+                self.rollup = RollupStore(os.path.join(self.log_dir, "worklog-partitions-rollup.db"))
+                self.search_index = SearchStore(os.path.join(self.log_dir, "worklog-partitions-search.db"))
+            if self.rollup.source() != self._source():
+                self._rebuild_rollups()
+            if self.search_index.source() != self._source():
+                self._rebuild_search()
+
+    def append_many(self, rows):
+        with self.lock.write():
+            self._refresh_manifest()
+            groups = {}
+            for row in rows:
+                groups.setdefault(partition_key(row[0]), []).append(row)
+            for key, group in groups.items():
+                self._file(key).append_rows(group)
+                self._update_partition(key, group)
+            recent = self.manifest['recent']
+            recent.extend(partition_key(row[0]) for row in rows)
+            del recent[:-self.RECENT_LIMIT]
+            self._save_manifest()
+            source = self._source()
+            self.rollup.add(daily_counts(rows), source)
+            self.search_index.add(rows, source)
+
+    def sync(self):
+        with self.lock.write():
+            for f in self.files.values():
+                f.sync()
+
+    def undo_last(self, max_age=UNDO_WINDOW):
+        with self.lock.write():
+            self._refresh_manifest()
+            recent = self.manifest['recent']
+            if recent:
+                key = recent[-1]
+            else:
+                # unknown 分区放的是时间无法解析的记录，不可能是最新的一条
+                keys = sorted(k for k, info in self.manifest['partitions'].items()
+                              if info['rows'] > 0 and '.' not in k and k != "unknown")
+                if not keys:
+                    raise UndoError("没有可撤销的记录")
+                key = keys[-1]
+            last_row = self._file(key).pop_last(max_age)
+            if recent:
+                recent.pop()
+            self._update_partition(key, [last_row], sign=-1)
+            self._save_manifest()
+            source = self._source()
+            self.rollup.add(daily_counts([last_row]), source, sign=-1)
+            self.search_index.add([last_row], source, sign=-1)
+            return last_row
+
+    def disk_usage(self):
+        return sum(os.path.getsize(self.partition_path(key)) for key in list(self.manifest['partitions'])
+                   if os.path.exists(self.partition_path(key)))
+
+    def compact(self, keep_months=ARCHIVE_KEEP_MONTHS, codec="xz"):
+        # 把最近 keep_months 个月以前的分区压缩成归档，返回压缩的分区数。
+        # 压缩在锁外进行，期间追加照常；替换文件时再持写锁确认分区没有变化，有变化就留到下次
+        now = datetime.now()
+        months = now.year * 12 + now.month - keep_months
+        cutoff = f"{months // 12:04d}-{months % 12 + 1:02d}"
+        with self.lock.read():
+            self._refresh_manifest()
+            partitions = dict(self.manifest['partitions'])
+        candidates = [key for key, info in sorted(partitions.items())
+                      if '.' not in key and key != "unknown" and key < cutoff and info['rows'] > 0]
+        compacted = 0
+        for key in candidates:
+            archive_key = f"{key}.{codec}"
+            # 同月份已有的归档（晚到的记录）一起合并进新归档
+            merged = [k for k in partitions if '.' in k and k.partition('.')[0] == key]
+            tmp_path = self.partition_path(archive_key) + ".tmp"
+            f, size = self._file(key)._open_at_size()
+            # 打开后立刻记下文件状态，替换前据此确认压缩期间没有新的追加或撤销
+            st = os.fstat(f.fileno())
+            if st.st_size != size:
+                f.close()
+                continue
+            source = f"{st.st_size}:{st.st_mtime_ns}"
+            try:
+                with f, ARCHIVE_CODECS[codec](tmp_path, 'wb') as out:
+                    header = read_header(f)
+                    for i, k in enumerate(merged):
+                        with self._file(k).open_binary() as src:
+                            if i > 0:
+                                read_header(src)
+                            shutil.copyfileobj(src, out)
+                    if not merged:
+                        out.write(header)
+                    remaining = size - f.tell()
+                    while remaining > 0:
+                        chunk = f.read(min(remaining, 1 << 20))
+                        if not chunk:
+                            break
+                        out.write(chunk)
+                        remaining -= len(chunk)
+            except BaseException:
+                os.remove(tmp_path)
+                raise
+
+            with self.lock.write():
+                self._refresh_manifest()
+                parts = self.manifest['partitions']
+                info = parts.get(key)
+                if (info is None or source != self._file(key).source()
+                        or any(parts.get(k, {}).get('source') != partitions[k].get('source') for k in merged)):
+                    os.remove(tmp_path)
+                    continue
+                os.replace(tmp_path, self.partition_path(archive_key))
+                for k in [key] + merged:
+                    old = parts.pop(k)
+                    handle = self.files.pop(k, None)
+                    if handle is not None:
+                        handle.close()
+                    if k != archive_key:
+                        os.remove(self.partition_path(k))
+                    if k != key:
+                        info = {'min': min(info['min'], old['min']), 'max': max(info['max'], old['max']),
+                                'rows': info['rows'] + old['rows']}
+                parts[archive_key] = {'min': info['min'], 'max': info['max'], 'rows': info['rows'],
+                                      'codec': codec, 'source': self._file(archive_key).source()}
+                # 撤销只针对最近的记录；压缩掉的分区之前的 recent 记录不再可靠，一并丢弃
+                recent = self.manifest['recent']
+                if key in recent:
+                    del recent[:len(recent) - recent[::-1].index(key)]
+                self._save_manifest()
+                # 内容没变，只是存放形式变了，汇总表和搜索索引不需要重建
+                source = self._source()
+                self.rollup.set_source(source)
+                self.search_index.set_source(source)
+                compacted += 1
+        return compacted
+
+    def partitions_for(self, start=None, end=None):
+        # 只返回时间范围与 [start, end] 有交集的分区
+        keys = []
+        for key, info in sorted(self.manifest['partitions'].items()):
+            if start or end:
+                if info['min'] is None:
+                    continue
+                if (start and info['max'][:10] < start) or (end and info['min'][:10] > end):
+                    continue
+            keys.append(key)
+        return keys
+
+    def iter_rows(self, start=None, end=None):
+        with self.lock.read():
+            self._refresh_manifest()
+            keys = self.partitions_for(start, end)
+        for key in keys:
+            yield from self._file(key).iter_rows(start, end)
+
+    def update_index(self, index):
+        # manifest 里记录的文件状态没变的分区直接跳过
+        with self.lock.read():
+            self._refresh_manifest()
+            partitions = {key: info.get('source') for key, info in self.manifest['partitions'].items()}
+        changed = False
+        gone = {part for part, key in enumerate(index.parts) if key not in partitions and key in index.files}
+        if gone:
+            # 被删除或压缩掉的分区一次性移除
+            changed = index.remove_parts(gone)
+            for part in gone:
+                del index.files[index.parts[part]]
+        for key, source in sorted(partitions.items()):
+            if key not in index.parts:
+                index.parts.append(key)
+            if key in index.files and index.files[key].get('source') == source:
+                continue
+            changed = self._file(key).update_index(index, key, index.parts.index(key)) or changed
+            if key in index.files:
+                index.files[key]['source'] = source
+        return changed
+
+    def read_indexed(self, index, refs):
+        mask = (1 << RowIndex.PART_SHIFT) - 1
+        groups = {}
+        for ref in refs:
+            groups.setdefault(ref >> RowIndex.PART_SHIFT, []).append(ref & mask)
+        rows = {}
+        for part, offsets in groups.items():
+            base = part << RowIndex.PART_SHIFT
+            for offset, row in self._file(index.parts[part]).read_records(offsets).items():
+                rows[base + offset] = row
+        return rows
+
+    def scan_daily_counts(self):
+        counts = Counter()
+        for key in self.manifest['partitions']:
+            counts.update(self._file(key).scan_daily_counts())
+        return dict(counts)
+
+    def _rebuild_rollups(self):
+        self.rollup.rebuild(self.scan_daily_counts(), self._source())
+
+    def _rebuild_search(self):
+        rows = (row for key in sorted(self.manifest['partitions']) for row in self._file(key).scan_rows())
+        self.search_index.rebuild(rows, self._source())
+
+    def rebuild_rollups(self):
+        with self.lock.write():
+            self._refresh_manifest()
+            self._rebuild_rollups()
+            self._rebuild_search()
+
+    def iter_category_counts(self, start, end):
+        return self.rollup.iter_category_counts(start, end)
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        return self.search_index.search(query, limit)
+
+    def tail(self, limit=TAIL_LIMIT, since=None):
+        # manifest 的 recent 按追加顺序记着最近记录所在的分区，先照它从各分区末尾依次取，
+        # 再按月份从新到旧接着读；since 之前就结束的分区直接跳过
+        readers = {}
+
+        def reader(key):
+            if key not in readers:
+                readers[key] = self._file(key).iter_reverse()
+            return readers[key]
+
+        def rows():
+            partitions = self.manifest['partitions']
+            for key in reversed(self.manifest['recent']):
+                if key in partitions:
+                    row = next(reader(key), None)
+                    if row is not None:
+                        yield row
+            for key in sorted(partitions, key=lambda k: (k[:7] != "unknown", k[:7], '.' not in k), reverse=True):
+                info = partitions[key]
+                if since and (info['max'] is None or info['max'][:10] < since):
+                    continue
+                yield from reader(key)
+
+        with self.lock.read(), closing(rows()) as feed:
+            self._refresh_manifest()
+            try:
+                return take_recent(feed, limit, since)
+            finally:
+                for r in readers.values():
+                    r.close()
+
+    def close(self):
+        with self.lock.write():
+            for f in self.files.values():
+                f.close()
+        self.lock.close()
+        if self.rollup is not None:
+            self.rollup.close()
+            self.search_index.close()
+            self.rollup = None
+            self.search_index = None
+
+class SqliteLogStorage(LogStorage):
+    # WAL 模式下读不阻塞写，时间+类别的覆盖索引让区间统计变成索引范围扫描
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            time TEXT NOT NULL,
+            category TEXT NOT NULL,
+            content TEXT NOT NULL DEFAULT ''
+        );
+        CREATE INDEX IF NOT EXISTS idx_logs_time_category ON logs(time, category);
+        CREATE INDEX IF NOT EXISTS idx_logs_category_time ON logs(category, time);
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """ + ROLLUP_SCHEMA + """
+        CREATE TRIGGER IF NOT EXISTS logs_rollup_insert AFTER INSERT ON logs BEGIN
+            INSERT INTO rollup (day, category, count) VALUES (substr(NEW.time, 1, 10), NEW.category, 1)
+            ON CONFLICT(day, category) DO UPDATE SET count = count + 1;
+        END;
+        CREATE TRIGGER IF NOT EXISTS logs_rollup_delete AFTER DELETE ON logs BEGIN
+            UPDATE rollup SET count = count - 1 WHERE day = substr(OLD.time, 1, 10) AND category = OLD.category;
+            DELETE FROM rollup WHERE day = substr(OLD.time, 1, 10) AND category = OLD.category AND count <= 0;
+        END;
+    """ + SEARCH_SCHEMA
+
+    def __init__(self, path, migrate_from=None):
+        super().__init__(path)
+        self.migrate_from = migrate_from
+        self.synchronous = "NORMAL"
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+    def _conn(self):
+        # 每个线程一个连接，WAL 允许多个读连接与写连接并发
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        if getattr(self._local, 'synchronous', None) != self.synchronous:
+            conn.execute(f"PRAGMA synchronous={self.synchronous}")
+            self._local.synchronous = self.synchronous
+        return conn
+
+    def set_durability(self, durability):
+        # always 时每次提交都 fsync WAL；其他模式下提交只写入 WAL，由 sync 的检查点落盘。
+        # 各线程的连接在下次使用时切换
+        self.synchronous = "FULL" if durability == "always" else "NORMAL"
+
+    def ensure_created(self):
+        with self.lock.write():
+            conn = self._conn()
+            with conn:
+                conn.executescript(self.SCHEMA)
+            if self.migrate_from:
+                self.migrate_csv(self.migrate_from)
+            # 汇总表由触发器在同一事务里维护；旧库第一次打开时补建一次
+            if not conn.execute("SELECT 1 FROM meta WHERE key = 'rollup_built'").fetchone():
+                self._rebuild_rollups(conn)
+            # 搜索索引需要在 Python 里分词，和记录在同一事务里写入
+            if not conn.execute("SELECT 1 FROM meta WHERE key = 'search_built'").fetchone():
+                self._rebuild_search(conn)
+
+    def migrate_csv(self, csv_path):
+        # 一次性从旧的 worklog.csv 导入，迁移标记写入 meta 表防止重复导入。
+        # 边读边插入，不把整个日志读进内存；newline='' 保留内容里的换行
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'migrated_from_csv'").fetchone():
+            return 0
+        count = 0
+        with conn:
+            if os.path.exists(csv_path):
+                with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
+                    reader = csv.reader(f)
+                    next(reader, None)
+                    rows = ((row[0], row[1], row[2] if len(row) > 2 else '') for row in reader if len(row) >= 2)
+                    count = conn.executemany("INSERT INTO logs (time, category, content) VALUES (?, ?, ?)",
+                                             rows).rowcount
+            conn.execute("INSERT INTO meta (key, value) VALUES ('migrated_from_csv', ?)", (csv_path,))
+        return count
+
+    def append_many(self, rows):
+        with self.lock.write():
+            conn = self._conn()
+            with conn:
+                before = conn.execute("SELECT COALESCE(MAX(id), 0) FROM logs").fetchone()[0]
+                conn.executemany("INSERT INTO logs (time, category, content) VALUES (?, ?, ?)", rows)
+                add_search_postings(conn, [(row[0], row[1:]) for row in conn.execute(
+                    "SELECT id, time, category, content FROM logs WHERE id > ? AND content != ''", (before,))])
+
+    def undo_last(self, max_age=UNDO_WINDOW):
+        with self.lock.write():
+            conn = self._conn()
+            last = conn.execute("SELECT id, time, category, content FROM logs ORDER BY id DESC LIMIT 1").fetchone()
+            if last is None:
+                raise UndoError("没有可撤销的记录")
+            last_row = list(last[1:])
+            self.check_undoable(last_row, max_age)
+            with conn:
+                conn.execute("DELETE FROM logs WHERE id = ?", (last[0],))
+                remove_search_postings(conn, last[0], last_row)
+            return last_row
+
+    def iter_rows(self, start=None, end=None):
+        # 单独的读连接，不加锁，WAL 快照保证整个遍历读到一致的数据
+        conn = sqlite3.connect(self.path, timeout=30)
+        clauses, params = [], []
+        if start:
+            clauses.append("time >= ?")
+            params.append(start)
+        if end:
+            clauses.append("time < ?")
+            params.append(next_day(end))
+        sql = "SELECT time, category, content FROM logs"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        try:
+            for row in conn.execute(sql + " ORDER BY id", params):
+                yield list(row)
+        finally:
+            conn.close()
+
+    def update_index(self, index):
+        # rowid 只增不减，撤销只删除最大的 rowid；行数对不上（其他程序删改过）时整体重建
+        state = index.files.get(self.path, {'last': 0})
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            conn.execute("BEGIN")
+            max_id, count = conn.execute("SELECT COALESCE(MAX(id), 0), COUNT(*) FROM logs").fetchone()
+            changed = False
+            last = state['last']
+            if max_id < last:
+                changed = index.remove_refs(max_id + 1, last + 1)
+                last = max_id
+            for _ in range(2):
+                for rowid, log_time, category in conn.execute(
+                        "SELECT id, time, category FROM logs WHERE id > ? ORDER BY id", (last,)):
+                    index.add(rowid, (log_time, category))
+                    last = rowid
+                    changed = True
+                if len(index) == count:
+                    break
+                index.remove_refs(0, 1 << RowIndex.PART_SHIFT)
+                last = 0
+            conn.rollback()
+        finally:
+            conn.close()
+        index.files[self.path] = {'last': last}
+        return changed
+
+    def read_indexed(self, index, refs):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            refs = list(refs)
+            rows = {}
+            for i in range(0, len(refs), 500):
+                chunk = refs[i:i + 500]
+                sql = f"SELECT id, time, category, content FROM logs WHERE id IN ({','.join('?' * len(chunk))})"
+                for row in conn.execute(sql, chunk):
+                    rows[row[0]] = list(row[1:])
+            return rows
+        finally:
+            conn.close()
+
+    def _rebuild_rollups(self, conn):
+        with conn:
+            conn.execute("DELETE FROM rollup")
+            conn.execute("INSERT INTO rollup (day, category, count) "
+                         "SELECT substr(time, 1, 10), category, COUNT(*) FROM logs GROUP BY 1, 2")
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('rollup_built', '1')")
+
+    def _rebuild_search(self, conn):
+        with conn:
+            conn.execute("DELETE FROM search_postings")
+            for chunk in iter_chunks(conn.execute("SELECT id, time, category, content FROM logs WHERE content != ''")
+                                     .fetchall()):
+                add_search_postings(conn, [(row[0], row[1:]) for row in chunk])
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('search_built', '1')")
+
+    def rebuild_rollups(self):
+        with self.lock.write():
+            conn = self._conn()
+            self._rebuild_rollups(conn)
+            self._rebuild_search(conn)
+
+    def iter_category_counts(self, start, end):
+        return iter_rollup_counts(self.path, start, end)
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            return search_rows(conn, "logs", query, limit)
+        finally:
+            conn.close()
+
+    def tail(self, limit=TAIL_LIMIT, since=None):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            rows = conn.execute("SELECT time, category, content FROM logs ORDER BY id DESC LIMIT ?", (limit,))
+            return take_recent((list(row) for row in rows), limit, since)
+        finally:
+            conn.close()
+
+    def disk_usage(self):
+        return sum(os.path.getsize(path) for path in (self.path, self.path + "-wal") if os.path.exists(path))
+
+    def sync(self):
+        # synchronous=NORMAL 下提交只写入 WAL，检查点会先把 WAL 刷到磁盘；
+        # 本线程的连接是 FULL 时提交已经落盘，不用再做检查点
+        with self.lock.write():
+            conn = self._conn()
+            if self._local.synchronous != "FULL":
+                conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+        self.lock.close()
+
+DURABILITY_MODES = {
+    "always": "每批记录立即落盘",
+    "interval": "定时落盘 (200毫秒)",
+    "os": "由系统决定",
+}
+
+class LogEventBus(QObject):
+    # 写线程发布追加和撤销的记录：窗口通过 Qt 信号接收（自动排队到界面线程），
+    # 手机端的 SSE 连接各自订阅一个队列。最近的事件按序号保留，断线重连时补发。
+    # Qt 信号带上写线程改动后的代数，界面据此跳过统计结果里已经包含的改动
+    appended = Signal(object, int)
+    undone = Signal(object, int)
+
+    HISTORY = 100
+    QUEUE_SIZE = 1000
+
+    def __init__(self):
+        super().__init__()
+        self.sequence = 0
+        self.history = deque(maxlen=self.HISTORY)
+        self.subscribers = set()
+        self.lock = threading.Lock()
+
+    def publish(self, kind, rows, generation=0):
+        with self.lock:
+            self.sequence += 1
+            event = (self.sequence, kind, rows)
+            self.history.append(event)
+            for q in list(self.subscribers):
+                try:
+                    q.put_nowait(event)
+                except queue.Full:
+                    # 读得太慢的连接直接退订，由客户端重连后补发
+                    self.subscribers.discard(q)
+        if kind == 'append':
+            self.appended.emit(rows, generation)
+        else:
+            self.undone.emit(rows, generation)
+
+    def subscribe(self, last_id=None):
+        q = queue.Queue(maxsize=self.QUEUE_SIZE)
+        with self.lock:
+            if last_id is not None:
+                for event in self.history:
+                    if event[0] > last_id:
+                        q.put_nowait(event)
+            self.subscribers.add(q)
+        return q
+
+    def subscribed(self, q):
+        with self.lock:
+            return q in self.subscribers
+
+    def unsubscribe(self, q):
+        with self.lock:
+            self.subscribers.discard(q)
+
+# 统计结果缓存的条数上限和最长保留秒数
+STATS_CACHE_SIZE = 64
+STATS_CACHE_TTL = 60
+
+class StatsQuery:
+    # 桌面统计和 /api/stats 共用的查询层。结果按 (维度, 开始, 结束) 放进 LRU 缓存，
+    # 每条带上计算时的日志代数（LogWriter 每次新增/撤销加一），代数变了就不再使用。
+    # 另一个程序副本写入的记录不会改变本进程的代数，所以缓存最多保留 STATS_CACHE_TTL 秒
+    def __init__(self, writer, size=STATS_CACHE_SIZE):
+        self.writer = writer
+        self.storage = writer.storage
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def cached(self, key):
+        # 返回 (计数副本, etag)，调用方可以随意修改计数
+        with self.lock:
+            entry = self.entries.get(key)
+            if (entry is None or entry[0] != self.writer.generation
+                    or time.monotonic() - entry[1] > STATS_CACHE_TTL):
+                metrics.inc("worklog_stats_cache_total", (('result', 'miss'),))
+                return None
+            self.entries.move_to_end(key)
+        metrics.inc("worklog_stats_cache_total", (('result', 'hit'),))
+        return dict(entry[2]), entry[3]
+
+    def store(self, key, generation, counts):
+        # 计算期间日志有变化的结果不放进缓存
+        etag = hashlib.sha1(json.dumps(sorted(counts.items(), key=str), ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+        with self.lock:
+            if generation == self.writer.generation:
+                self.entries[key] = (generation, time.monotonic(), dict(counts), etag)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return etag
+
+    def category_counts(self, start, end, progress=None, cancelled=None):
+        # 返回 ({类别: 次数}, etag)，取消时返回 None；progress(已完成天数, 总天数)
+        key = ("category", start, end)
+        hit = self.cached(key)
+        if hit is not None:
+            return hit
+        generation = self.writer.generation
+        total = Counter()
+        for done, days, counts in self.storage.iter_category_counts(start, end):
+            if cancelled is not None and cancelled():
+                return None
+            total.update(counts)
+            if progress is not None:
+                progress(done, days)
+        return dict(total), self.store(key, generation, total)
+
+    def pivot_counts(self, index, dimension, start, end, cancelled=None):
+        # 返回 (增量更新后的行索引, 分组计数)，取消时返回 None；命中缓存时索引原样返回
+        key = (dimension, start, end)
+        hit = self.cached(key)
+        if hit is not None:
+            return index, hit[0]
+        generation = self.writer.generation
+        updated = index.copy()
+        if not self.storage.update_index(updated):
+            updated = index
+        if cancelled is not None and cancelled():
+            return None
+        counts = pivot_counts(updated, dimension, start, end)
+        self.store(key, generation, counts)
+        return updated, counts
+
+# 统计读取期间日志一直在变时，最多重新读取的次数
+SNAPSHOT_RETRIES = 3
+
+class LogWriter:
+    # 唯一的写线程，Qt 按钮和 Flask 路由都把记录交给它。
+    # 同时到达的记录合并成一次写入，按 durability 策略落盘后才通知调用方：
+    # always 每批 fsync，interval 最多每 interval_ms 毫秒 fsync 一次，os 写入后即返回。
+    # 写入成功的记录带上记录人 user 发布到 events（LogEventBus）；generation 每次新增/撤销加一，统计缓存据此作废
+    _STOP = object()
+
+    def __init__(self, storage, durability="always", interval_ms=200, events=None, user=""):
+        self.storage = storage
+        self.user = user
+        self.set_durability(durability)
+        self.interval = interval_ms / 1000
+        self.events = events
+        self.generation = 0
+        # 改动存储和代数加一在这把锁里一起完成，snapshot 据此判断读取期间日志有没有变化
+        self.generation_lock = threading.Lock()
+        self.stats = StatsQuery(self)
+        self.queue = queue.Queue()
+        self.thread = None
+        self.thread_lock = threading.Lock()
+
+    def _start(self):
+        # 写线程在第一次写入或撤销时才启动，只用来读取的分片不占线程
+        with self.thread_lock:
+            if self.thread is None:
+                name = f"worklog-writer-{self.user}" if self.user else "worklog-writer"
+                self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+                self.thread.start()
+
+    def set_durability(self, durability):
+        self.durability = durability
+        self.storage.set_durability(durability)
+
+    def snapshot(self, read):
+        # 在日志没有变化的时候执行 read()，返回 (结果, 结果对应的代数)。前后代数相同，
+        # 说明读取期间没有写入，结果恰好包含这一代为止的改动；一直有写入时重试几次后按读取前的代数返回
+        for _ in range(SNAPSHOT_RETRIES):
+            with self.generation_lock:
+                generation = self.generation
+            result = read()
+            with self.generation_lock:
+                if self.generation == generation:
+                    break
+        return result, generation
+
+    def submit(self, rows):
+        self._start()
+        future = Future()
+        self.queue.put(('append', list(rows), future))
+        return future
+
+    def append(self, time, category, content, timeout=None):
+        return self.submit([(time, category, content)]).result(timeout)
+
+    def append_many(self, rows, timeout=None):
+        return self.submit(rows).result(timeout)
+
+    def undo_last(self, max_age=UNDO_WINDOW, timeout=None):
+        self._start()
+        future = Future()
+        self.queue.put(('undo', max_age, future))
+        return future.result(timeout)
+
+    def close(self):
+        with self.thread_lock:
+            thread = self.thread
+        if thread is not None:
+            self.queue.put(self._STOP)
+            thread.join()
+
+    def _run(self):
+        unsynced = []
+        last_sync = time.monotonic()
+        stopping = False
+        while not stopping:
+            timeout = None
+            if unsynced:
+                timeout = max(0.0, last_sync + self.interval - time.monotonic())
+            try:
+                items = [self.queue.get(timeout=timeout)]
+            except queue.Empty:
+                items = []
+            while True:
+                try:
+                    items.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self._STOP in items:
+                stopping = True
+                items = [item for item in items if item is not self._STOP]
+
+            unsynced.extend(self._process(items))
+
+            if unsynced and (stopping or self.durability != "interval"
+                             or time.monotonic() - last_sync >= self.interval):
+                error = None
+                if self.durability != "os":
+                    try:
+                        with metrics.timer("worklog_sync_duration_seconds"):
+                            self.storage.sync()
+                    except Exception as e:
+                        error = e
+                last_sync = time.monotonic()
+                for future, result in unsynced:
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+                unsynced = []
+
+    def _process(self, items):
+        # 连续的追加合并成一次 append_many，撤销按到达顺序夹在其间执行
+        done = []
+        batch, futures = [], []
+        for op, arg, future in items + [(None, None, None)]:
+            if op == 'append':
+                batch.extend(arg)
+                futures.append(future)
+                continue
+            if batch:
+                try:
+                    with self.generation_lock:
+                        try:
+                            with metrics.timer("worklog_append_duration_seconds"):
+                                self.storage.append_many(batch)
+                        finally:
+                            # 失败的写入也可能已经改动了部分数据
+                            self.generation += 1
+                            generation = self.generation
+                    metrics.inc("worklog_appended_rows_total", value=len(batch))
+                    done.extend((f, None) for f in futures)
+                    if self.events is not None:
+                        self.events.publish('append', [list(row) + [self.user] for row in batch], generation)
+                except Exception as e:
+                    for f in futures:
+                        f.set_exception(e)
+                batch, futures = [], []
+            if op == 'undo':
+                try:
+                    with self.generation_lock:
+                        with metrics.timer("worklog_undo_duration_seconds"):
+                            row = self.storage.undo_last(arg)
+                        self.generation += 1
+                        generation = self.generation
+                    done.append((future, row))
+                    if self.events is not None:
+                        self.events.publish('undo', [list(row[:3]) + [self.user]], generation)
+                except Exception as e:
+                    future.set_exception(e)
+        return done
+
+STORAGE_BACKENDS = {
+    "csv": "CSV 文件",
+    "partitioned": "按月分区 CSV",
+    "sqlite": "SQLite (WAL)",
+}
+
+def open_storage(log_dir, backend="csv"):
+    csv_path = os.path.join(log_dir, "worklog.csv")
+    if backend == "sqlite":
+        return SqliteLogStorage(os.path.join(log_dir, "worklog.db"), migrate_from=csv_path)
+    if backend == "partitioned":
+        return PartitionedCsvStorage(log_dir, split_from=csv_path)
+    return CsvLogStorage(csv_path)
+
+# 各存储引擎建好之后留下的文件，有这个文件就不会再从 worklog.csv 导入
+BACKEND_MARKERS = {
+    "sqlite": "worklog.db",
+    "partitioned": "worklog-manifest.json",
+}
+
+def backend_switch_error(log_dir, current, target):
+    # 迁移只在新引擎第一次打开时从 worklog.csv 做一次，不会反向迁移。切换后会有记录看不到时返回原因
+    if target == current:
+        return None
+    if current != "csv":
+        return f"{STORAGE_BACKENDS[current]}里新增的记录\n不会迁移回去，切换后将看不到"
+    root = os.path.join(log_dir, USERS_DIR)
+    dirs = [log_dir]
+    if os.path.isdir(root):
+        dirs += [os.path.join(root, name) for name in os.listdir(root)]
+    if any(os.path.exists(os.path.join(path, BACKEND_MARKERS[target])) for path in dirs):
+        return f"{STORAGE_BACKENDS[target]}已经导入过 worklog.csv，\n之后写入 CSV 的记录不会再导入"
+    return None
+
+# 多人共用一台电脑做服务器时，每个手机用户的记录写进 WorkLog/users/<姓名>/ 下自己的日志分片。
+# 分片有各自的存储、锁文件和写线程，互不争用；本机的记录仍写在 WorkLog 目录下
+USERS_DIR = "users"
+MAX_USER_NAME = 32
+
+def user_slug(name):
+    # 登录时填写的姓名规范化后直接作为目录名，去掉路径字符；无效的名字返回 ""
+    name = unicodedata.normalize("NFKC", name or "").strip()
+    return re.sub(r"[^\w\- ]", "_", name)[:MAX_USER_NAME].strip()
+
+def user_label(user):
+    return user or "本机"
+
+class LogShard:
+    # 一个人的日志：存储、写线程和分组统计用的行索引（只在界面线程替换）
+    def __init__(self, user, storage, writer):
+        self.user = user
+        self.storage = storage
+        self.writer = writer
+        self.index = RowIndex()
+
+class LogShards:
+    # 所有人的日志分片。main 是本机的日志（user 为 ""），其他分片第一次用到时才打开；
+    # 这里的锁只保护分片表（打开分片时也持有，免得同一分片被打开两次），各分片的读写互不相干
+    def __init__(self, log_dir, backend, main, events=None):
+        self.log_dir = log_dir
+        self.backend = backend
+        self.main = main
+        self.events = events
+        self.shards = {"": main}
+        self.lock = threading.Lock()
+
+    def users(self):
+        # 本机和所有已有分片的记录人，本机排在最前
+        root = os.path.join(self.log_dir, USERS_DIR)
+        names = set()
+        if os.path.isdir(root):
+            names = {name for name in os.listdir(root)
+                     if user_slug(name) == name and os.path.isdir(os.path.join(root, name))}
+        with self.lock:
+            names.update(self.shards)
+        names.discard("")
+        return [""] + sorted(names)
+
+    def get(self, user):
+        # 打开这个人的分片，没有就新建；只有登录和写入记录时调用
+        return self._open(user, create=True)
+
+    def find(self, user):
+        # 只读的查找：打开已有的分片，没有这个人时返回 None，不会新建目录
+        return self._open(user, create=False)
+
+    def _open(self, user, create):
+        user = user_slug(user)
+        if not user:
+            return self.main
+        with self.lock:
+            shard = self.shards.get(user)
+            if shard is None:
+                path = os.path.join(self.log_dir, USERS_DIR, user)
+                if create:
+                    os.makedirs(path, exist_ok=True)
+                elif not os.path.isdir(path):
+                    return None
+                storage = open_storage(path, self.backend)
+                storage.ensure_created()
+                writer = LogWriter(storage, self.main.writer.durability, events=self.events, user=user)
+                shard = self.shards[user] = LogShard(user, storage, writer)
+            return shard
+
+    def all(self):
+        # 打开磁盘上所有的分片，第一次打开可能要建汇总表或搜索索引，不要在界面线程调用
+        return [shard for shard in map(self.find, self.users()) if shard is not None]
+
+    def opened(self):
+        # 已经打开的分片，不读磁盘
+        with self.lock:
+            return [self.shards[user] for user in sorted(self.shards)]
+
+    def set_durability(self, durability):
+        with self.lock:
+            for shard in self.shards.values():
+                shard.writer.set_durability(durability)
+
+    def close(self):
+        # 本机的存储和写线程由窗口关闭
+        with self.lock:
+            shards = [shard for user, shard in self.shards.items() if user]
+            self.shards = {"": self.main}
+        for shard in shards:
+            shard.writer.close()
+            shard.storage.close()
+
+def merged_category_counts(shards, start, end, by_user=False, progress=None, cancelled=None, generations=None):
+    # 合并多个分片的按类别统计，每个分片走自己的汇总表和缓存；by_user 时键为 (记录人, 类别)。
+    # 返回 (计数, etag)，取消时返回 None；generations 为字典时填入各分片结果对应的代数
+    total = Counter()
+    etags = []
+    for i, shard in enumerate(shards):
+        step = None
+        if progress is not None:
+            step = lambda done, days, i=i: progress(i * days + done, len(shards) * days)
+        result, generation = shard.writer.snapshot(
+            lambda: shard.writer.stats.category_counts(start, end, step, cancelled))
+        if result is None:
+            return None
+        if generations is not None:
+            generations[shard.user] = generation
+        counts, etag = result
+        etags.append(f"{shard.user}:{etag}")
+        if by_user:
+            total.update({(user_label(shard.user), category): n for category, n in counts.items()})
+        else:
+            total.update(counts)
+    return dict(total), hashlib.sha1("|".join(etags).encode('utf-8')).hexdigest()[:16]
+
+# 合并各人分片时，每个分片先在这么多条记录的窗口内按时间排好序
+MERGE_WINDOW = 10000
+
+def sort_window(rows, window=MERGE_WINDOW):
+    # 分片按追加顺序返回记录，手机补传的记录比前面的记录早。用大小为 window 的堆重新排序，
+    # 比前面的记录晚到不超过 window 条的记录都能排回原位，内存只占 window 条
+    heap = []
+    for seq, row in enumerate(rows):
+        heapq.heappush(heap, (row[0], seq, row))
+        if len(heap) > window:
+            yield heapq.heappop(heap)[2]
+    while heap:
+        yield heapq.heappop(heap)[2]
+
+class MergedLogView:
+    # 所有人分片合在一起的只读视图，接口与 LogStorage 的读取部分相同。
+    # 导出、搜索、日志浏览、今天的记录和压缩都经过它，手机用户分片里的记录不会漏掉
+    # 合并行索引的位置：高位是分片号（对应 index.parts），低位是该分片自己索引里的位置
+    SHARD_SHIFT = 52
+
+    def __init__(self, shards, open_all=True):
+        # open_all 为 False 时只读已经打开的分片，供界面线程使用
+        self.shards = shards
+        self.open_all = open_all
+
+    def storages(self):
+        shards = self.shards.all() if self.open_all else self.shards.opened()
+        return [shard.storage for shard in shards]
+
+    def category_counts(self, start, end):
+        total = Counter()
+        for storage in self.storages():
+            total.update(storage.category_counts(start, end))
+        return dict(total)
+
+    def iter_rows(self, start=None, end=None):
+        # 只有本机日志时按追加顺序输出；多个分片先各自在窗口内排序，再按时间归并
+        rows = [storage.iter_rows(start, end) for storage in self.storages()]
+        if len(rows) == 1:
+            yield from rows[0]
+        else:
+            yield from heapq.merge(*map(sort_window, rows), key=operator.itemgetter(0))
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        rows = [row for storage in self.storages() for row in storage.search(query, limit)]
+        return sorted(rows, key=operator.itemgetter(0), reverse=True)[:limit]
+
+    def tail(self, limit=TAIL_LIMIT, since=None):
+        storages = self.storages()
+        if len(storages) == 1:
+            return storages[0].tail(limit, since)
+        rows = [row for storage in storages for row in storage.tail(limit, since)]
+        return sorted(rows, key=operator.itemgetter(0), reverse=True)[:limit]
+
+    def compact(self):
+        return sum(storage.compact() for storage in self.storages())
+
+    def rebuild_rollups(self):
+        for storage in self.storages():
+            storage.rebuild_rollups()
+
+    def update_index(self, index):
+        # 每个分片在自己的子索引上增量更新，子索引放在 index.files 里。
+        # 子索引与界面线程持有的旧索引共用，更新前先复制；有变化时重新拼出合并索引，类别编码换成合并后的编码
+        users = self.shards.users()
+        changed = users != index.parts
+        subs = {}
+        for user in users:
+            sub = index.files.get(user, {}).get('index')
+            updated = sub.copy() if sub is not None else RowIndex()
+            if self.shards.find(user).storage.update_index(updated) or sub is None:
+                sub = updated
+                changed = True
+            subs[user] = sub
+        if not changed:
+            return False
+        index.refs, index.times, index.codes = array('q'), array('q'), array('I')
+        index.categories, index.category_codes = [], {}
+        for number, user in enumerate(users):
+            sub = subs[user]
+            codes = []
+            for category in sub.categories:
+                code = index.category_codes.get(category)
+                if code is None:
+                    code = index.category_codes[category] = len(index.categories)
+                    index.categories.append(category)
+                codes.append(code)
+            index.refs.extend(map((number << self.SHARD_SHIFT).__or__, sub.refs))
+            index.times.extend(sub.times)
+            index.codes.extend(map(codes.__getitem__, sub.codes))
+        index.files = {user: {'index': subs[user]} for user in users}
+        index.parts = users
+        return True
+
+    def read_indexed(self, index, refs):
+        mask = (1 << self.SHARD_SHIFT) - 1
+        groups = {}
+        for ref in refs:
+            groups.setdefault(ref >> self.SHARD_SHIFT, []).append(ref & mask)
+        rows = {}
+        for number, shard_refs in groups.items():
+            user = index.parts[number]
+            base = number << self.SHARD_SHIFT
+            storage = self.shards.find(user).storage
+            for ref, row in storage.read_indexed(index.files[user]['index'], shard_refs).items():
+                rows[base | ref] = row
+        return rows
+
+SERVER_MODES = {
+    "single": "单线程",
+    "threaded": "多线程",
+    "pool": "线程池",
+}
+
+# /api/logs 单次最多接收的记录数，以及用于去重的最近记录 id 数量
+MAX_BATCH_ENTRIES = 1000
+SEEN_ENTRY_IDS = 10000
+# 手机时钟与电脑相差不到这么多秒时不校正记录时间（秒）。网络和排队的延迟也会算进差值里，
+# 所以只校正明显走错的时钟
+CLOCK_SKEW_TOLERANCE = 300
+
+# SSE 连接空闲时发送心跳的间隔（秒），顺便发现已断开的连接
+SSE_HEARTBEAT = 15
+# SSE 连接数上限，这些连接不占用处理请求的工作线程
+SSE_MAX_STREAMS = 16
+# 长连接等待下一个请求的时间（秒），超过就断开，把工作线程让给其他手机
+KEEPALIVE_IDLE = 2
+
+@lru_cache(maxsize=None)
+def concurrent_server_class():
+    # werkzeug 只在第一次开启手机同步时导入
+    from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler
+
+    class KeepAliveRequestHandler(WSGIRequestHandler):
+        # HTTP/1.1 长连接。等待下一个请求最多 KEEPALIVE_IDLE 秒，空闲连接不长期占着工作线程；
+        # 请求开始后读写超过 timeout 秒才断开
+        protocol_version = "HTTP/1.1"
+        timeout = 15
+
+        def handle_one_request(self):
+            # 推送过 SSE 的连接已经不占请求名额，推送结束就断开
+            if self.connection in self.server.streams:
+                self.close_connection = True
+                return
+            self.connection.settimeout(KEEPALIVE_IDLE)
+            try:
+                ready = self.rfile.peek(1)
+            except OSError:
+                ready = b""
+            if not ready:
+                self.close_connection = True
+                return
+            self.connection.settimeout(self.timeout)
+            super().handle_one_request()
+
+    class ConcurrentWSGIServer(BaseWSGIServer):
+        # threaded: 每个连接一个线程，最多 workers 个；pool: 同时处理 workers 个连接，最多再排队 backlog 个。
+        # 超出上限的连接直接返回 503，让手机稍后重试，而不是无限堆积。
+        # SSE 推送连接由 detach_stream 移出这些名额，另外最多 SSE_MAX_STREAMS 个
+        multithread = True
+
+        def __init__(self, host, port, app, mode="pool", workers=8, backlog=32):
+            super().__init__(host, port, app, handler=KeepAliveRequestHandler)
+            self.mode = mode
+            self.executor = None
+            self.busy = None
+            if mode == "pool":
+                # 线程池多留出推送连接的线程，推送再多也不会占满处理请求的 workers 个线程
+                self.executor = ThreadPoolExecutor(max_workers=workers + SSE_MAX_STREAMS,
+                                                   thread_name_prefix="worklog-http")
+                self.busy = threading.BoundedSemaphore(workers)
+            else:
+                backlog = 0
+            self.slots = threading.BoundedSemaphore(workers + backlog)
+            self.connections = set()
+            self.streams = set()
+            self.connections_lock = threading.Lock()
+
+        def process_request(self, request, client_address):
+            if not self.slots.acquire(blocking=False):
+                self.reject_request(request)
+                return
+            with self.connections_lock:
+                self.connections.add(request)
+            if self.executor is not None:
+                self.executor.submit(self.process_request_thread, request, client_address)
+            else:
+                threading.Thread(target=self.process_request_thread,
+                                 args=(request, client_address), daemon=True).start()
+
+        def process_request_thread(self, request, client_address):
+            if self.busy is not None:
+                self.busy.acquire()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                with self.connections_lock:
+                    stream = request in self.streams
+                    self.connections.discard(request)
+                    self.streams.discard(request)
+                self.shutdown_request(request)
+                if not stream:
+                    self.release(request)
+
+        def release(self, request):
+            self.slots.release()
+            if self.busy is not None:
+                self.busy.release()
+
+        def detach_stream(self, request):
+            # 连接开始推送 SSE：归还请求名额，后面的请求不用等推送结束
+            with self.connections_lock:
+                if request not in self.connections or request in self.streams:
+                    return
+                self.streams.add(request)
+            self.release(request)
+
+        def reject_request(self, request):
+            try:
+                request.sendall(b"HTTP/1.1 503 Service Unavailable\r\n"
+                                b"Retry-After: 1\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+            except OSError:
+                pass
+            self.shutdown_request(request)
+
+        def server_close(self):
+            super().server_close()
+            # 主动断开空闲的长连接，工作线程才能立即退出
+            with self.connections_lock:
+                connections = list(self.connections)
+            for request in connections:
+                try:
+                    request.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+            if self.executor is not None:
+                self.executor.shutdown(wait=True)
+
+    return ConcurrentWSGIServer
+
 class MobileServerThread(QThread):
     server_started = Signal(str) # 发送服务器地址
     server_error = Signal(str)
 
-    def __init__(self, log_file, categories, password, port=5000):
+    def __init__(self, writer, categories, password, port=5000, mode="pool", workers=8, backlog=32, shards=None):
         super().__init__()
-        self.log_file = log_file
+        self.writer = writer
+        self.storage = writer.storage
+        self.events = writer.events
+        self.stats = writer.stats
+        self.shards = shards
         self.categories = categories
         self.password = password
         self.port = port
+        self.mode = mode
+        self.workers = workers
+        self.backlog = backlog
+        from flask import Flask
         self.app = Flask(__name__)
         self.app.secret_key = os.urandom(24)
         self.server = None
+        # 手机重试时可能重复提交同一批记录，按记录 id 去重。ingest_lock 只保护这两个集合，
+        # 写入在锁外进行；pending_entry_ids 是正在写入、尚未确认的记录
+        self.ingest_lock = threading.Lock()
+        self.seen_entry_ids = OrderedDict()
+        self.pending_entry_ids = set()
+        # 正在推送的 SSE 连接，停止服务时逐个唤醒让它们结束
+        self.streams = set()
+        self.streams_lock = threading.Lock()
         
         self.setup_routes()
 
+    def render_pages(self):
+        # 模板只在服务启动时编译一次，类别页面预渲染成字节并缓存 gzip 版本
+        self.login_template = self.app.jinja_env.from_string(LOGIN_TEMPLATE)
+        self.index_template = self.app.jinja_env.from_string(HTML_TEMPLATE)
+        self.recent_template = self.app.jinja_env.from_string(RECENT_TEMPLATE)
+        self.set_categories(self.categories)
+
+    def set_categories(self, categories):
+        self.categories = categories
+        body = self.index_template.render(categories=categories).encode('utf-8')
+        digest = hashlib.sha1(body).hexdigest()[:16]
+        self.index_page = {
+            'identity': (body, digest),
+            'gzip': (gzip.compress(body, compresslevel=6, mtime=0), digest + '-gz'),
+            'last_modified': datetime.now(timezone.utc).replace(microsecond=0),
+        }
+
+    def index_response(self):
+        from flask import Response, request
+        # 按 q 值协商：gzip;q=0 表示明确拒绝压缩
+        encoding = 'gzip' if request.accept_encodings['gzip'] > 0 else 'identity'
+        body, etag = self.index_page[encoding]
+        response = Response(body, mimetype='text/html')
+        if encoding == 'gzip':
+            response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.set_etag(etag)
+        response.last_modified = self.index_page['last_modified']
+        return response.make_conditional(request)
+
+    def writer_for(self, user):
+        # 每个登录的人写自己的日志分片，第一次写入时新建；没有分片表时（基准测试等）都写本机日志
+        if self.shards is None:
+            return self.writer
+        return self.shards.get(user).writer
+
+    def find_writer(self, user):
+        # 读取和撤销用：不新建分片，这个人还没有日志时返回 None
+        if self.shards is None:
+            return self.writer
+        shard = self.shards.find(user)
+        return shard.writer if shard is not None else None
+
+    def result_response(self, ok, message, anchor):
+        from flask import request, jsonify, redirect
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(ok=ok, message=message)
+        return redirect('/#' + quote(anchor), code=303)
+
     def setup_routes(self):
+        from flask import Response, request, jsonify, redirect, url_for, session, g
+        self.render_pages()
+
+        @self.app.before_request
+        def start_timer():
+            g.request_start = time.perf_counter()
+
+        @self.app.after_request
+        def record_request(response):
+            route = request.url_rule.rule if request.url_rule else "unmatched"
+            metrics.inc("worklog_http_requests_total",
+                        (('route', route), ('method', request.method), ('status', str(response.status_code))))
+            metrics.observe("worklog_http_request_duration_seconds",
+                            time.perf_counter() - g.request_start, (('route', route),))
+            return response
+
         @self.app.route('/', methods=['GET', 'POST'])
         def index():
             if 'logged_in' not in session:
+                if request.method == 'POST' and request.accept_mimetypes.best == 'application/json':
+                    return jsonify(ok=False, message="未登录"), 401
                 return redirect(url_for('login'))
             
             if request.method == 'POST':
                 category = request.form.get('category')
                 content = request.form.get('content', '')
                 if category:
-                    self.save_log(category, content)
-                    return render_template_string(HTML_TEMPLATE, categories=self.categories, success=True)
+                    if self.save_log(category, content, session.get('user', '')):
+                        return self.result_response(True, "记录成功！", "saved")
+                    return self.result_response(False, "记录失败", "error=记录失败")
             
-            return render_template_string(HTML_TEMPLATE, categories=self.categories, success=False)
+            return self.index_response()
 
         @self.app.route('/undo', methods=['POST'])
         def undo():
             if 'logged_in' not in session:
+                if request.accept_mimetypes.best == 'application/json':
+                    return jsonify(ok=False, message="未登录"), 401
                 return redirect(url_for('login'))
-            
+
             try:
-                with file_lock:
-                    if not os.path.exists(self.log_file):
-                         return render_template_string(HTML_TEMPLATE, categories=self.categories, undo_error="日志文件不存在")
-                    
-                    lines = []
-                    with open(self.log_file, 'r', encoding='utf-8-sig') as f:
-                        reader = csv.reader(f)
-                        lines = list(reader)
-                    
-                    if len(lines) <= 1:
-                         return render_template_string(HTML_TEMPLATE, categories=self.categories, undo_error="没有可撤销的记录")
+                writer = self.find_writer(session.get('user', ''))
+                if writer is None:
+                    raise UndoError("没有可撤销的记录")
+                writer.undo_last()
+                return self.result_response(True, "撤销成功！", "undone")
+            except UndoError as e:
+                error = str(e)
+            except Exception as e:
+                error = f"撤销失败: {str(e)}"
+            return self.result_response(False, error, "error=" + error)
 
-                    last_row = lines[-1]
-                    if not last_row:
-                        return render_template_string(HTML_TEMPLATE, categories=self.categories, undo_error="记录格式错误")
+        @self.app.route('/api/logs', methods=['POST'])
+        def api_logs():
+            if 'logged_in' not in session:
+                return jsonify(ok=False, message="未登录"), 401
 
-                    log_time_str = last_row[0]
-                    try:
-                        log_time = datetime.strptime(log_time_str, "%Y-%m-%d %H:%M:%S")
-                        
-                        if (datetime.now() - log_time).total_seconds() <= 60:
-                            lines.pop()
-                            with open(self.log_file, 'w', newline='', encoding='utf-8-sig') as f:
-                                writer = csv.writer(f)
-                                writer.writerows(lines)
-                            return render_template_string(HTML_TEMPLATE, categories=self.categories, undo_success=True)
-                        else:
-                            return render_template_string(HTML_TEMPLATE, categories=self.categories, undo_error="只能撤销1分钟内的记录")
-                    except ValueError:
-                         return render_template_string(HTML_TEMPLATE, categories=self.categories, undo_error="无法解析记录时间")
+            payload = request.get_json(silent=True)
+            entries = payload.get('entries') if isinstance(payload, dict) else payload
+            if not isinstance(entries, list):
+                return jsonify(ok=False, message="请求格式错误"), 400
+            if len(entries) > MAX_BATCH_ENTRIES:
+                return jsonify(ok=False, message=f"单次最多提交{MAX_BATCH_ENTRIES}条记录"), 413
+
+            # 手机时钟不准时，按发送时刻两边时钟的差校正手机给出的记录时间
+            sent = payload.get('sent') if isinstance(payload, dict) else None
+            skew = timedelta(0)
+            if isinstance(sent, (int, float)) and not isinstance(sent, bool):
+                offset = time.time() - sent / 1000
+                if abs(offset) >= CLOCK_SKEW_TOLERANCE:
+                    skew = timedelta(seconds=round(offset))
+
+            # 锁内只占住这批记录的 id，写入和落盘在锁外进行，多台手机的提交由写线程合并落盘
+            with self.ingest_lock:
+                rows, ids, rejected, duplicates = self.parse_entries(entries, skew)
+                if any(entry_id in self.pending_entry_ids for entry_id in ids):
+                    # 上次提交超时后重试，而那批记录还没写完：让手机保留这批记录稍后再试
+                    return jsonify(ok=False, message="上一批记录正在保存，请稍后重试"), 409
+                self.pending_entry_ids.update(ids)
+            saved = False
+            try:
+                if rows:
+                    self.writer_for(session.get('user', '')).append_many(rows)
+                saved = True
+            except Exception as e:
+                return jsonify(ok=False, message=f"保存失败: {str(e)}"), 500
+            finally:
+                with self.ingest_lock:
+                    self.pending_entry_ids.difference_update(ids)
+                    if saved:
+                        for entry_id in ids:
+                            self.seen_entry_ids[entry_id] = True
+                        while len(self.seen_entry_ids) > SEEN_ENTRY_IDS:
+                            self.seen_entry_ids.popitem(last=False)
+            return jsonify(ok=True, accepted=len(rows), duplicates=duplicates, rejected=rejected)
+
+        @self.app.route('/recent')
+        def recent():
+            # 今天已记录的工作，只从日志末尾往回读；首页用 JSON 版本填充 最新记录
+            wants_json = request.accept_mimetypes.best == 'application/json'
+            if 'logged_in' not in session:
+                if wants_json:
+                    return jsonify(ok=False, message="未登录"), 401
+                return redirect(url_for('login'))
+
+            rows, error = [], None
+            user = session.get('user', '')
+            try:
+                writer = self.find_writer(user)
+                if writer is not None:
+                    rows = writer.storage.tail(since=datetime.now().strftime("%Y-%m-%d"))
+            except Exception as e:
+                error = f"读取记录失败: {str(e)}"
+            if wants_json:
+                if error:
+                    return jsonify(ok=False, message=error), 500
+                return jsonify(ok=True, rows=rows)
+            response = Response(self.recent_template.render(rows=rows, error=error, limit=TAIL_LIMIT,
+                                                            user=user_label(user)),
+                                mimetype='text/html')
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+
+        def authorized():
+            # 抓取程序和看板脚本没有会话，可以用 HTTP Basic 认证提交访问密码（用户名任意）
+            auth = request.authorization
+            return 'logged_in' in session or bool(auth and auth.password == self.password)
+
+        @self.app.route('/api/stats')
+        def api_stats():
+            # 按类别统计 [start, end]（默认本月），结果来自与桌面共用的统计缓存；
+            # 日志没有变化时，带 If-None-Match 的重复请求直接返回 304。
+            # user 缺省为全组合计，me 为当前登录的人，其他值为指定人员
+            if not authorized():
+                return jsonify(ok=False, message="未登录"), 401, {'WWW-Authenticate': 'Basic realm="worklog"'}
+            end = request.args.get('end') or datetime.now().strftime("%Y-%m-%d")
+            start = request.args.get('start') or end[:8] + "01"
+            try:
+                if parse_day(start) > parse_day(end):
+                    return jsonify(ok=False, message="开始日期不能晚于结束日期"), 400
+            except ValueError:
+                return jsonify(ok=False, message="日期格式错误，应为 YYYY-MM-DD"), 400
 
+            user = request.args.get('user')
+            if user == 'me':
+                user = session.get('user', '')
+            try:
+                if self.shards is None:
+                    counts, etag = self.stats.category_counts(start, end)
+                elif user is None:
+                    counts, etag = merged_category_counts(self.shards.all(), start, end)
+                else:
+                    writer = self.find_writer(user)
+                    if writer is None:
+                        return jsonify(ok=False, message="没有这个人员的记录"), 404
+                    counts, etag = writer.stats.category_counts(start, end)
             except Exception as e:
-                return render_template_string(HTML_TEMPLATE, categories=self.categories, undo_error=f"撤销失败: {str(e)}")
+                return jsonify(ok=False, message=f"统计失败: {str(e)}"), 500
+            order = {category: i for i, category in enumerate(self.categories)}
+            rows = sorted((item for item in counts.items() if item[1] > 0),
+                          key=lambda item: (-item[1], order.get(item[0], len(order)), item[0]))
+            response = jsonify(ok=True, start=start, end=end, user=None if user is None else user_label(user_slug(user)),
+                               total=sum(n for _, n in rows),
+                               counts=[{'category': category, 'count': n} for category, n in rows])
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            return response.make_conditional(request)
+
+        @self.app.route('/metrics')
+        def metrics_page():
+            if not authorized():
+                return Response("未登录\n", 401, {'WWW-Authenticate': 'Basic realm="worklog"'})
+            return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+        @self.app.route('/events')
+        def events():
+            # Server-Sent Events：推送所有设备的新增和撤销。每个连接一直占用一个线程，
+            # 所以单线程模式不支持；其他模式下推送连接不计入 workers，另外最多 SSE_MAX_STREAMS 个
+            if 'logged_in' not in session:
+                return Response("未登录\n", 401)
+            with self.streams_lock:
+                if self.events is None or self.mode == "single" or len(self.streams) >= SSE_MAX_STREAMS:
+                    return Response("实时推送不可用\n", 503, {'Retry-After': '30'})
+                last_id = request.headers.get('Last-Event-ID', '')
+                q = self.events.subscribe(int(last_id) if last_id.isdigit() else None)
+                self.streams.add(q)
+            if self.server is not None and hasattr(self.server, 'detach_stream'):
+                self.server.detach_stream(request.environ.get('werkzeug.socket'))
+
+            def stream():
+                try:
+                    yield "retry: 3000\n\n"
+                    while True:
+                        try:
+                            event = q.get(timeout=SSE_HEARTBEAT)
+                        except queue.Empty:
+                            if not self.events.subscribed(q):
+                                return
+                            yield ": ping\n\n"
+                            continue
+                        if event is None:
+                            return
+                        seq, kind, rows = event
+                        yield f"id: {seq}\nevent: {kind}\ndata: {json.dumps(rows, ensure_ascii=False)}\n\n"
+                finally:
+                    self.events.unsubscribe(q)
+                    with self.streams_lock:
+                        self.streams.discard(q)
+
+            return Response(stream(), mimetype='text/event-stream',
+                            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
         @self.app.route('/login', methods=['GET', 'POST'])
         def login():
             error = None
+            name = request.form.get('name', '')
             if request.method == 'POST':
-                if request.form['password'] == self.password:
+                if request.form['password'] != self.password:
+                    error = '密码错误'
+                elif not user_slug(name):
+                    error = '请输入姓名'
+                else:
                     session['logged_in'] = True
+                    session['user'] = user_slug(name)
+                    if self.shards is not None:
+                        try:
+                            self.shards.get(session['user'])
+                        except Exception as e:
+                            print(f"Error opening log shard: {e}")
                     return redirect(url_for('index'))
+            return self.login_template.render(error=error, name=name)
+
+        @self.app.route('/logout')
+        def logout():
+            session.clear()
+            return redirect(url_for('login'))
+
+    def parse_entries(self, entries, skew=timedelta(0)):
+        # 校验手机提交的记录，缺省为服务器当前时间。毫秒时间戳加上手机时钟的偏差 skew；
+        # 旧版页面提交的本地时间字符串不知道手机的时区，原样使用
+        rows, ids, rejected = [], [], []
+        duplicates = 0
+        for index, entry in enumerate(entries):
+            if not isinstance(entry, dict):
+                rejected.append({'index': index, 'error': "记录格式错误"})
+                continue
+            entry_id = entry.get('id')
+            if entry_id is not None:
+                entry_id = str(entry_id)
+                if entry_id in self.seen_entry_ids or entry_id in ids:
+                    duplicates += 1
+                    continue
+            category = entry.get('category')
+            content = entry.get('content') or ''
+            if not isinstance(category, str) or not category or not isinstance(content, str):
+                rejected.append({'index': index, 'error': "缺少工作类别"})
+                continue
+            log_time = entry.get('time')
+            try:
+                if log_time is None:
+                    log_time = datetime.now().strftime(TIME_FORMAT)
+                elif isinstance(log_time, (int, float)) and not isinstance(log_time, bool):
+                    log_time = datetime.fromtimestamp(log_time / 1000 + skew.total_seconds()).strftime(TIME_FORMAT)
+                elif isinstance(log_time, str):
+                    parse_timestamp(log_time)
                 else:
-                    error = '密码错误'
-            return render_template_string(LOGIN_TEMPLATE, error=error)
-
-    def save_log(self, category, content):
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        try:
-            with file_lock:
-                if not os.path.exists(self.log_file):
-                    with open(self.log_file, 'w', newline='', encoding='utf-8-sig') as f:
-                        writer = csv.writer(f)
-                        writer.writerow(['时间', '工作类别', '工作内容'])
-                
-                with open(self.log_file, 'a', newline='', encoding='utf-8-sig') as f:
-                    writer = csv.writer(f)
-                    writer.writerow([current_time, category, content])
+                    raise ValueError(log_time)
+            except (ValueError, OverflowError, OSError):
+                rejected.append({'index': index, 'error': "无法解析记录时间"})
+                continue
+            rows.append((log_time, category, content))
+            if entry_id is not None:
+                ids.append(entry_id)
+        return rows, ids, rejected, duplicates
+
+    def save_log(self, category, content, user=""):
+        current_time = datetime.now().strftime(TIME_FORMAT)
+        try:
+            self.writer_for(user).append(current_time, category, content)
+            return True
         except Exception as e:
             print(f"Error saving log: {e}")
+            return False
 
     def run(self):
         # 查找可用端口
@@ -280,18 +3725,484 @@ class MobileServerThread(QThread):
         self.server_started.emit(url)
         
         try:
-            self.server = make_server('0.0.0.0', self.port, self.app)
+            if self.mode == "single":
+                from werkzeug.serving import make_server
+                self.server = make_server('0.0.0.0', self.port, self.app)
+            else:
+                self.server = concurrent_server_class()('0.0.0.0', self.port, self.app, mode=self.mode,
+                                                        workers=self.workers, backlog=self.backlog)
             self.server.serve_forever()
         except Exception as e:
             self.server_error.emit(str(e))
 
     def stop(self):
+        with self.streams_lock:
+            for q in self.streams:
+                self.events.unsubscribe(q)
+                try:
+                    q.put_nowait(None)
+                except queue.Full:
+                    pass
         if self.server:
             self.server.shutdown()
 
     def update_password(self, new_password):
         self.password = new_password
 
+class StatsSignals(QObject):
+    progress = Signal(int, int, int)
+    result = Signal(int, object, object)
+    pivot = Signal(int, object, object, object)
+    failed = Signal(int, str)
+
+class StatsTask:
+    # 在线程池里计算统计，通过信号把进度和结果送回界面线程；request_id 用来丢弃过期的结果。
+    # 信号对象由窗口持有并在所有任务间共享，避免在线程池线程里销毁 QObject。
+    # user 为 None 时合并所有人的分片（全部人员），dimension 为 user 时按人员分行
+    def __init__(self, shards, user, dimension, start, end, request_id, signals):
+        self.shards = shards
+        self.user = user
+        self.dimension = dimension
+        self.start_day = start
+        self.end_day = end
+        self.request_id = request_id
+        self.cancelled = False
+        self.signals = signals
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            start = time.perf_counter()
+            shards = self.shards.all() if self.user is None else [self.shards.find(self.user)]
+            shards = [shard for shard in shards if shard is not None]
+            generations = {}
+            result = merged_category_counts(
+                shards, self.start_day, self.end_day, by_user=self.dimension == "user", cancelled=lambda: self.cancelled,
+                progress=lambda done, days: self.signals.progress.emit(self.request_id, done, days),
+                generations=generations)
+            if result is not None and not self.cancelled:
+                metrics.observe("worklog_stats_duration_seconds", time.perf_counter() - start)
+                self.signals.result.emit(self.request_id, result[0], generations)
+        except Exception as e:
+            self.signals.failed.emit(self.request_id, str(e))
+
+class PivotTask:
+    # 按小时/星期/周/月分组：先把各分片行索引的副本增量更新到最新，再在数组上分组计数并合并，
+    # 更新后的索引 {分片: 索引} 随结果交回界面，下次只需补上新增的记录
+    def __init__(self, shards, user, dimension, start, end, request_id, signals):
+        self.shards = shards
+        self.user = user
+        self.dimension = dimension
+        self.start_day = start
+        self.end_day = end
+        self.request_id = request_id
+        self.cancelled = False
+        self.signals = signals
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            start = time.perf_counter()
+            shards = self.shards.all() if self.user is None else [self.shards.find(self.user)]
+            shards = [shard for shard in shards if shard is not None]
+            indexes = {}
+            generations = {}
+            counts = Counter()
+            for shard in shards:
+                result, generations[shard.user] = shard.writer.snapshot(
+                    lambda: shard.writer.stats.pivot_counts(shard.index, self.dimension, self.start_day, self.end_day,
+                                                            cancelled=lambda: self.cancelled))
+                if result is None:
+                    return
+                indexes[shard], shard_counts = result
+                counts.update(shard_counts)
+            counts = dict(counts)
+            if not self.cancelled:
+                metrics.observe("worklog_stats_duration_seconds", time.perf_counter() - start)
+                self.signals.pivot.emit(self.request_id, indexes, counts, generations)
+        except Exception as e:
+            self.signals.failed.emit(self.request_id, str(e))
+
+class ShardOpenSignals(QObject):
+    finished = Signal()
+
+class ShardOpenTask:
+    # 在线程池里打开已有的所有人员分片，界面线程只读取已经打开的分片，打开后再刷新
+    def __init__(self, shards, signals):
+        self.shards = shards
+        self.signals = signals
+
+    def run(self):
+        try:
+            self.shards.all()
+        except Exception as e:
+            print(f"Error opening log shards: {e}")
+        self.signals.finished.emit()
+
+class CompactSignals(QObject):
+    finished = Signal(int, bool)
+    failed = Signal(str, bool)
+
+class CompactTask:
+    # 在线程池里压缩旧分区；manual 区分启动时的自动压缩和手动点击，自动压缩不弹出结果
+    def __init__(self, storage, manual, signals):
+        self.storage = storage
+        self.manual = manual
+        self.signals = signals
+
+    def run(self):
+        try:
+            self.signals.finished.emit(self.storage.compact(), self.manual)
+        except Exception as e:
+            self.signals.failed.emit(str(e), self.manual)
+
+class LogIndexSignals(QObject):
+    finished = Signal(int, object, object)
+    failed = Signal(int, str)
+
+class LogIndexTask:
+    # 在线程池里更新行索引的副本并算出筛选/排序后的显示顺序，完成后由界面整体替换，
+    # 界面线程读取的索引从不被修改。只是定时刷新且日志没有变化时 view 为 None
+    def __init__(self, storage, index, category, column, descending, update, request_id, signals):
+        self.storage = storage
+        self.index = index
+        self.category = category
+        self.column = column
+        self.descending = descending
+        self.update = update
+        self.request_id = request_id
+        self.signals = signals
+
+    def run(self):
+        try:
+            index = self.index
+            if self.update:
+                index = index.copy()
+                if not self.storage.update_index(index):
+                    self.signals.finished.emit(self.request_id, self.index, None)
+                    return
+            view = build_view(index, self.category, self.column, self.descending)
+            self.signals.finished.emit(self.request_id, index, view)
+        except Exception as e:
+            self.signals.failed.emit(self.request_id, str(e))
+
+class LogTableModel(QAbstractTableModel):
+    # 虚拟化的原始日志表：行数来自行索引，单元格按页从存储读取，只缓存最近访问的若干页
+    PAGE_SIZE = 200
+    MAX_PAGES = 20
+
+    sort_requested = Signal(int, bool)
+
+    def __init__(self, storage):
+        super().__init__()
+        self.storage = storage
+        self.rows = RowIndex()
+        self.view = range(0)
+        self.pages = OrderedDict()
+
+    def set_rows(self, rows, view):
+        self.beginResetModel()
+        self.rows = rows
+        self.view = view
+        self.pages.clear()
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.view)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(LOG_HEADER)
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return LOG_HEADER[section]
+        return None
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid() or role not in (Qt.ItemDataRole.DisplayRole, Qt.ItemDataRole.ToolTipRole):
+            return None
+        row = self.row_at(index.row())
+        if row is None or index.column() >= len(row):
+            return ""
+        value = row[index.column()]
+        return value if role == Qt.ItemDataRole.ToolTipRole else value.replace('\r', '').replace('\n', ' ')
+
+    def row_at(self, position):
+        page_no = position // self.PAGE_SIZE
+        page = self.pages.get(page_no)
+        if page is None:
+            page = self.load_page(page_no)
+        else:
+            self.pages.move_to_end(page_no)
+        return page[position - page_no * self.PAGE_SIZE]
+
+    def load_page(self, page_no):
+        start = page_no * self.PAGE_SIZE
+        refs = [self.rows.refs[i] for i in self.view[start:start + self.PAGE_SIZE]]
+        try:
+            records = self.storage.read_indexed(self.rows, refs)
+        except Exception as e:
+            print(f"Error reading log page: {e}")
+            records = {}
+        page = [records.get(ref) for ref in refs]
+        self.pages[page_no] = page
+        while len(self.pages) > self.MAX_PAGES:
+            self.pages.popitem(last=False)
+        return page
+
+    def sort(self, column, order=Qt.SortOrder.AscendingOrder):
+        # 排序在后台进行，由窗口重新生成显示顺序；工作内容列不支持排序
+        self.sort_requested.emit(column, order == Qt.SortOrder.DescendingOrder)
+
+class ExportWorker(QThread):
+    # 后台流式导出原始日志，内存占用与日志大小无关
+    progress = Signal(int, int)
+    export_finished = Signal(str)
+    export_failed = Signal(str)
+
+    # Excel 单个工作表的最大行数
+    EXCEL_MAX_ROWS = 1048576
+
+    def __init__(self, storage, file_path, start, end):
+        super().__init__()
+        self.storage = storage
+        self.file_path = file_path
+        self.start_day = start
+        self.end_day = end
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def run(self):
+        try:
+            total = sum(self.storage.category_counts(self.start_day, self.end_day).values())
+            rows = self.storage.iter_rows(self.start_day, self.end_day)
+            if self.file_path.lower().endswith('.xlsx'):
+                self.write_excel(rows, total)
+            else:
+                self.write_delimited(rows, total, '\t' if self.file_path.lower().endswith('.tsv') else ',')
+            rows.close()
+        except ImportError:
+            self.export_failed.emit("导出Excel需要安装openpyxl库\n请运行: pip install openpyxl")
+            return
+        except Exception as e:
+            # 导出到一半失败时不留下不完整的文件
+            try:
+                os.remove(self.file_path)
+            except OSError:
+                pass
+            self.export_failed.emit(f"导出失败: {str(e)}")
+            return
+
+        if self.cancelled:
+            try:
+                os.remove(self.file_path)
+            except OSError:
+                pass
+            return
+        self.export_finished.emit(self.file_path)
+
+    def iter_exported(self, rows, total):
+        for count, row in enumerate(rows, 1):
+            if self.cancelled:
+                return
+            yield (row + ['', '', ''])[:3]
+            if count % 2000 == 0:
+                self.progress.emit(count, max(total, count))
+        self.progress.emit(total, total)
+
+    def write_excel(self, rows, total):
+        from openpyxl import Workbook
+
+        # write_only 模式逐行写入临时文件，不在内存中保留单元格
+        wb = Workbook(write_only=True)
+        ws = None
+        sheet_rows = self.EXCEL_MAX_ROWS
+        for row in self.iter_exported(rows, total):
+            if sheet_rows >= self.EXCEL_MAX_ROWS:
+                ws = wb.create_sheet("工作日志" if ws is None else f"工作日志{len(wb.worksheets) + 1}")
+                ws.column_dimensions['A'].width = 20
+                ws.column_dimensions['B'].width = 20
+                ws.column_dimensions['C'].width = 40
+                ws.append(LOG_HEADER)
+                sheet_rows = 1
+            ws.append(row)
+            sheet_rows += 1
+        if ws is None:
+            ws = wb.create_sheet("工作日志")
+            ws.append(LOG_HEADER)
+        if not self.cancelled:
+            wb.save(self.file_path)
+
+    def write_delimited(self, rows, total, delimiter):
+        with open(self.file_path, 'w', newline='', encoding='utf-8-sig') as f:
+            writer = csv.writer(f, delimiter=delimiter)
+            writer.writerow(LOG_HEADER)
+            for row in self.iter_exported(rows, total):
+                writer.writerow(row)
+
+# --startup-profile 打开时记录启动各阶段完成的时间点
+startup_marks = None
+
+def startup_mark(name):
+    if startup_marks is not None:
+        startup_marks.append((name, time.perf_counter()))
+
+def report_startup_profile():
+    startup_mark("首次处理事件")
+    previous = STARTUP_BEGIN
+    print("启动耗时:", file=sys.stderr)
+    for name, t in startup_marks:
+        print(f"  {name:<12}{(t - previous) * 1000:8.1f} ms   累计 {(t - STARTUP_BEGIN) * 1000:8.1f} ms", file=sys.stderr)
+        previous = t
+    loaded = [name for name in ("flask", "werkzeug", "qrcode", "PIL", "openpyxl") if name in sys.modules]
+    print(f"  启动时已加载的可选库: {', '.join(loaded) or '无'}", file=sys.stderr)
+
+# 卡顿监测：主线程的心跳间隔、默认阈值，报告文件的大小上限和保留份数
+STALL_BEAT_MS = 100
+STALL_THRESHOLD_MS = 500
+STALL_LOG_BYTES = 1 << 20
+STALL_LOG_BACKUPS = 3
+# 最多保留的 cProfile 结果文件数
+PROFILE_KEEP = 20
+
+def stall_logger(log_dir):
+    # 卡顿报告和慢操作分析写入 worklog-stalls.log，满 1MB 轮换
+    logger = logging.getLogger("worklog.stalls")
+    if not logger.handlers:
+        handler = RotatingFileHandler(os.path.join(log_dir, "worklog-stalls.log"), maxBytes=STALL_LOG_BYTES,
+                                      backupCount=STALL_LOG_BACKUPS, encoding='utf-8', delay=True)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+    return logger
+
+class StallWatchdog:
+    # 主线程用 QTimer 打心跳，监测线程发现心跳停了超过阈值，就记下主线程的调用栈和日志锁的持有者
+    # （连同持有线程的调用栈）。每次卡顿只报告一次，恢复后再补记总时长
+    def __init__(self, logger, lock=None, threshold_ms=STALL_THRESHOLD_MS):
+        self.logger = logger
+        self.lock = lock
+        self.threshold = threshold_ms / 1000
+        self.main_thread = threading.get_ident()
+        self.beat = time.monotonic()
+        self.active = True
+        self.timer = QTimer()
+        self.timer.setInterval(STALL_BEAT_MS)
+        self.timer.timeout.connect(self.heartbeat)
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.beat = time.monotonic()
+        self.stopped.clear()
+        self.timer.start()
+        self.thread = threading.Thread(target=self._run, name="stall-watchdog", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.timer.stop()
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def heartbeat(self):
+        self.beat = time.monotonic()
+        # macOS 的 App Nap 会推迟后台程序的定时器，程序不在前台时的停顿不算卡顿
+        self.active = QApplication.applicationState() == Qt.ApplicationState.ApplicationActive
+
+    def _run(self):
+        interval = STALL_BEAT_MS / 1000
+        stalled_at = None
+        while not self.stopped.wait(interval):
+            beat = self.beat
+            if stalled_at is not None and beat != stalled_at:
+                duration = beat - stalled_at - interval
+                metrics.observe("worklog_ui_stall_seconds", duration)
+                self.logger.warning("界面卡顿结束，共 %.0f 毫秒", duration * 1000)
+                stalled_at = None
+            lag = time.monotonic() - beat - interval
+            if stalled_at is None and lag >= self.threshold and self.active:
+                stalled_at = beat
+                metrics.inc("worklog_ui_stalls_total")
+                self.logger.warning(self.report(lag))
+
+    def report(self, lag):
+        frames = sys._current_frames()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        lines = [f"界面已卡顿 {lag * 1000:.0f} 毫秒（阈值 {self.threshold * 1000:.0f} 毫秒），主线程调用栈:\n"]
+        if self.main_thread in frames:
+            lines.extend(traceback.format_stack(frames[self.main_thread]))
+        if self.lock is not None:
+            owners, waiting = self.lock.owners()
+            if not owners:
+                lines.append(f"日志锁: 本进程内没有线程持有，等待写锁 {waiting} 个\n")
+            for mode, ident in owners:
+                lines.append(f"日志锁: {names.get(ident, ident)} 持有{'写锁' if mode == 'write' else '读锁'}，"
+                             f"等待写锁 {waiting} 个\n")
+                if ident != self.main_thread and ident in frames:
+                    lines.extend(traceback.format_stack(frames[ident]))
+        return "".join(lines).rstrip()
+
+class OperationProfiler:
+    # 可选的逐操作 cProfile：耗时超过阈值的操作把最耗时的函数写进卡顿日志，
+    # 并保存 .prof 文件，可以用 pstats 或 snakeviz 查看
+    def __init__(self, logger, profile_dir, threshold_ms=STALL_THRESHOLD_MS):
+        self.logger = logger
+        self.profile_dir = profile_dir
+        self.threshold = threshold_ms / 1000
+        self.enabled = False
+
+    @contextmanager
+    def profile(self, name):
+        if not self.enabled:
+            yield
+            return
+        import cProfile
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # 已经有分析器在运行（嵌套的操作），只分析最外层
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            elapsed = time.perf_counter() - start
+            metrics.observe("worklog_operation_duration_seconds", elapsed, (('operation', name),))
+            if elapsed >= self.threshold:
+                self.save(name, profiler, elapsed)
+
+    def save(self, name, profiler, elapsed):
+        import pstats
+        try:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            path = os.path.join(self.profile_dir, f"{name}-{datetime.now():%Y%m%d-%H%M%S-%f}.prof")
+            profiler.dump_stats(path)
+            profiles = [os.path.join(self.profile_dir, f) for f in os.listdir(self.profile_dir) if f.endswith(".prof")]
+            for old in sorted(profiles, key=os.path.getmtime)[:-PROFILE_KEEP]:
+                os.remove(old)
+        except OSError as e:
+            path = f"保存失败: {e}"
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(25)
+        self.logger.warning("慢操作 %s 耗时 %.0f 毫秒，分析结果 %s\n%s", name, elapsed * 1000, path,
+                            text.getvalue().strip())
+
+def app_settings():
+    # 按 QSettings.defaultFormat() 打开设置（默认是系统原生格式），基准测试改成 INI 格式写到临时目录
+    return QSettings(QSettings.defaultFormat(), QSettings.UserScope, "MyCompany", "WorkLogRecorder")
+
 class WorkLogRecorder(QMainWindow):
     def __init__(self):
         super().__init__()
@@ -302,24 +4213,66 @@ class WorkLogRecorder(QMainWindow):
         documents_path = os.path.expanduser('~/Documents/WorkLog')
         if not os.path.exists(documents_path):
             os.makedirs(documents_path)
-        self.log_file = os.path.join(documents_path, "worklog.csv")
-
-        self.categories = [
-            "电脑硬件维修", "电脑软件维修类", "打印机维护", "网络设备维护",
-            "安防设备维护", "服务器维护", "硬件测试", "软件测试",
-            "OA后台业务维护", "ERP维护", "PLM维护", "CRM维护", "加密系统维护",
-            "SMB维护", "云平台业务维护", "电话系统维护", "投影仪维修调试",
-            "音响维修调试", "电路维修调试", "咨询服务", "系统重装", "食堂打卡机", "立库维护", "其他"
-        ]
+        self.log_dir = documents_path
+
+        # 初始化设置
+        self.settings = app_settings()
+        self.storage_backend = self.settings.value("storage_backend", "csv")
+        if self.storage_backend not in STORAGE_BACKENDS:
+            self.storage_backend = "csv"
+        self.storage = open_storage(documents_path, self.storage_backend)
+        self.writer = None
+        self.shards = None
+        self.log_view = None
+        self.opened_log_view = None
+        startup_mark("读取设置")
+        metrics.set_gauge("worklog_log_size_bytes", self.storage.disk_usage)
+        metrics.set_gauge("worklog_log_rows", self.storage.row_count)
+
+        self.categories = list(CATEGORIES)
+
+        # 卡顿监测和慢操作分析默认关闭，在诊断页开启
+        self.stall_log = stall_logger(documents_path)
+        stall_threshold = self.settings.value("stall_threshold_ms", STALL_THRESHOLD_MS, type=int)
+        self.profiler = OperationProfiler(self.stall_log, os.path.join(documents_path, "profiles"), stall_threshold)
+        self.profiler.enabled = self.settings.value("profile_operations", False, type=bool)
+        self.watchdog = None
         
         self.server_thread = None
         self.server_url = ""
-
-        # 初始化设置
-        self.settings = QSettings("MyCompany", "WorkLogRecorder")
+        self.export_worker = None
+        self.stats_task = None
+        self.stats_request_id = 0
+        self.stats_signals = StatsSignals()
+        self.stats_signals.progress.connect(self.on_stats_progress)
+        self.stats_signals.result.connect(self.on_stats_result)
+        self.stats_signals.pivot.connect(self.on_stats_pivot)
+        self.stats_signals.failed.connect(self.on_stats_failed)
+        self.stats_view = None
+        # 写线程发布的新增/撤销事件，用来增量更新统计表和日志浏览
+        self.log_events = LogEventBus()
+        self.log_events.appended.connect(self.on_log_appended)
+        self.log_events.undone.connect(self.on_log_undone)
+        self.shard_signals = ShardOpenSignals()
+        self.shard_signals.finished.connect(self.on_shards_opened)
+        self.compact_task = None
+        self.compact_signals = CompactSignals()
+        self.compact_signals.finished.connect(self.on_compact_finished)
+        self.compact_signals.failed.connect(self.on_compact_failed)
+        self.browse_task = None
+        self.browse_request_id = 0
+        self.browse_signals = LogIndexSignals()
+        self.browse_signals.finished.connect(self.on_browse_indexed)
+        self.browse_signals.failed.connect(self.on_browse_failed)
+        self.browse_sort = (0, True)
 
         self.init_ui()
+        startup_mark("创建界面")
         self.load_data()
+        startup_mark("打开日志")
+        # 等事件循环开始运行后再监测，启动过程本身不算卡顿
+        if self.watchdog_cb.isChecked():
+            QTimer.singleShot(0, lambda: self.set_watchdog(True))
         
         # 检查自动启动
         self.check_auto_start()
@@ -338,14 +4291,22 @@ class WorkLogRecorder(QMainWindow):
         
         self.stats_tab = QWidget()
         self.tab_widget.addTab(self.stats_tab, "统计报表")
+
+        self.browse_tab = QWidget()
+        self.tab_widget.addTab(self.browse_tab, "日志浏览")
         
         # 新增手机同步标签页
         self.mobile_tab = QWidget()
         self.tab_widget.addTab(self.mobile_tab, "手机同步")
+
+        self.diagnostics_tab = QWidget()
+        self.tab_widget.addTab(self.diagnostics_tab, "诊断")
         
         self.init_record_tab()
         self.init_stats_tab()
+        self.init_browse_tab()
         self.init_mobile_tab()
+        self.init_diagnostics_tab()
 
     def init_record_tab(self):
         record_layout = QVBoxLayout(self.record_tab)
@@ -370,7 +4331,27 @@ class WorkLogRecorder(QMainWindow):
         undo_btn.setStyleSheet("background-color: #dc3545; color: white; padding: 10px; font-weight: bold; border-radius: 5px;")
         undo_btn.clicked.connect(self.undo_last_log)
         record_layout.addWidget(undo_btn)
-        record_layout.addStretch()
+
+        # 今天的记录：只从日志末尾往回读，新增/撤销后直接重新读取
+        self.today_group = QGroupBox("今天的记录")
+        today_layout = QVBoxLayout()
+        self.today_group.setLayout(today_layout)
+        self.today_table = QTableWidget()
+        self.today_table.setColumnCount(3)
+        self.today_table.setHorizontalHeaderLabels(["时间", "工作类别", "工作内容"])
+        self.today_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.today_table.verticalHeader().setVisible(False)
+        self.today_table.horizontalHeader().setStretchLastSection(True)
+        self.today_table.setColumnWidth(0, 80)
+        self.today_table.setColumnWidth(1, 140)
+        today_layout.addWidget(self.today_table)
+        record_layout.addWidget(self.today_group)
+
+        # 另一个程序副本写入的记录和跨过零点都没有事件，记录页可见时每分钟重新读一次
+        self.today_timer = QTimer(self)
+        self.today_timer.setInterval(60000)
+        self.today_timer.timeout.connect(self.refresh_today)
+        self.today_timer.start()
 
     def init_stats_tab(self):
         stats_layout = QVBoxLayout(self.stats_tab)
@@ -391,9 +4372,32 @@ class WorkLogRecorder(QMainWindow):
         self.stats_end_date.setDate(QDate.currentDate())
         filter_layout.addWidget(self.stats_end_date, 0, 3)
 
+        filter_layout.addWidget(QLabel("分组:"), 0, 4)
+        self.stats_group_combo = QComboBox()
+        for key, label in GROUP_DIMENSIONS.items():
+            self.stats_group_combo.addItem(label, key)
+        filter_layout.addWidget(self.stats_group_combo, 0, 5)
+
         stats_btn = QPushButton("生成统计")
         stats_btn.clicked.connect(self.generate_stats)
-        filter_layout.addWidget(stats_btn, 0, 4)
+        filter_layout.addWidget(stats_btn, 0, 6)
+
+        # 全部人员时合并所有人的日志分片
+        filter_layout.addWidget(QLabel("人员:"), 1, 0)
+        self.stats_user_combo = QComboBox()
+        self.stats_user_combo.addItem("全部人员", None)
+        self.stats_user_combo.addItem(user_label(""), "")
+        filter_layout.addWidget(self.stats_user_combo, 1, 1)
+
+        self.stats_progress = QProgressBar()
+        self.stats_progress.setVisible(False)
+        filter_layout.addWidget(self.stats_progress, 2, 0, 1, 7)
+
+        # 日期范围改变时取消正在进行的统计
+        self.stats_start_date.dateChanged.connect(self.cancel_stats)
+        self.stats_end_date.dateChanged.connect(self.cancel_stats)
+        self.stats_group_combo.currentIndexChanged.connect(self.cancel_stats)
+        self.stats_user_combo.currentIndexChanged.connect(self.cancel_stats)
 
         stats_layout.addWidget(filter_group)
 
@@ -411,8 +4415,175 @@ class WorkLogRecorder(QMainWindow):
         export_stats_excel_btn.clicked.connect(self.export_stats_excel)
         export_stats_layout.addWidget(export_stats_excel_btn)
 
+        export_raw_btn = QPushButton("导出原始日志")
+        export_raw_btn.clicked.connect(self.export_raw_log)
+        export_stats_layout.addWidget(export_raw_btn)
+
         stats_layout.addWidget(export_stats_group)
 
+        storage_group = QGroupBox("数据存储")
+        storage_layout = QHBoxLayout()
+        storage_group.setLayout(storage_layout)
+
+        storage_layout.addWidget(QLabel("存储引擎:"))
+        self.storage_combo = QComboBox()
+        for key, label in STORAGE_BACKENDS.items():
+            self.storage_combo.addItem(label, key)
+        self.storage_combo.setCurrentIndex(self.storage_combo.findData(self.storage_backend))
+        self.storage_combo.currentIndexChanged.connect(self.change_storage_backend)
+        storage_layout.addWidget(self.storage_combo)
+
+        storage_layout.addWidget(QLabel("落盘策略:"))
+        self.durability_combo = QComboBox()
+        for key, label in DURABILITY_MODES.items():
+            self.durability_combo.addItem(label, key)
+        durability_index = self.durability_combo.findData(self.settings.value("durability", "always"))
+        self.durability_combo.setCurrentIndex(max(durability_index, 0))
+        self.durability_combo.currentIndexChanged.connect(self.change_durability)
+        storage_layout.addWidget(self.durability_combo)
+
+        rebuild_btn = QPushButton("重建统计汇总")
+        rebuild_btn.clicked.connect(self.rebuild_rollups)
+        storage_layout.addWidget(rebuild_btn)
+
+        self.compact_btn = QPushButton("压缩旧数据")
+        self.compact_btn.clicked.connect(lambda: self.compact_storage(manual=True))
+        storage_layout.addWidget(self.compact_btn)
+        storage_layout.addStretch()
+
+        stats_layout.addWidget(storage_group)
+
+    def init_browse_tab(self):
+        layout = QVBoxLayout(self.browse_tab)
+
+        filter_layout = QHBoxLayout()
+        filter_layout.addWidget(QLabel("工作类别:"))
+        self.browse_category_combo = QComboBox()
+        self.browse_category_combo.addItem("全部", None)
+        for category in self.categories:
+            self.browse_category_combo.addItem(category, category)
+        self.browse_category_combo.currentIndexChanged.connect(lambda: self.refresh_browse(update=False))
+        filter_layout.addWidget(self.browse_category_combo)
+
+        self.browse_count_label = QLabel("共 0 条")
+        filter_layout.addWidget(self.browse_count_label)
+        filter_layout.addStretch()
+
+        refresh_btn = QPushButton("刷新")
+        refresh_btn.clicked.connect(self.refresh_browse)
+        filter_layout.addWidget(refresh_btn)
+        layout.addLayout(filter_layout)
+
+        # 全文搜索：多个词用空格分隔，要求全部出现
+        search_layout = QHBoxLayout()
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("搜索工作内容，例如: 打印机 卡纸")
+        self.search_edit.returnPressed.connect(self.search_logs)
+        self.search_edit.textChanged.connect(lambda text: text.strip() or self.clear_search())
+        search_layout.addWidget(self.search_edit)
+        search_btn = QPushButton("搜索")
+        search_btn.clicked.connect(self.search_logs)
+        search_layout.addWidget(search_btn)
+        self.search_label = QLabel()
+        search_layout.addWidget(self.search_label)
+        layout.addLayout(search_layout)
+
+        self.search_table = QTableWidget()
+        self.search_table.setColumnCount(3)
+        self.search_table.setHorizontalHeaderLabels(["时间", "工作类别", "工作内容"])
+        self.search_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.search_table.verticalHeader().setVisible(False)
+        self.search_table.horizontalHeader().setStretchLastSection(True)
+        self.search_table.setColumnWidth(0, 160)
+        self.search_table.setColumnWidth(1, 140)
+        self.search_table.hide()
+        layout.addWidget(self.search_table)
+
+        self.browse_model = LogTableModel(self.storage)
+        self.browse_model.sort_requested.connect(self.sort_browse)
+        self.browse_view = QTableView()
+        self.browse_view.setModel(self.browse_model)
+        self.browse_view.setWordWrap(False)
+        self.browse_view.verticalHeader().setVisible(False)
+        self.browse_view.verticalHeader().setDefaultSectionSize(self.browse_view.fontMetrics().height() + 8)
+        self.browse_view.horizontalHeader().setStretchLastSection(True)
+        self.browse_view.horizontalHeader().setSortIndicator(0, Qt.SortOrder.DescendingOrder)
+        self.browse_view.setSortingEnabled(True)
+        self.browse_view.setColumnWidth(0, 160)
+        self.browse_view.setColumnWidth(1, 140)
+        layout.addWidget(self.browse_view)
+
+        # 日志浏览页可见时每 2 秒增量更新一次索引
+        self.browse_timer = QTimer(self)
+        self.browse_timer.setInterval(2000)
+        self.browse_timer.timeout.connect(self.refresh_browse)
+
+    def refresh_browse(self, update=True):
+        # 正在更新索引时定时刷新不再重复提交；改变筛选或排序会替换掉它，由新任务接着更新
+        if self.browse_task is not None and self.browse_task.update:
+            if update:
+                return
+            update = True
+        self.browse_request_id += 1
+        column, descending = self.browse_sort
+        self.browse_task = LogIndexTask(self.log_view, self.browse_model.rows,
+                                        self.browse_category_combo.currentData(), column, descending,
+                                        update, self.browse_request_id, self.browse_signals)
+        QThreadPool.globalInstance().start(self.browse_task.run)
+
+    def sort_browse(self, column, descending):
+        if column >= 2:
+            return
+        self.browse_sort = (column, descending)
+        self.refresh_browse(update=False)
+
+    def on_browse_indexed(self, request_id, rows, view):
+        if request_id != self.browse_request_id:
+            return
+        self.browse_task = None
+        if view is None:
+            return
+        scroll = self.browse_view.verticalScrollBar().value()
+        self.browse_model.set_rows(rows, view)
+        self.browse_view.verticalScrollBar().setValue(scroll)
+        self.browse_count_label.setText(f"共 {len(view)} 条")
+
+    def search_logs(self):
+        query = self.search_edit.text().strip()
+        if not query:
+            self.clear_search()
+            return
+        try:
+            start = time.perf_counter()
+            with metrics.timer("worklog_search_duration_seconds"), self.profiler.profile("search_logs"):
+                rows = self.opened_log_view.search(query)
+            elapsed = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            CustomMessageBox(self, "错误", f"搜索失败: {str(e)}").exec()
+            return
+
+        self.search_table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            for col, value in enumerate(row):
+                self.search_table.setItem(i, col, QTableWidgetItem(value.replace("\n", " ")))
+        more = f"，只显示最新的 {SEARCH_LIMIT} 条" if len(rows) >= SEARCH_LIMIT else ""
+        self.search_label.setText(f"找到 {len(rows)} 条{more} ({elapsed:.1f} 毫秒)")
+        self.browse_view.hide()
+        self.search_table.show()
+
+    def clear_search(self):
+        self.search_label.clear()
+        self.search_table.hide()
+        self.search_table.setRowCount(0)
+        self.browse_view.show()
+
+    def on_browse_failed(self, request_id, error_msg):
+        if request_id != self.browse_request_id:
+            return
+        self.browse_task = None
+        self.browse_timer.stop()
+        CustomMessageBox(self, "错误", f"读取日志文件失败: {error_msg}").exec()
+
     def init_mobile_tab(self):
         layout = QVBoxLayout(self.mobile_tab)
         
@@ -433,11 +4604,28 @@ class WorkLogRecorder(QMainWindow):
         self.password_edit.textChanged.connect(self.update_password)
         control_layout.addWidget(self.password_edit, 1, 1)
 
+        control_layout.addWidget(QLabel("服务模式:"), 2, 0)
+        self.server_mode_combo = QComboBox()
+        for key, label in SERVER_MODES.items():
+            self.server_mode_combo.addItem(label, key)
+        mode_index = self.server_mode_combo.findData(self.settings.value("server_mode", "pool"))
+        self.server_mode_combo.setCurrentIndex(max(mode_index, 0))
+        self.server_mode_combo.currentIndexChanged.connect(
+            lambda index: self.settings.setValue("server_mode", self.server_mode_combo.itemData(index)))
+        control_layout.addWidget(self.server_mode_combo, 2, 1)
+
+        control_layout.addWidget(QLabel("最大并发:"), 3, 0)
+        self.server_workers_spin = QSpinBox()
+        self.server_workers_spin.setRange(1, 64)
+        self.server_workers_spin.setValue(self.settings.value("server_workers", 8, type=int))
+        self.server_workers_spin.valueChanged.connect(lambda value: self.settings.setValue("server_workers", value))
+        control_layout.addWidget(self.server_workers_spin, 3, 1)
+
         # 自动启动复选框
         self.auto_start_cb = QCheckBox("启动时自动开启 (延迟60秒)")
         self.auto_start_cb.setChecked(self.settings.value("auto_start_mobile_sync", False, type=bool))
         self.auto_start_cb.stateChanged.connect(self.toggle_auto_start)
-        control_layout.addWidget(self.auto_start_cb, 2, 0, 1, 2)
+        control_layout.addWidget(self.auto_start_cb, 4, 0, 1, 2)
         
         layout.addWidget(control_group)
         
@@ -465,16 +4653,142 @@ class WorkLogRecorder(QMainWindow):
         layout.addWidget(self.info_group)
         layout.addStretch()
 
+    def init_diagnostics_tab(self):
+        layout = QVBoxLayout(self.diagnostics_tab)
+
+        self.diagnostics_summary = QLabel()
+        layout.addWidget(self.diagnostics_summary)
+
+        self.diagnostics_table = QTableWidget()
+        self.diagnostics_table.setColumnCount(6)
+        self.diagnostics_table.setHorizontalHeaderLabels(["指标", "标签", "次数", "平均(毫秒)", "P95(毫秒)", "最大(毫秒)"])
+        self.diagnostics_table.horizontalHeader().setStretchLastSection(True)
+        layout.addWidget(self.diagnostics_table)
+
+        refresh_btn = QPushButton("刷新")
+        refresh_btn.clicked.connect(self.refresh_diagnostics)
+        layout.addWidget(refresh_btn)
+
+        stall_group = QGroupBox("卡顿监测")
+        stall_layout = QHBoxLayout()
+        stall_group.setLayout(stall_layout)
+
+        self.watchdog_cb = QCheckBox("监测界面卡顿")
+        self.watchdog_cb.setChecked(self.settings.value("stall_watchdog", False, type=bool))
+        self.watchdog_cb.stateChanged.connect(lambda state: self.set_watchdog(bool(state)))
+        stall_layout.addWidget(self.watchdog_cb)
+
+        stall_layout.addWidget(QLabel("阈值(毫秒):"))
+        self.stall_threshold_spin = QSpinBox()
+        self.stall_threshold_spin.setRange(100, 10000)
+        self.stall_threshold_spin.setSingleStep(100)
+        self.stall_threshold_spin.setValue(int(self.profiler.threshold * 1000))
+        self.stall_threshold_spin.valueChanged.connect(self.change_stall_threshold)
+        stall_layout.addWidget(self.stall_threshold_spin)
+
+        self.profile_cb = QCheckBox("慢操作记录 cProfile 分析")
+        self.profile_cb.setChecked(self.profiler.enabled)
+        self.profile_cb.stateChanged.connect(self.toggle_profiling)
+        stall_layout.addWidget(self.profile_cb)
+        stall_layout.addStretch()
+
+        stall_path = QLabel(f"报告写入 {os.path.join(self.log_dir, 'worklog-stalls.log')}")
+        stall_path.setTextInteractionFlags(Qt.TextInteractionFlag.TextSelectableByMouse)
+        stall_layout.addWidget(stall_path)
+        layout.addWidget(stall_group)
+
+        # 只在诊断页可见时每秒刷新一次
+        self.diagnostics_timer = QTimer(self)
+        self.diagnostics_timer.setInterval(1000)
+        self.diagnostics_timer.timeout.connect(self.refresh_diagnostics)
+        self.tab_widget.currentChanged.connect(self.on_tab_changed)
+
+    def set_watchdog(self, enabled):
+        self.settings.setValue("stall_watchdog", enabled)
+        if self.watchdog is not None:
+            self.watchdog.stop()
+            self.watchdog = None
+        if enabled:
+            self.watchdog = StallWatchdog(self.stall_log, self.storage.lock, self.stall_threshold_spin.value())
+            self.watchdog.start()
+
+    def change_stall_threshold(self, value):
+        self.settings.setValue("stall_threshold_ms", value)
+        self.profiler.threshold = value / 1000
+        if self.watchdog is not None:
+            self.watchdog.threshold = value / 1000
+
+    def toggle_profiling(self, state):
+        self.settings.setValue("profile_operations", bool(state))
+        self.profiler.enabled = bool(state)
+
+    def refresh_stats_users(self):
+        # 手机用户第一次登录后才有自己的分片，切到统计页时补进人员列表
+        if self.shards is None:
+            return
+        known = {self.stats_user_combo.itemData(i) for i in range(self.stats_user_combo.count())}
+        for user in self.shards.users():
+            if user not in known:
+                self.stats_user_combo.addItem(user_label(user), user)
+
+    def on_tab_changed(self, index):
+        if self.tab_widget.widget(index) is self.stats_tab:
+            self.refresh_stats_users()
+        if self.tab_widget.widget(index) is self.record_tab:
+            self.refresh_today()
+            self.today_timer.start()
+        else:
+            self.today_timer.stop()
+        if self.tab_widget.widget(index) is self.diagnostics_tab:
+            self.refresh_diagnostics()
+            self.diagnostics_timer.start()
+        else:
+            self.diagnostics_timer.stop()
+        if self.tab_widget.widget(index) is self.browse_tab:
+            self.refresh_browse()
+            self.browse_timer.start()
+        else:
+            self.browse_timer.stop()
+
+    def refresh_diagnostics(self):
+        counters, histograms, gauges = metrics.snapshot()
+        gauges = dict(gauges)
+        self.diagnostics_summary.setText(
+            f"日志大小: {gauges.get('worklog_log_size_bytes', 0) / 1024 / 1024:.2f} MB    "
+            f"记录条数: {gauges.get('worklog_log_rows', 0)}")
+
+        rows = []
+        for (name, labels), value in counters:
+            rows.append((name, labels, value, None))
+        for (name, labels), h in histograms:
+            rows.append((name, labels, h.count, h))
+
+        self.diagnostics_table.setRowCount(len(rows))
+        for row, (name, labels, count, h) in enumerate(rows):
+            values = [METRIC_HELP.get(name, name), ", ".join(f"{k}={v}" for k, v in labels), str(count)]
+            if h is not None and h.count:
+                values += [f"{h.sum / h.count * 1000:.2f}", f"{h.quantile(0.95) * 1000:.2f}", f"{h.max * 1000:.2f}"]
+            else:
+                values += ["", "", ""]
+            for col, value in enumerate(values):
+                self.diagnostics_table.setItem(row, col, QTableWidgetItem(value))
+        self.diagnostics_table.resizeColumnsToContents()
+
     def toggle_server(self, checked):
         if checked:
             self.server_btn.setText("停止手机记录")
             self.password_edit.setEnabled(False)
+            self.server_mode_combo.setEnabled(False)
+            self.server_workers_spin.setEnabled(False)
             
             # 启动服务器线程
             self.server_thread = MobileServerThread(
-                self.log_file, 
+                self.writer, 
                 self.categories, 
-                self.password_edit.text()
+                self.password_edit.text(),
+                mode=self.server_mode_combo.currentData(),
+                workers=self.server_workers_spin.value(),
+                shards=self.shards
             )
             self.server_thread.server_started.connect(self.on_server_started)
             self.server_thread.server_error.connect(self.on_server_error)
@@ -482,6 +4796,8 @@ class WorkLogRecorder(QMainWindow):
         else:
             self.server_btn.setText("开启手机记录")
             self.password_edit.setEnabled(True)
+            self.server_mode_combo.setEnabled(True)
+            self.server_workers_spin.setEnabled(True)
             self.info_group.setVisible(False)
             
             if self.server_thread:
@@ -501,6 +4817,7 @@ class WorkLogRecorder(QMainWindow):
         CustomMessageBox(self, "启动失败", f"无法启动服务器: {error_msg}").exec()
 
     def generate_qr_code(self, data):
+        import qrcode
         qr = qrcode.QRCode(version=1, box_size=10, border=2)
         qr.add_data(data)
         qr.make(fit=True)
@@ -519,17 +4836,29 @@ class WorkLogRecorder(QMainWindow):
             self.server_thread.update_password(text)
 
     def load_data(self):
-        if not os.path.exists(self.log_file):
-            try:
-                with file_lock:
-                    with open(self.log_file, 'w', newline='', encoding='utf-8-sig') as f:
-                        writer = csv.writer(f)
-                        writer.writerow(['时间', '工作类别', '工作内容'])
-            except Exception as e:
-                CustomMessageBox(self, "错误", f"创建日志文件失败: {str(e)}").exec()
+        try:
+            self.storage.ensure_created()
+        except Exception as e:
+            CustomMessageBox(self, "错误", f"创建日志文件失败: {str(e)}").exec()
+        durability = self.settings.value("durability", "always")
+        self.writer = LogWriter(self.storage, durability if durability in DURABILITY_MODES else "always",
+                                events=self.log_events)
+        self.shards = LogShards(self.log_dir, self.storage_backend, LogShard("", self.storage, self.writer),
+                                events=self.log_events)
+        # 导出、搜索、日志浏览和今天的记录都包含所有人的记录。
+        # 后台任务用 log_view；界面线程的搜索和今天的记录用 opened_log_view，只读已打开的分片，
+        # 其他分片在后台打开后再刷新
+        self.log_view = MergedLogView(self.shards)
+        self.opened_log_view = MergedLogView(self.shards, open_all=False)
+        self.browse_model.storage = self.log_view
+        self.refresh_today()
+        QThreadPool.globalInstance().start(ShardOpenTask(self.shards, self.shard_signals).run)
+        # 启动后在后台把旧月份压缩归档，不影响记录
+        if self.storage_backend == "partitioned":
+            self.compact_storage(manual=False)
 
     def log_work(self, category):
-        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        current_time = datetime.now().strftime(TIME_FORMAT)
         content = ""
         
         if category == "其他":
@@ -561,52 +4890,19 @@ class WorkLogRecorder(QMainWindow):
     
     def save_log_entry(self, time, category, content):
         try:
-            with file_lock:
-                if not os.path.exists(self.log_file):
-                    self.load_data()
-                
-                with open(self.log_file, 'a', newline='', encoding='utf-8-sig') as f:
-                    writer = csv.writer(f)
-                    writer.writerow([time, category, content])
-            
+            with self.profiler.profile("save_log_entry"):
+                self.writer.append(time, category, content)
             CustomMessageBox(self, "成功", "工作日志已记录！").exec()
         except Exception as e:
             CustomMessageBox(self, "错误", f"保存日志失败: {str(e)}").exec()
 
     def undo_last_log(self):
         try:
-            with file_lock:
-                if not os.path.exists(self.log_file):
-                    CustomMessageBox(self, "提示", "日志文件不存在").exec()
-                    return
-
-                lines = []
-                with open(self.log_file, 'r', encoding='utf-8-sig') as f:
-                    reader = csv.reader(f)
-                    lines = list(reader)
-
-                if len(lines) <= 1:
-                    CustomMessageBox(self, "提示", "没有可撤销的记录").exec()
-                    return
-
-                last_row = lines[-1]
-                if not last_row:
-                    return
-
-                log_time_str = last_row[0]
-                try:
-                    log_time = datetime.strptime(log_time_str, "%Y-%m-%d %H:%M:%S")
-                    if (datetime.now() - log_time).total_seconds() <= 60:
-                        lines.pop()
-                        with open(self.log_file, 'w', newline='', encoding='utf-8-sig') as f:
-                            writer = csv.writer(f)
-                            writer.writerows(lines)
-                        CustomMessageBox(self, "成功", "已撤销上一条记录").exec()
-                    else:
-                        CustomMessageBox(self, "失败", "只能撤销1分钟内的记录").exec()
-                except ValueError:
-                    CustomMessageBox(self, "错误", "无法解析最后一条记录的时间").exec()
-
+            with self.profiler.profile("undo_last_log"):
+                self.writer.undo_last()
+            CustomMessageBox(self, "成功", "已撤销上一条记录").exec()
+        except UndoError as e:
+            CustomMessageBox(self, "提示", str(e)).exec()
         except Exception as e:
             CustomMessageBox(self, "错误", f"撤销失败: {str(e)}").exec()
     
@@ -630,24 +4926,23 @@ class WorkLogRecorder(QMainWindow):
                     ws = wb.active
                     ws.title = "工作统计"
                     
-                    headers = ['工作类别', '次数', '归档统计']
-                    for col, header in enumerate(headers, 1):
-                        ws.cell(row=1, column=col, value=header)
+                    # 按表格当前内容导出，分组统计时列为各类别
+                    for col in range(self.stats_table.columnCount()):
+                        header = self.stats_table.horizontalHeaderItem(col).text()
+                        ws.cell(row=1, column=col+1, value=header)
                     
                     for row in range(self.stats_table.rowCount()):
-                        category = self.stats_table.item(row, 0).text()
-                        count = int(self.stats_table.item(row, 1).text())
-                        archive = self.stats_table.item(row, 2).text()
-                        
-                        ws.cell(row=row+2, column=1, value=category)
-                        ws.cell(row=row+2, column=2, value=count)
-                        ws.cell(row=row+2, column=3, value=archive)
+                        for col in range(self.stats_table.columnCount()):
+                            item = self.stats_table.item(row, col)
+                            text = item.text() if item else ""
+                            ws.cell(row=row+2, column=col+1, value=int(text) if text.isdigit() else text)
                     
                     ws.column_dimensions['A'].width = 20
                     ws.column_dimensions['B'].width = 10
                     ws.column_dimensions['C'].width = 25
                     
-                    wb.save(file_path)
+                    with self.profiler.profile("export_stats_excel"):
+                        wb.save(file_path)
                     CustomMessageBox(self, "成功", f"统计数据已导出至 {file_path}").exec()
                     
                 except ImportError:
@@ -658,46 +4953,287 @@ class WorkLogRecorder(QMainWindow):
         except Exception as e:
             CustomMessageBox(self, "错误", f"导出Excel失败: {str(e)}").exec()
 
+    def change_storage_backend(self, index):
+        backend = self.storage_combo.itemData(index)
+        if backend == self.settings.value("storage_backend", "csv"):
+            return
+        error = backend_switch_error(self.log_dir, self.storage_backend, backend)
+        if error:
+            # 拒绝切换，下拉框恢复成当前设置
+            self.storage_combo.blockSignals(True)
+            self.storage_combo.setCurrentIndex(self.storage_combo.findData(self.settings.value("storage_backend", "csv")))
+            self.storage_combo.blockSignals(False)
+            CustomMessageBox(self, "不能切换", error).exec()
+            return
+        self.settings.setValue("storage_backend", backend)
+        message = "存储引擎将在重启后生效"
+        if backend == "sqlite":
+            message += "\n首次启动时会自动导入现有的 worklog.csv"
+        elif backend == "partitioned":
+            message += "\n首次启动时会自动把现有的 worklog.csv 按月拆分"
+        CustomMessageBox(self, "提示", message).exec()
+
+    def change_durability(self, index):
+        durability = self.durability_combo.itemData(index)
+        self.settings.setValue("durability", durability)
+        if self.shards:
+            self.shards.set_durability(durability)
+
+    def rebuild_rollups(self):
+        try:
+            with self.profiler.profile("rebuild_rollups"):
+                self.log_view.rebuild_rollups()
+            CustomMessageBox(self, "成功", "统计汇总和搜索索引已从原始日志重建").exec()
+        except Exception as e:
+            CustomMessageBox(self, "错误", f"重建统计汇总失败: {str(e)}").exec()
+
+    def compact_storage(self, manual):
+        if self.storage_backend != "partitioned":
+            CustomMessageBox(self, "提示", "只有按月分区存储支持压缩旧数据").exec()
+            return
+        if self.compact_task is not None:
+            if manual:
+                CustomMessageBox(self, "提示", "正在压缩，请稍候").exec()
+            return
+        self.compact_btn.setEnabled(False)
+        self.compact_task = CompactTask(self.log_view, manual, self.compact_signals)
+        QThreadPool.globalInstance().start(self.compact_task.run)
+
+    def on_compact_finished(self, count, manual):
+        self.compact_task = None
+        self.compact_btn.setEnabled(True)
+        if manual:
+            message = f"已压缩 {count} 个月的日志" if count else "没有需要压缩的旧数据"
+            CustomMessageBox(self, "成功", message).exec()
+
+    def on_compact_failed(self, error_msg, manual):
+        self.compact_task = None
+        self.compact_btn.setEnabled(True)
+        if manual:
+            CustomMessageBox(self, "错误", f"压缩旧数据失败: {error_msg}").exec()
+        else:
+            print(f"Error compacting logs: {error_msg}")
+
+    def export_raw_log(self):
+        if self.export_worker is not None:
+            CustomMessageBox(self, "提示", "正在导出，请稍候").exec()
+            return
+
+        start = self.stats_start_date.date().toString("yyyy-MM-dd")
+        end = self.stats_end_date.date().toString("yyyy-MM-dd")
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "导出原始日志",
+            os.path.expanduser(f"~/Documents/WorkLog/工作日志_{start}_{end}.xlsx"),
+            "Excel文件 (*.xlsx);;CSV文件 (*.csv);;TSV文件 (*.tsv)"
+        )
+        if not file_path:
+            return
+
+        self.export_progress = QProgressDialog("正在导出原始日志...", "取消", 0, 100, self)
+        self.export_progress.setWindowTitle("导出原始日志")
+        self.export_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.export_progress.setMinimumDuration(0)
+
+        self.export_worker = ExportWorker(self.log_view, file_path, start, end)
+        self.export_worker.progress.connect(self.on_export_progress)
+        self.export_worker.export_finished.connect(self.on_export_finished)
+        self.export_worker.export_failed.connect(self.on_export_failed)
+        self.export_worker.finished.connect(self.on_export_done)
+        self.export_progress.canceled.connect(self.export_worker.cancel)
+        self.export_worker.start()
+
+    def on_export_progress(self, done, total):
+        self.export_progress.setMaximum(total)
+        self.export_progress.setValue(done)
+
+    def on_export_finished(self, file_path):
+        self.export_progress.reset()
+        CustomMessageBox(self, "成功", f"原始日志已导出至 {file_path}").exec()
+
+    def on_export_failed(self, error_msg):
+        self.export_progress.reset()
+        CustomMessageBox(self, "错误", error_msg).exec()
+
+    def on_export_done(self):
+        self.export_progress.reset()
+        self.export_worker = None
+
     def generate_stats(self):
+        start = self.stats_start_date.date().toString("yyyy-MM-dd")
+        end = self.stats_end_date.date().toString("yyyy-MM-dd")
+
+        dimension = self.stats_group_combo.currentData()
+        user = self.stats_user_combo.currentData()
+
+        self.cancel_stats()
+        self.stats_request_id += 1
+        if dimension in ("category", "user"):
+            self.stats_task = StatsTask(self.shards, user, dimension, start, end, self.stats_request_id,
+                                        self.stats_signals)
+            self.stats_progress.setMaximum(100)
+        else:
+            self.stats_task = PivotTask(self.shards, user, dimension, start, end,
+                                        self.stats_request_id, self.stats_signals)
+            # 分组统计没有分段进度，显示忙碌状态
+            self.stats_progress.setMaximum(0)
+        self.stats_progress.setValue(0)
+        self.stats_progress.setVisible(True)
+        QThreadPool.globalInstance().start(self.stats_task.run)
+
+    def cancel_stats(self):
+        if self.stats_task is not None:
+            self.stats_task.cancel()
+            self.stats_task = None
+        self.stats_progress.setVisible(False)
+
+    def on_stats_progress(self, request_id, done, total):
+        if request_id == self.stats_request_id:
+            self.stats_progress.setMaximum(total)
+            self.stats_progress.setValue(done)
+
+    def on_stats_failed(self, request_id, error_msg):
+        if request_id != self.stats_request_id:
+            return
+        self.stats_task = None
+        self.stats_progress.setVisible(False)
+        CustomMessageBox(self, "错误", f"读取日志文件失败: {error_msg}").exec()
+
+    def on_stats_result(self, request_id, category_counts, generations):
+        if request_id != self.stats_request_id:
+            return
+        task = self.stats_task
+        self.stats_task = None
+        self.stats_progress.setVisible(False)
+        self.show_stats(task, category_counts, generations)
+
+    def on_stats_pivot(self, request_id, indexes, counts, generations):
+        if request_id != self.stats_request_id:
+            return
+        task = self.stats_task
+        self.stats_task = None
+        for shard, index in indexes.items():
+            shard.index = index
+        self.stats_progress.setVisible(False)
+        self.show_stats(task, counts, generations)
+
+    def show_stats(self, task, counts, generations):
+        # 记下统计条件、结果和各分片结果对应的代数，之后新增或撤销的记录直接在结果上增减
+        self.stats_view = None
+        if not counts:
+            CustomMessageBox(self, "提示", "所选时间段内没有日志记录").exec()
+            return
+        self.stats_view = (task.dimension, task.start_day, task.end_day, counts, task.user, generations)
+        with self.profiler.profile("show_stats"):
+            self.render_stats()
+
+    def apply_stats_delta(self, rows, sign, generation):
+        if self.stats_view is None:
+            return
+        dimension, start, end, counts, user, generations = self.stats_view
+        # 写线程先改动存储再发出事件，统计任务可能已经读到了这次改动
+        row_user = rows[0][3] if rows and len(rows[0]) > 3 else ""
+        if generation <= generations.get(row_user, -1):
+            return
+        generations[row_user] = generation
+        if user is not None:
+            rows = [row for row in rows if (row[3] if len(row) > 3 else "") == user]
+        delta = stats_delta(rows, dimension, start, end)
+        if delta:
+            for key, n in delta.items():
+                counts[key] = counts.get(key, 0) + sign * n
+            self.render_stats()
+
+    def refresh_today(self):
         try:
-            start = self.stats_start_date.date().toString("yyyy-MM-dd")
-            end = self.stats_end_date.date().toString("yyyy-MM-dd")
+            rows = self.opened_log_view.tail(since=datetime.now().strftime("%Y-%m-%d"))
+        except Exception as e:
+            print(f"Error reading recent logs: {e}")
+            return
+        self.today_table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            self.today_table.setItem(i, 0, QTableWidgetItem(row[0][11:]))
+            self.today_table.setItem(i, 1, QTableWidgetItem(row[1]))
+            self.today_table.setItem(i, 2, QTableWidgetItem(row[2].replace("\n", " ")))
+        more = f"，只显示最近的 {TAIL_LIMIT} 条" if len(rows) >= TAIL_LIMIT else ""
+        self.today_group.setTitle(f"今天的记录 ({len(rows)} 条{more})")
 
-            category_counts = {}
-            try:
-                with file_lock:
-                    with open(self.log_file, 'r', encoding='utf-8-sig') as f:
-                        reader = csv.DictReader(f)
-                        for row in reader:
-                            try:
-                                row_date = datetime.strptime(row['时间'], '%Y-%m-%d %H:%M:%S').date()
-                                start_date = datetime.strptime(start, '%Y-%m-%d').date()
-                                end_date = datetime.strptime(end, '%Y-%m-%d').date()
-                                
-                                if start_date <= row_date <= end_date:
-                                    category = row['工作类别']
-                                    category_counts[category] = category_counts.get(category, 0) + 1
-                            except ValueError:
-                                continue
-            except Exception as e:
-                CustomMessageBox(self, "错误", f"读取日志文件失败: {str(e)}").exec()
-                return
+    def on_shards_opened(self):
+        self.refresh_today()
+        self.refresh_stats_users()
 
-            if len(category_counts) == 0:
-                CustomMessageBox(self, "提示", "所选时间段内没有日志记录").exec()
-                return
+    def on_log_appended(self, rows, generation):
+        self.apply_stats_delta(rows, 1, generation)
+        self.refresh_today()
+        if self.tab_widget.currentWidget() is self.browse_tab:
+            self.refresh_browse()
 
-            for category in self.categories:
-                if category not in category_counts:
-                    category_counts[category] = 0
+    def on_log_undone(self, rows, generation):
+        self.apply_stats_delta(rows, -1, generation)
+        self.refresh_today()
+        if self.tab_widget.currentWidget() is self.browse_tab:
+            self.refresh_browse()
 
-            self.stats_table.setRowCount(len(category_counts))
-            for i, (category, count) in enumerate(category_counts.items()):
-                archive_text = f"{category}{count}次"
+    def render_stats(self):
+        dimension, _, _, counts, _, _ = self.stats_view
+        try:
+            self.stats_table.clear()
+            if dimension == "category":
+                for category in self.categories:
+                    if category not in counts:
+                        counts[category] = 0
+
+                self.stats_table.setColumnCount(3)
+                self.stats_table.setHorizontalHeaderLabels(["工作类别", "次数", "归档统计"])
+                self.stats_table.setRowCount(len(counts))
+                for i, (category, count) in enumerate(counts.items()):
+                    archive_text = f"{category}{count}次"
 
-                self.stats_table.setItem(i, 0, QTableWidgetItem(category))
-                self.stats_table.setItem(i, 1, QTableWidgetItem(str(count)))
-                self.stats_table.setItem(i, 2, QTableWidgetItem(archive_text))
+                    self.stats_table.setItem(i, 0, QTableWidgetItem(category))
+                    self.stats_table.setItem(i, 1, QTableWidgetItem(str(count)))
+                    self.stats_table.setItem(i, 2, QTableWidgetItem(archive_text))
+            elif dimension == "heatmap":
+                # 行是星期，列是小时，颜色越深次数越多
+                cells = Counter()
+                for (key, _), n in counts.items():
+                    cells[key] += n
+                peak = max(cells.values())
+                self.stats_table.setRowCount(7)
+                self.stats_table.setColumnCount(25)
+                self.stats_table.setHorizontalHeaderLabels(["星期"] + [str(h) for h in range(24)])
+                for row, name in enumerate(WEEKDAY_NAMES):
+                    self.stats_table.setItem(row, 0, QTableWidgetItem(name))
+                for key in range(168):
+                    n = cells.get(key, 0)
+                    item = QTableWidgetItem(str(n) if n else "")
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignCenter)
+                    if n > 0:
+                        item.setBackground(QColor(46, 125, 50, 40 + int(215 * n / peak)))
+                    self.stats_table.setItem(key // 24, key % 24 + 1, item)
+            else:
+                # 行是分组，列是各类别和合计
+                totals = Counter()
+                for (_, category), n in counts.items():
+                    totals[category] += n
+                categories = [c for c in self.categories if totals[c]]
+                categories += sorted(c for c in totals if c not in categories)
+                keys = sorted({key for key, _ in counts})
+                if dimension == "hour":
+                    labels = [f"{key:02d}:00" for key in keys]
+                elif dimension == "weekday":
+                    labels = [WEEKDAY_NAMES[key] for key in keys]
+                else:
+                    labels = keys
+                self.stats_table.setRowCount(len(keys))
+                self.stats_table.setColumnCount(len(categories) + 2)
+                self.stats_table.setHorizontalHeaderLabels([GROUP_DIMENSIONS[dimension]] + categories + ["合计"])
+                for i, (key, label) in enumerate(zip(keys, labels)):
+                    self.stats_table.setItem(i, 0, QTableWidgetItem(label))
+                    total = 0
+                    for j, category in enumerate(categories, 1):
+                        n = counts.get((key, category), 0)
+                        total += n
+                        self.stats_table.setItem(i, j, QTableWidgetItem(str(n)))
+                    self.stats_table.setItem(i, len(categories) + 1, QTableWidgetItem(str(total)))
 
             self.stats_table.resizeColumnsToContents()
 
@@ -705,9 +5241,23 @@ class WorkLogRecorder(QMainWindow):
             CustomMessageBox(self, "错误", f"生成统计失败: {str(e)}").exec()
 
     def closeEvent(self, event):
+        if self.watchdog is not None:
+            self.watchdog.stop()
+            self.watchdog = None
         if self.server_thread and self.server_thread.isRunning():
             self.server_thread.stop()
             self.server_thread.wait()
+        if self.export_worker is not None:
+            self.export_worker.cancel()
+            self.export_worker.wait()
+        self.cancel_stats()
+        QThreadPool.globalInstance().waitForDone()
+        self.shards.close()
+        self.writer.close()
+        metrics.remove_gauge("worklog_log_size_bytes")
+        metrics.remove_gauge("worklog_log_rows")
+        self.storage.close()
+        shutdown_scan_pool()
         super().closeEvent(event)
 
     def toggle_auto_start(self, state):
@@ -743,8 +5293,41 @@ class CustomMessageBox(QDialog):
         else:
             super().keyPressEvent(event)
 
+def compact_command():
+    # 命令行压缩：python worklogqt.py --compact，使用与界面相同的存储设置
+    settings = app_settings()
+    if settings.value("storage_backend", "csv") != "partitioned":
+        print("只有按月分区存储支持压缩旧数据", file=sys.stderr)
+        return 1
+    # 与界面的压缩一样，经过分片表把每个人的分片都压缩一遍
+    log_dir = os.path.expanduser('~/Documents/WorkLog')
+    storage = open_storage(log_dir, "partitioned")
+    writer = LogWriter(storage)
+    shards = LogShards(log_dir, "partitioned", LogShard("", storage, writer))
+    try:
+        storage.ensure_created()
+        print(f"已压缩 {MergedLogView(shards).compact()} 个月的日志")
+    finally:
+        shards.close()
+        writer.close()
+        storage.close()
+    return 0
+
 if __name__ == "__main__":
+    # 打包后的程序里，并行扫描的子进程也从这里启动
+    import multiprocessing
+    multiprocessing.freeze_support()
+    if "--compact" in sys.argv:
+        sys.exit(compact_command())
+    if "--startup-profile" in sys.argv:
+        sys.argv.remove("--startup-profile")
+        startup_marks = []
+        startup_mark("导入模块")
     app = QApplication(sys.argv)
+    startup_mark("创建应用")
     window = WorkLogRecorder()
     window.show()
+    startup_mark("显示窗口")
+    if startup_marks is not None:
+        QTimer.singleShot(0, report_startup_profile)
     sys.exit(app.exec())
\ No newline at end of file
@@ -10,7 +10,15 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=['pandas', 'numpy'],
+    # 只用到 QtCore/QtGui/QtWidgets；flask、qrcode、openpyxl 在函数内导入，仍会被打包。
+    # pydoc 不能排除：werkzeug.debug.repr 会导入它
+    excludes=['pandas', 'numpy', 'tkinter', 'unittest', 'doctest', 'lib2to3', 'xmlrpc',
+              'PIL.ImageQt', 'PIL.ImageTk',
+              'PySide6.QtNetwork', 'PySide6.QtQml', 'PySide6.QtQuick', 'PySide6.QtQuickWidgets',
+              'PySide6.QtOpenGL', 'PySide6.QtOpenGLWidgets', 'PySide6.QtPdf', 'PySide6.QtSvg',
+              'PySide6.QtSql', 'PySide6.QtTest', 'PySide6.QtMultimedia', 'PySide6.QtWebEngineCore',
+              'PySide6.QtWebEngineWidgets', 'PySide6.QtCharts', 'PySide6.QtDataVisualization',
+              'PySide6.Qt3DCore'],
     noarchive=False,
     optimize=0,
 )